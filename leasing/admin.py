@@ -1,12 +1,13 @@
 from django.contrib.gis import admin
+from django.db.models import Count, Q, Sum
 
 from leasing.models import (
-    BasisOfRent, BasisOfRentDecision, BasisOfRentPlotType, BasisOfRentPropertyIdentifier, BasisOfRentRate, Comment,
-    Condition, ConditionType, Contact, Contract, ContractChange, ContractRent, ContractType, Decision, DecisionMaker,
-    DecisionType, District, Financing, FixedInitialYearRent, Hitas, IntendedUse, Lease, LeaseArea, LeaseBasisOfRent,
-    LeaseIdentifier, LeaseStateLog, LeaseType, Management, MortgageDocument, Municipality, NoticePeriod, PlanUnit,
-    PlanUnitState, PlanUnitType, Plot, Regulation, RelatedLease, Rent, RentAdjustment, RentDueDate, RentIntendedUse,
-    StatisticalUse, SupportiveHousing, Tenant, TenantContact)
+    BasisOfRent, BasisOfRentDecision, BasisOfRentPlotType, BasisOfRentPropertyIdentifier, BasisOfRentRate, BillingRun,
+    BillingRunChunk, Comment, Condition, ConditionType, Contact, Contract, ContractChange, ContractRent, ContractType,
+    Decision, DecisionMaker, DecisionType, District, Financing, FixedInitialYearRent, Hitas, Index, IntendedUse,
+    Invoice, Lease, LeaseArea, LeaseBasisOfRent, LeaseIdentifier, LeaseStateLog, LeaseType, Management,
+    MortgageDocument, Municipality, NoticePeriod, PlanUnit, PlanUnitState, PlanUnitType, Plot, Regulation, RelatedLease,
+    Rent, RentAdjustment, RentDueDate, RentIntendedUse, StatisticalUse, SupportiveHousing, Tenant, TenantContact)
 
 
 class ContactAdmin(admin.ModelAdmin):
@@ -108,6 +109,51 @@ class RentAdmin(admin.ModelAdmin):
     inlines = [RentDueDateInline, FixedInitialYearRentInline, ContractRentInline, RentAdjustmentInline]
 
 
+class IndexAdmin(admin.ModelAdmin):
+    list_display = ('type', 'year', 'month', 'number')
+    list_filter = ('type',)
+
+
+class InvoiceAdmin(admin.ModelAdmin):
+    list_display = ('lease', 'billing_contact', 'period_start_date', 'period_end_date', 'amount')
+    raw_id_fields = ('lease', 'billing_contact', 'tenants')
+
+
+class BillingRunChunkInline(admin.TabularInline):
+    model = BillingRunChunk
+    extra = 0
+    fields = ('first_lease_id', 'last_lease_id', 'lease_count', 'invoice_count', 'existing_invoice_count', 'duration',
+              'error')
+    readonly_fields = fields
+
+
+class BillingRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'date', 'state', 'created_at', 'finished_at', 'lease_count', 'invoice_count',
+                    'leases_per_second', 'invoices_per_second', 'error_count')
+    list_filter = ('state',)
+    inlines = [BillingRunChunkInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            lease_count=Sum('chunks__lease_count'), invoice_count=Sum('chunks__invoice_count'),
+            error_count=Count('chunks', filter=Q(chunks__error__isnull=False)))
+
+    def lease_count(self, obj):
+        return obj.lease_count or 0
+
+    def invoice_count(self, obj):
+        return obj.invoice_count or 0
+
+    def error_count(self, obj):
+        return obj.error_count
+
+    def leases_per_second(self, obj):
+        return '{:.1f}'.format(obj.lease_count / obj.duration) if obj.lease_count and obj.duration else '-'
+
+    def invoices_per_second(self, obj):
+        return '{:.1f}'.format(obj.invoice_count / obj.duration) if obj.invoice_count and obj.duration else '-'
+
+
 class BasisOfRentPropertyIdentifierInline(admin.TabularInline):
     model = BasisOfRentPropertyIdentifier
     extra = 0
@@ -133,7 +179,9 @@ admin.site.register(Comment, CommentAdmin)
 admin.site.register(District, DistrictAdmin)
 admin.site.register(Financing, NameAdmin)
 admin.site.register(Hitas, NameAdmin)
+admin.site.register(Index, IndexAdmin)
 admin.site.register(IntendedUse, NameAdmin)
+admin.site.register(Invoice, InvoiceAdmin)
 admin.site.register(Lease, LeaseAdmin)
 admin.site.register(LeaseArea)
 admin.site.register(LeaseIdentifier)
@@ -162,3 +210,4 @@ admin.site.register(DecisionMaker, NameAdmin)
 admin.site.register(ConditionType, NameAdmin)
 admin.site.register(BasisOfRent, BasisOfRentAdmin)
 admin.site.register(BasisOfRentPlotType, NameAdmin)
+admin.site.register(BillingRun, BillingRunAdmin)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class LeasingConfig(AppConfig):
     name = 'leasing'
+
+    def ready(self):
+        from leasing.signals import connect_signals
+
+        connect_signals()
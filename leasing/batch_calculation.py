@@ -0,0 +1,331 @@
+"""Batch rent calculation
+
+Calculates the same rents as leasing.calculation for a large number of
+leases at once. Instead of instantiating the models, the rows of each
+table are loaded with one values_list query per chunk of leases into
+columns, the dates are converted to day ordinals and the amounts to
+integer cents. The overlaps and prorations are then calculated for the
+whole columns in single passes with integer arithmetic.
+
+The yearly amounts are prorated as cents * days * (365 * 366 / days in
+the cycle year), so all the amounts that have days in a year as their
+denominator are kept as integers over a common denominator. The amounts
+are therefore exact and rounded with the same function as in the scalar
+calculation, which makes the results identical to the cent."""
+from collections import OrderedDict
+from fractions import Fraction
+
+from leasing.calculation import RENT_CALCULATION_CHUNK_SIZE, get_cycle_year_ranges, round_to_cents, split_amount
+from leasing.enums import PeriodType, RentAdjustmentAmountType, RentAdjustmentType, RentCycle, RentType
+from leasing.models import ContractRent, FixedInitialYearRent, IndexAdjustedRent, Lease, Rent, RentAdjustment
+
+# The common denominator of a day of a year with 365 or 366 days
+YEAR_DENOMINATOR = 365 * 366
+
+# The percents have two decimals
+PERCENT_DENOMINATOR = 100 * 100
+
+MIN_ORDINAL = 0
+MAX_ORDINAL = 10 ** 7
+
+BATCH_CHUNK_SIZE = RENT_CALCULATION_CHUNK_SIZE * 10
+
+
+def to_cents(amount):
+    return int(amount * 100)
+
+
+def to_ordinal(date, default):
+    return date.toordinal() if date is not None else default
+
+
+def load_columns(queryset, field_names):
+    """Returns the values of the fields in the queryset as an OrderedDict of
+    lists in the order of the fields"""
+    rows = list(queryset.values_list(*field_names))
+
+    if not rows:
+        return OrderedDict((field_name, []) for field_name in field_names)
+
+    return OrderedDict((field_name, list(column)) for field_name, column in zip(field_names, zip(*rows)))
+
+
+def subtract_ordinal_ranges(start, end, ranges):
+    """Same as leasing.utils.subtract_ranges for day ordinals"""
+    parts = [(start, end)]
+
+    for (range_start, range_end) in ranges:
+        new_parts = []
+
+        for (part_start, part_end) in parts:
+            if range_start > range_end or range_start > part_end or range_end < part_start:
+                new_parts.append((part_start, part_end))
+                continue
+
+            if range_start > part_start:
+                new_parts.append((part_start, range_start - 1))
+
+            if range_end < part_end:
+                new_parts.append((range_end + 1, part_end))
+
+        parts = new_parts
+
+    return parts
+
+
+class BatchRentCalculator:
+    """Calculates the rents of leases for one date range"""
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.start = start_date.toordinal()
+        self.end = end_date.toordinal()
+
+        # The cycle years of the date range as (start, end, multiplier)
+        self.cycle_parts = {
+            cycle: [(part_start.toordinal(), part_end.toordinal(), YEAR_DENOMINATOR // days_in_year)
+                    for (part_start, part_end, days_in_year) in get_cycle_year_ranges(cycle, start_date, end_date)]
+            for cycle in RentCycle
+        }
+
+    def get_prorated_days(self, cycle, start, end):
+        """Returns the days between start and end weighted by the inverse of
+        the length of their cycle years, times YEAR_DENOMINATOR"""
+        weighted_days = 0
+
+        for (part_start, part_end, multiplier) in self.cycle_parts[cycle]:
+            overlap_start = start if start > part_start else part_start
+            overlap_end = end if end < part_end else part_end
+
+            if overlap_end >= overlap_start:
+                weighted_days += (overlap_end - overlap_start + 1) * multiplier
+
+        return weighted_days
+
+    def calculate(self, lease_ids):
+        """Returns a dict of the rents of the leases by lease id"""
+        leases, rent_amounts = self.calculate_rents(lease_ids)
+        results = {lease_id: round_to_cents(0) for lease_id in leases}
+
+        for (lease_id, amount) in rent_amounts.values():
+            results[lease_id] += amount
+
+        return results
+
+    def calculate_rents(self, lease_ids):
+        """Returns the ids of the leases and a dict of (lease id, amount) of
+        their active rents by rent id"""
+        leases, rents, lease_starts, amounts, extra_amounts = self.get_exact_amounts(lease_ids)
+        rent_amounts = {}
+
+        for index, (rent_id, lease_id) in enumerate(zip(rents['id'], rents['lease_id'])):
+            if rents['type'][index] == RentType.ONE_TIME:
+                amount = self.get_one_time_amount(rents['amount'][index], lease_starts[lease_id])
+            else:
+                amount = Fraction(sum(amounts.get(index, {}).values()), YEAR_DENOMINATOR * PERCENT_DENOMINATOR) + sum(
+                    extra_amounts.get(index, {}).values())
+                amount = round_to_cents(max(amount, 0) / 100)
+
+            rent_amounts[rent_id] = (lease_id, amount)
+
+        return leases['id'], rent_amounts
+
+    def calculate_intended_use_rents(self, lease_ids):
+        """Returns a dict of (lease id, type, amounts) of the active rents of
+        the leases by rent id
+
+        The amounts are a dict by intended use id that sums up to the amount
+        of calculate_rents. The amounts that have no intended use, like the
+        fixed initial year rents and the one time rents, are under None."""
+        leases, rents, lease_starts, amounts, extra_amounts = self.get_exact_amounts(lease_ids)
+        rent_amounts = {}
+
+        for index, (rent_id, lease_id, rent_type) in enumerate(zip(rents['id'], rents['lease_id'], rents['type'])):
+            if rent_type == RentType.ONE_TIME:
+                use_amounts = {None: self.get_one_time_amount(rents['amount'][index], lease_starts[lease_id])}
+            else:
+                use_amounts = self.split_intended_use_amounts(amounts.get(index, {}), extra_amounts.get(index, {}))
+
+            rent_amounts[rent_id] = (lease_id, rent_type, use_amounts)
+
+        return rent_amounts
+
+    def split_intended_use_amounts(self, amounts, extra_amounts):
+        """Returns the rounded rent split between the intended uses by their
+        exact amounts"""
+        exact_amounts = {
+            intended_use_id: Fraction(amounts.get(intended_use_id, 0), YEAR_DENOMINATOR * PERCENT_DENOMINATOR) +
+            extra_amounts.get(intended_use_id, 0)
+            for intended_use_id in set(amounts) | set(extra_amounts)
+        }
+        total = sum(exact_amounts.values())
+
+        if total <= 0:
+            return {}
+
+        return split_amount(round_to_cents(total / 100), {
+            intended_use_id: amount / total for intended_use_id, amount in exact_amounts.items()})
+
+    def get_exact_amounts(self, lease_ids):
+        """Returns the columns of the leases and of their active rents, the
+        lease start dates by lease id and the exact amounts of the rents
+
+        The amounts are dicts of the integer amounts over the common
+        denominator and of the other amounts as Fractions of cents by
+        intended use id, both by the index of the rent."""
+        leases = load_columns(Lease.all_objects.filter(id__in=lease_ids), ('id', 'start_date', 'end_date'))
+        rents = load_columns(Rent.objects.filter(lease_id__in=lease_ids, is_active=True),
+                             ('id', 'lease_id', 'type', 'cycle', 'amount'))
+
+        lease_starts = dict(zip(leases['id'], leases['start_date']))
+        lease_ends = dict(zip(leases['id'], leases['end_date']))
+
+        # The date range of each rent limited to the lease dates
+        rent_starts = [max(self.start, to_ordinal(lease_starts[lease_id], MIN_ORDINAL))
+                       for lease_id in rents['lease_id']]
+        rent_ends = [min(self.end, to_ordinal(lease_ends[lease_id], MAX_ORDINAL)) for lease_id in rents['lease_id']]
+        rent_cycles = [cycle or RentCycle.JANUARY_TO_DECEMBER for cycle in rents['cycle']]
+        rent_indexes = {rent_id: index for index, rent_id in enumerate(rents['id'])
+                        if rents['type'][index] not in (RentType.FREE, RentType.ONE_TIME) and
+                        rent_starts[index] <= rent_ends[index]}
+
+        segments = self.get_segments(rent_indexes, rents, rent_starts, rent_ends)
+        amounts = {}
+
+        for index, rent_segments in segments.items():
+            rent_amounts = amounts[index] = {}
+
+            for (start, end, yearly_cents, intended_use_id) in rent_segments:
+                rent_amounts[intended_use_id] = rent_amounts.get(intended_use_id, 0) + (
+                    yearly_cents * self.get_prorated_days(rent_cycles[index], start, end) * PERCENT_DENOMINATOR)
+
+        extra_amounts = self.add_adjustments(amounts, rent_indexes, segments, rent_starts, rent_ends, rent_cycles)
+
+        return leases, rents, lease_starts, amounts, extra_amounts
+
+    def get_one_time_amount(self, amount, lease_start_date):
+        if amount and lease_start_date and self.start_date <= lease_start_date <= self.end_date:
+            return round_to_cents(amount)
+
+        return round_to_cents(0)
+
+    def get_segments(self, rent_indexes, rents, rent_starts, rent_ends):
+        """Returns the parts of the date ranges of the rents that are charged
+        with each yearly amount
+
+        The result is a dict of lists of (start, end, yearly cents, intended
+        use id) by the index of the rent. The intended use id of the fixed
+        initial year rents is None."""
+        rent_ids = list(rent_indexes)
+        fixed_rents = load_columns(FixedInitialYearRent.objects.filter(rent_id__in=rent_ids),
+                                   ('rent_id', 'amount', 'start_date', 'end_date'))
+        index_adjusted_rents = load_columns(
+            IndexAdjustedRent.objects.filter(rent_id__in=rent_ids,
+                                             rent__type__in=(RentType.INDEX, RentType.MANUAL)),
+            ('rent_id', 'amount', 'intended_use_id', 'start_date', 'end_date'))
+        contract_rents = load_columns(ContractRent.objects.filter(rent_id__in=rent_ids),
+                                      ('rent_id', 'amount', 'period', 'intended_use_id', 'start_date', 'end_date'))
+
+        segments = {index: [] for index in rent_indexes.values()}
+        fixed_ranges = {}
+        index_adjusted_ranges = {}
+
+        def add_segments(index, yearly_cents, intended_use_id, start_date, end_date, excluded_ranges):
+            start = max(rent_starts[index], to_ordinal(start_date, MIN_ORDINAL))
+            end = min(rent_ends[index], to_ordinal(end_date, MAX_ORDINAL))
+
+            if start <= end:
+                segments[index].extend((part_start, part_end, yearly_cents, intended_use_id)
+                                       for (part_start, part_end)
+                                       in subtract_ordinal_ranges(start, end, excluded_ranges))
+
+        for (rent_id, start_date, end_date) in zip(fixed_rents['rent_id'], fixed_rents['start_date'],
+                                                   fixed_rents['end_date']):
+            fixed_ranges.setdefault(rent_indexes[rent_id], []).append(
+                (to_ordinal(start_date, MIN_ORDINAL), to_ordinal(end_date, MAX_ORDINAL)))
+
+        for (rent_id, amount, start_date, end_date) in zip(fixed_rents['rent_id'], fixed_rents['amount'],
+                                                           fixed_rents['start_date'], fixed_rents['end_date']):
+            add_segments(rent_indexes[rent_id], to_cents(amount), None, start_date, end_date, [])
+
+        for (rent_id, amount, intended_use_id, start_date, end_date) in zip(
+                index_adjusted_rents['rent_id'], index_adjusted_rents['amount'],
+                index_adjusted_rents['intended_use_id'], index_adjusted_rents['start_date'],
+                index_adjusted_rents['end_date']):
+            index = rent_indexes[rent_id]
+            index_adjusted_ranges.setdefault((index, intended_use_id), []).append(
+                (to_ordinal(start_date, MIN_ORDINAL), to_ordinal(end_date, MAX_ORDINAL)))
+            add_segments(index, to_cents(amount), intended_use_id, start_date, end_date,
+                         fixed_ranges.get(index, []))
+
+        for (rent_id, amount, period, intended_use_id, start_date, end_date) in zip(
+                contract_rents['rent_id'], contract_rents['amount'], contract_rents['period'],
+                contract_rents['intended_use_id'], contract_rents['start_date'], contract_rents['end_date']):
+            index = rent_indexes[rent_id]
+            yearly_cents = to_cents(amount) * (12 if period == PeriodType.PER_MONTH else 1)
+            excluded_ranges = fixed_ranges.get(index, []) + index_adjusted_ranges.get((index, intended_use_id), [])
+            add_segments(index, yearly_cents, intended_use_id, start_date, end_date, excluded_ranges)
+
+        return segments
+
+    def add_adjustments(self, amounts, rent_indexes, segments, rent_starts, rent_ends, rent_cycles):
+        """Adds the rent adjustments to the amounts
+
+        The amounts that can't be expressed over the common denominator,
+        i.e. the total amounts that are divided to the days of the
+        adjustment, are returned as dicts of Fractions of cents by intended
+        use id by the index of the rent."""
+        field_names = ('rent_id', 'type', 'intended_use_id', 'start_date', 'end_date', 'full_amount', 'amount_type')
+        adjustments = load_columns(RentAdjustment.objects.filter(rent_id__in=list(rent_indexes)), field_names)
+        extra_amounts = {}
+
+        for (rent_id, adjustment_type, intended_use_id, start_date, end_date, full_amount, amount_type) in zip(
+                *(adjustments[field_name] for field_name in field_names)):
+            index = rent_indexes[rent_id]
+            start = max(rent_starts[index], to_ordinal(start_date, MIN_ORDINAL))
+            end = min(rent_ends[index], to_ordinal(end_date, MAX_ORDINAL))
+
+            if start > end or not full_amount:
+                continue
+
+            sign = -1 if adjustment_type == RentAdjustmentType.DISCOUNT else 1
+            full_cents = to_cents(full_amount)
+            cycle = rent_cycles[index]
+            rent_amounts = amounts[index]
+            rent_extra_amounts = extra_amounts.setdefault(index, {})
+
+            if amount_type in (RentAdjustmentAmountType.PERCENT_PER_YEAR, RentAdjustmentAmountType.PERCENT_TOTAL):
+                base_amount = sum(
+                    yearly_cents * self.get_prorated_days(cycle, max(start, segment_start), min(end, segment_end))
+                    for (segment_start, segment_end, yearly_cents, segment_intended_use_id) in segments[index]
+                    if segment_intended_use_id == intended_use_id)
+                # The full amount in cents is the percent in hundredths
+                rent_amounts[intended_use_id] = rent_amounts.get(intended_use_id, 0) + (
+                    sign * base_amount * full_cents)
+            elif amount_type == RentAdjustmentAmountType.AMOUNT_PER_YEAR:
+                rent_amounts[intended_use_id] = rent_amounts.get(intended_use_id, 0) + (
+                    sign * full_cents * self.get_prorated_days(cycle, start, end) * PERCENT_DENOMINATOR)
+            elif start_date and end_date:
+                rent_extra_amounts[intended_use_id] = rent_extra_amounts.get(intended_use_id, 0) + sign * Fraction(
+                    full_cents * (end - start + 1), end_date.toordinal() - start_date.toordinal() + 1)
+            elif start_date and rent_starts[index] <= start_date.toordinal() <= rent_ends[index]:
+                rent_extra_amounts[intended_use_id] = rent_extra_amounts.get(intended_use_id, 0) + sign * full_cents
+
+        return extra_amounts
+
+
+def calculate_rent_amounts_batch(leases, start_date, end_date, chunk_size=BATCH_CHUNK_SIZE):
+    """Returns a dict of the rents of the leases in the queryset for the
+    date range by lease id
+
+    The result is the same as with leasing.calculation.calculate_rent_amounts.
+    The data is loaded in chunks of chunk_size leases with one query per
+    table."""
+    calculator = BatchRentCalculator(start_date, end_date)
+    lease_ids = list(leases.values_list('id', flat=True))
+    amounts = {}
+
+    for chunk_start in range(0, len(lease_ids), chunk_size):
+        amounts.update(calculator.calculate(lease_ids[chunk_start:chunk_start + chunk_size]))
+
+    return amounts
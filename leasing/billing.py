@@ -0,0 +1,232 @@
+"""Billing runs
+
+Creates the invoices of the next billing period of the leases that have
+billing enabled. The rent of the period is divided between the billing
+contacts of the tenants by the shares of the tenants, so that the
+invoices of a lease sum up to the rent to the cent. A tenant is billed
+through its billing contact, or through its tenant contact when it has no
+billing contact on the first day of the period (see leasing.tenant_shares).
+
+The leases are processed in ranges of lease ids. The data of a range is
+read with a fixed number of queries and its invoices are created with bulk
+inserts in one transaction. The ranges can be processed in parallel worker
+processes. The unique constraint of the invoices makes the runs
+idempotent: the invoices that already exist are skipped, and a range that
+collides with a concurrent run is processed again.
+
+Every run is journaled in a BillingRun with a checkpoint for each range,
+so a run that is interrupted or has failed ranges can be resumed.
+
+The invoices get their reference numbers from their ids, and their audit
+log entries are written in the same transaction as them."""
+import itertools
+import time
+import traceback
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
+
+from leasing.batch_calculation import BatchRentCalculator
+from leasing.bulk import bulk_update, get_log_entries, save_log_entries
+from leasing.calculation import get_next_billing_period_for_date, split_amount
+from leasing.enums import BillingRunState
+from leasing.models import BillingRun, BillingRunChunk, Invoice, Lease
+from leasing.tenant_shares import get_contact_shares
+from leasing.utils import get_id_ranges, map_in_processes
+
+BILLING_CHUNK_SIZE = 500
+
+BILLING_PREFETCH_LOOKUPS = ('rents', 'rents__due_dates')
+
+INVOICE_LOG_LEASE_SELECT_RELATED = (
+    'type', 'municipality', 'district', 'identifier__type', 'identifier__municipality', 'identifier__district')
+
+
+def get_billing_periods(date, first_lease_id, last_lease_id):
+    """Returns the number of the leases with billing enabled in the id range
+    and their next billing periods after the date as a dict of (start date,
+    end date) by lease id"""
+    leases = list(Lease.objects.filter(is_billing_enabled=True, id__gte=first_lease_id,
+                                       id__lte=last_lease_id).only('id').prefetch_related(*BILLING_PREFETCH_LOOKUPS))
+    periods = {}
+
+    for lease in leases:
+        period = get_next_billing_period_for_date(lease, date)
+        if period is not None:
+            periods[lease.id] = period
+
+    return len(leases), periods
+
+
+def get_period_amounts(periods):
+    """Returns the rents of the leases for their periods as a dict by lease id"""
+    lease_ids_by_period = defaultdict(list)
+    for lease_id, period in periods.items():
+        lease_ids_by_period[period].append(lease_id)
+
+    amounts = {}
+    for period, lease_ids in lease_ids_by_period.items():
+        amounts.update(BatchRentCalculator(*period).calculate(lease_ids))
+
+    return amounts
+
+
+def get_new_invoices(date, first_lease_id, last_lease_id):
+    """Returns the unsaved invoices of the leases in the id range that don't
+    exist yet, the ids of their tenants in a list of the same order and the
+    numbers of the processed leases and the existing invoices"""
+    lease_count, periods = get_billing_periods(date, first_lease_id, last_lease_id)
+    amounts = get_period_amounts(periods)
+    contact_shares = get_contact_shares({lease_id: period[0] for lease_id, period in periods.items()})
+
+    existing_invoices = set(Invoice.objects.filter(
+        lease_id__in=list(periods), period_start_date__in={period[0] for period in periods.values()}).values_list(
+        'lease_id', 'billing_contact_id', 'period_start_date', 'period_end_date'))
+    invoices = []
+    invoice_tenant_ids = []
+    existing_count = 0
+
+    for lease_id, shares in sorted(contact_shares.items()):
+        period_start_date, period_end_date = periods[lease_id]
+        # The amounts of the contacts sum up to the rent to the cent
+        contact_amounts = split_amount(amounts[lease_id], {
+            contact_id: share for contact_id, (share, tenant_ids) in shares.items()})
+
+        for contact_id, (share, tenant_ids) in sorted(shares.items()):
+            if (lease_id, contact_id, period_start_date, period_end_date) in existing_invoices:
+                existing_count += 1
+                continue
+
+            if contact_amounts[contact_id] <= 0:
+                continue
+
+            invoices.append(Invoice(lease_id=lease_id, billing_contact_id=contact_id,
+                                    period_start_date=period_start_date, period_end_date=period_end_date,
+                                    due_date=period_start_date, amount=contact_amounts[contact_id]))
+            invoice_tenant_ids.append(tenant_ids)
+
+    return invoices, invoice_tenant_ids, lease_count, existing_count
+
+
+def get_reference_number(invoice_id):
+    """Returns the Finnish reference number of the invoice id
+
+    The id, padded with zeros to the minimum of three digits, is followed by
+    the check digit calculated with the weights 7, 3 and 1 from the right."""
+    base = '{:03}'.format(invoice_id)
+    total = sum(int(digit) * weight for digit, weight in zip(reversed(base), itertools.cycle((7, 3, 1))))
+
+    return base + str(-total % 10)
+
+
+def insert_invoices(run, first_lease_id, last_lease_id, start_time):
+    invoices, invoice_tenant_ids, lease_count, existing_count = get_new_invoices(run.date, first_lease_id,
+                                                                                 last_lease_id)
+
+    with transaction.atomic():
+        Invoice.objects.bulk_create(invoices)
+        for invoice in invoices:
+            invoice.reference_number = get_reference_number(invoice.id)
+        bulk_update(Invoice, invoices, ('reference_number',))
+        # The audit log shows the lease and the billing contact by name
+        prefetch_related_objects(invoices, Prefetch('lease', queryset=Lease.all_objects.select_related(
+            *INVOICE_LOG_LEASE_SELECT_RELATED)), 'billing_contact')
+        save_log_entries(get_log_entries((None, invoice) for invoice in invoices))
+        Invoice.tenants.through.objects.bulk_create([
+            Invoice.tenants.through(invoice_id=invoice.id, tenant_id=tenant_id)
+            for invoice, tenant_ids in zip(invoices, invoice_tenant_ids)
+            for tenant_id in tenant_ids
+        ])
+        # The checkpoint is committed together with the invoices
+        BillingRunChunk.objects.create(run=run, first_lease_id=first_lease_id, last_lease_id=last_lease_id,
+                                       lease_count=lease_count, invoice_count=len(invoices),
+                                       existing_invoice_count=existing_count, duration=time.monotonic() - start_time)
+
+    return Counter({'leases': lease_count, 'invoices': len(invoices), 'existing_invoices': existing_count})
+
+
+def create_invoices_for_lease_range(run, first_lease_id, last_lease_id):
+    """Creates the invoices of the billing run for the leases in the id range
+    and checkpoints the range in a BillingRunChunk
+
+    Returns the numbers of the processed leases, the created and the already
+    existing invoices and the errors as a Counter. An error is recorded in
+    the chunk instead of raising it, so that the other ranges are processed."""
+    start_time = time.monotonic()
+
+    try:
+        try:
+            return insert_invoices(run, first_lease_id, last_lease_id, start_time)
+        except IntegrityError:
+            # A concurrent run has created some of the same invoices after
+            # they were checked. They are found on the second try.
+            return insert_invoices(run, first_lease_id, last_lease_id, start_time)
+    except Exception:
+        BillingRunChunk.objects.create(run=run, first_lease_id=first_lease_id, last_lease_id=last_lease_id,
+                                       duration=time.monotonic() - start_time, error=traceback.format_exc())
+
+        return Counter({'errors': 1})
+
+
+def get_remaining_lease_ids(run):
+    """Returns the sorted ids of the leases with billing enabled that are not
+    in a completed chunk of the billing run"""
+    completed_ranges = iter(run.chunks.filter(error__isnull=True).order_by('first_lease_id').values_list(
+        'first_lease_id', 'last_lease_id'))
+    completed_range = next(completed_ranges, None)
+    lease_ids = []
+
+    for lease_id in Lease.objects.filter(is_billing_enabled=True).order_by('id').values_list('id', flat=True):
+        while completed_range is not None and completed_range[1] < lease_id:
+            completed_range = next(completed_ranges, None)
+
+        if completed_range is None or lease_id < completed_range[0]:
+            lease_ids.append(lease_id)
+
+    return lease_ids
+
+
+def run_billing(run, workers=1, progress=None):
+    """Processes the leases that the billing run hasn't completed yet
+
+    Starts a new run or resumes an interrupted or a failed one. The leases
+    are processed in ranges of the chunk size of the run. With more than one
+    worker the ranges are divided between that many forked processes. The
+    optional progress function is called after every range with the totals
+    so far, the number of the leases to process and the elapsed seconds.
+    Returns the totals of this session as a Counter."""
+    lease_ids = get_remaining_lease_ids(run)
+    # The leases of the failed chunks are among the remaining ones
+    failed_chunk_ids = list(run.chunks.filter(error__isnull=False, is_retried=False).values_list('id', flat=True))
+    arguments = [(run,) + id_range for id_range in get_id_ranges(lease_ids, run.chunk_size)]
+    totals = Counter()
+    start_time = time.monotonic()
+
+    try:
+        for result in map_in_processes(create_invoices_for_lease_range, arguments, workers):
+            totals.update(result)
+            if progress:
+                progress(totals, len(lease_ids), time.monotonic() - start_time)
+    finally:
+        run.duration += time.monotonic() - start_time
+        run.save(update_fields=('duration', 'modified_at'))
+
+    BillingRunChunk.objects.filter(id__in=failed_chunk_ids).update(is_retried=True)
+    run.state = BillingRunState.FAILED if totals['errors'] else BillingRunState.FINISHED
+    run.finished_at = timezone.now()
+    run.save(update_fields=('state', 'finished_at', 'modified_at'))
+
+    return totals
+
+
+def create_invoices(date, chunk_size=BILLING_CHUNK_SIZE, workers=1, progress=None):
+    """Starts a billing run that creates the invoices of the next billing
+    period after the date for all the leases that have billing enabled
+
+    Returns the BillingRun."""
+    run = BillingRun.objects.create(date=date, chunk_size=chunk_size)
+    run_billing(run, workers=workers, progress=progress)
+
+    return run
@@ -0,0 +1,134 @@
+"""Billing summaries of the leases
+
+The invoice texts show the identifier, the year rent, the real property
+unit identifiers, the addresses and the intended use of the lease. They
+are denormalized to one LeaseBillingSummary per lease, so that they are
+read from one row instead of traversing the lease areas and calculating
+the rents for every invoice.
+
+The change feed tells when a summary is stale: every save and delete of a
+lease or of its related items updates the LeaseChange of the lease, and it
+gets a greater version when its transaction commits. A summary stores the
+version of the change that it was calculated after. A summary of a lease
+that has changed since, or that has a change not committed yet, or that is
+of an earlier year, is refreshed again when it is read with
+get_billing_summaries or by the refresh_billing_summaries command."""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from leasing.batch_calculation import BatchRentCalculator
+from leasing.models import Lease, LeaseBillingSummary, LeaseChange
+
+BILLING_SUMMARY_CHUNK_SIZE = 500
+
+BILLING_SUMMARY_SELECT_RELATED = (
+    'type', 'municipality', 'district', 'identifier__type', 'identifier__municipality', 'identifier__district',
+    'intended_use')
+
+
+def get_summary_year():
+    return timezone.localtime(timezone.now()).year
+
+
+def calculate_billing_summaries(lease_ids, year):
+    """Returns the unsaved summaries of the leases for the year"""
+    lease_ids = list(lease_ids)
+    refreshed_at = timezone.now()
+    # The versions are read before the data, so a change committed during
+    # the calculation gets a greater version than the summary
+    lease_versions = dict(LeaseChange.objects.filter(lease_id__in=lease_ids).values_list('lease_id', 'version'))
+    leases = Lease.all_objects.filter(id__in=lease_ids).select_related(
+        *BILLING_SUMMARY_SELECT_RELATED).prefetch_related('lease_areas')
+    year_rents = BatchRentCalculator(datetime.date(year, 1, 1), datetime.date(year, 12, 31)).calculate(lease_ids)
+
+    return [LeaseBillingSummary(
+        lease=lease,
+        identifier=lease.get_identifier_string(),
+        year=year,
+        year_rent=year_rents[lease.id],
+        real_property_unit_identifiers=', '.join(lease_area.identifier for lease_area in lease.lease_areas.all()),
+        addresses=', '.join(lease_area.address for lease_area in lease.lease_areas.all()),
+        intended_use=lease.intended_use.name if lease.intended_use else None,
+        refreshed_at=refreshed_at,
+        lease_version=lease_versions.get(lease.id),
+    ) for lease in leases]
+
+
+def save_billing_summaries(lease_ids, summaries):
+    with transaction.atomic():
+        # The summaries have no delete receivers or cascades, so they are
+        # deleted with one query
+        LeaseBillingSummary.objects.filter(lease_id__in=lease_ids).delete()
+        LeaseBillingSummary.objects.bulk_create(summaries)
+
+
+def refresh_billing_summaries(lease_ids, year=None):
+    """Replaces the summaries of the leases with ones calculated now and
+    returns them
+
+    The year defaults to the current year."""
+    lease_ids = list(lease_ids)
+    year = year or get_summary_year()
+    summaries = calculate_billing_summaries(lease_ids, year)
+
+    try:
+        save_billing_summaries(lease_ids, summaries)
+    except IntegrityError:
+        # A concurrent refresh has created some of the same summaries after
+        # the old ones were deleted
+        save_billing_summaries(lease_ids, summaries)
+
+    return summaries
+
+
+def get_fresh_billing_summaries(year):
+    """Returns the summaries of the year that are calculated after the
+    latest committed change of their lease"""
+    changes = LeaseChange.objects.filter(lease_id=OuterRef('lease_id'))
+
+    return LeaseBillingSummary.objects.filter(year=year).annotate(
+        change_version=Subquery(changes.values('version')), has_change=Exists(changes)).filter(
+        Q(has_change=False) | Q(change_version__lte=F('lease_version')))
+
+
+def get_billing_summaries(lease_ids, year=None):
+    """Returns the summaries of the leases as a dict by lease id
+
+    The stale and the missing summaries are refreshed first."""
+    year = year or get_summary_year()
+    summaries = {summary.lease_id: summary for summary in get_fresh_billing_summaries(year).filter(
+        lease_id__in=list(lease_ids))}
+    stale_lease_ids = set(lease_ids) - set(summaries)
+
+    if stale_lease_ids:
+        summaries.update({summary.lease_id: summary for summary in refresh_billing_summaries(stale_lease_ids, year)})
+
+    return summaries
+
+
+def refresh_stale_billing_summaries(year=None, chunk_size=BILLING_SUMMARY_CHUNK_SIZE, refresh_all=False,
+                                    progress=None):
+    """Refreshes the stale and the missing summaries of the leases in chunks
+    of chunk_size leases
+
+    With refresh_all every summary is refreshed, e.g. after the names of the
+    intended uses or the index numbers have changed, as those don't show
+    in the change feed. The optional progress function is called after
+    every chunk with the number of the refreshed leases and the number of
+    the leases to refresh. Returns the number of the refreshed leases."""
+    year = year or get_summary_year()
+    queryset = Lease.objects.order_by('id')
+    if not refresh_all:
+        queryset = queryset.exclude(id__in=get_fresh_billing_summaries(year).values('lease_id'))
+
+    lease_ids = list(queryset.values_list('id', flat=True))
+
+    for index in range(0, len(lease_ids), chunk_size):
+        refresh_billing_summaries(lease_ids[index:index + chunk_size], year)
+        if progress:
+            progress(min(index + chunk_size, len(lease_ids)), len(lease_ids))
+
+    return len(lease_ids)
@@ -0,0 +1,111 @@
+"""Helpers for writing model instances in bulk
+
+Bulk queries bypass the model signals. The helpers here create the same
+audit log entries that the django-auditlog signal receivers would create
+when the instances are saved one by one."""
+import copy
+import json
+
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry
+from auditlog.registry import auditlog
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+from django.db.models.signals import pre_save
+
+BULK_BATCH_SIZE = 500
+
+
+def copy_instance(instance):
+    """Returns a copy of the instance that can be used as the old state of
+    the instance in an audit log diff
+
+    The copy doesn't share the related object cache with the instance."""
+    instance_copy = copy.copy(instance)
+    instance_copy._state = copy.copy(instance._state)
+    instance_copy._state.fields_cache = dict(instance._state.fields_cache)
+
+    return instance_copy
+
+
+def bulk_update(model, instances, field_names, batch_size=BULK_BATCH_SIZE):
+    """Saves the values of the fields of the instances with one UPDATE query
+    per batch
+
+    Works like QuerySet.bulk_update in the later versions of Django."""
+    if not instances or not field_names:
+        return
+
+    fields = [model._meta.get_field(field_name) for field_name in field_names]
+
+    for start in range(0, len(instances), batch_size):
+        batch = instances[start:start + batch_size]
+        values = {}
+
+        for field in fields:
+            whens = [When(pk=instance.pk, then=Value(getattr(instance, field.attname), output_field=field))
+                     for instance in batch]
+            # PostgreSQL can't infer the type of the CASE expression from the parameters
+            values[field.name] = Cast(Case(*whens, output_field=field), output_field=field)
+
+        model._base_manager.filter(pk__in=[instance.pk for instance in batch]).update(**values)
+
+
+def get_log_entries(instance_pairs):
+    """Returns unsaved audit log entries for (old, new) instance pairs
+
+    A pair without the old instance is logged as a create and a pair
+    without the new instance as a delete. Updates are logged only if a
+    tracked field has changed. Instances of models that are not registered
+    to auditlog are skipped."""
+    log_entries = []
+
+    for old, new in instance_pairs:
+        instance = new if new is not None else old
+
+        if not auditlog.contains(instance.__class__):
+            continue
+
+        changes = model_instance_diff(old, new)
+
+        if old is None:
+            action = LogEntry.Action.CREATE
+        elif new is None:
+            action = LogEntry.Action.DELETE
+        else:
+            if not changes:
+                continue
+
+            action = LogEntry.Action.UPDATE
+
+        log_entry = LogEntry(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_pk=instance.pk,
+            object_id=instance.pk if isinstance(instance.pk, int) else None,
+            object_repr=str(instance),
+            action=action,
+            changes=json.dumps(changes),
+        )
+
+        get_additional_data = getattr(instance, 'get_additional_data', None)
+        if callable(get_additional_data):
+            log_entry.additional_data = get_additional_data()
+
+        log_entries.append(log_entry)
+
+    return log_entries
+
+
+def save_log_entries(log_entries):
+    """Saves the audit log entries with one INSERT query
+
+    The pre_save signal is sent for every entry because AuditlogMiddleware
+    uses it to set the actor and the remote address of the entry."""
+    if not log_entries:
+        return
+
+    for log_entry in log_entries:
+        pre_save.send(sender=LogEntry, instance=log_entry, raw=False, using=None, update_fields=None)
+
+    LogEntry.objects.bulk_create(log_entries, batch_size=BULK_BATCH_SIZE)
@@ -0,0 +1,284 @@
+"""Rent calculation
+
+Calculates the rent of a lease for an arbitrary date range from the Rent,
+ContractRent, FixedInitialYearRent, IndexAdjustedRent and RentAdjustment
+rows of the lease. The yearly amounts are prorated by day within the rent
+cycle years, so e.g. a day in a leap year is 1/366 of the yearly amount.
+
+For each day the rent is the fixed initial year rent, if one covers the
+day. Otherwise it is the index adjusted rent of the intended use (for
+index and manual rents) or the contract rent of the intended use.
+Adjustments are added to or subtracted from that.
+
+The related items are only accessed with .all(), so the calculation runs
+on prefetched data without any queries. calculate_rent_amounts prefetches
+the data for a set of leases in chunks. The amounts are calculated with
+exact fractions and rounded to cents, half up, once per rent."""
+import datetime
+import math
+from decimal import Decimal
+from fractions import Fraction
+
+from leasing.enums import DueDatesType, PeriodType, RentAdjustmentAmountType, RentAdjustmentType, RentCycle, RentType
+from leasing.utils import add_months, get_day_count, get_range_overlap, iterate_prefetched_chunks, subtract_ranges
+
+RENT_CALCULATION_CHUNK_SIZE = 500
+
+RENT_PREFETCH_LOOKUPS = (
+    'rents__contract_rents',
+    'rents__fixed_initial_year_rents',
+    'rents__index_adjusted_rents',
+    'rents__rent_adjustments',
+    'rents__due_dates',
+)
+
+
+def round_to_cents(value):
+    """Rounds a Fraction to a Decimal with two decimals, half away from zero"""
+    value = Fraction(value) * 100
+    cents = (abs(value.numerator) * 2 + value.denominator) // (value.denominator * 2)
+
+    return Decimal(cents if value >= 0 else -cents).scaleb(-2)
+
+
+def split_amount(amount, shares):
+    """Splits the amount by the shares to the cent
+
+    The shares are given as a dict of Fractions. The exact parts are rounded
+    down to cents, and the cents that remain of the total share of the
+    amount rounded to cents are added one each to the parts with the
+    largest remainders. Returns a dict of the parts as Decimals by the keys
+    of the shares."""
+    exact_cents = {key: Fraction(amount) * share * 100 for key, share in shares.items()}
+    total_cents = int(round_to_cents(sum(exact_cents.values(), Fraction(0)) / 100).scaleb(2))
+    cents = {key: math.floor(value) for key, value in exact_cents.items()}
+    remaining_cents = total_cents - sum(cents.values())
+
+    # sorted is stable, so equal remainders get the cents in the order of the keys
+    for key in sorted(cents, key=lambda key: exact_cents[key] - cents[key], reverse=True)[:remaining_cents]:
+        cents[key] += 1
+
+    return {key: Decimal(value).scaleb(-2) for key, value in cents.items()}
+
+
+def get_cycle_year_start(cycle, date):
+    if cycle == RentCycle.APRIL_TO_MARCH:
+        return datetime.date(date.year if date.month >= 4 else date.year - 1, 4, 1)
+
+    return datetime.date(date.year, 1, 1)
+
+
+def get_cycle_year_ranges(cycle, start_date, end_date):
+    """Splits the date range at the starts of the rent cycle years
+
+    Yields (start_date, end_date, number of days in the cycle year)."""
+    while start_date <= end_date:
+        year_start = get_cycle_year_start(cycle, start_date)
+        next_year_start = add_months(year_start, 12)
+        part_end_date = min(end_date, next_year_start - datetime.timedelta(days=1))
+
+        yield start_date, part_end_date, (next_year_start - year_start).days
+
+        start_date = part_end_date + datetime.timedelta(days=1)
+
+
+def get_prorated_amount(yearly_amount, cycle, start_date, end_date):
+    """Returns the part of the yearly amount that falls on the days of the
+    date range"""
+    yearly_amount = Fraction(yearly_amount)
+
+    return sum((yearly_amount * get_day_count(part_start_date, part_end_date) / days_in_year
+                for (part_start_date, part_end_date, days_in_year)
+                in get_cycle_year_ranges(cycle, start_date, end_date)), Fraction(0))
+
+
+def get_contract_rent_yearly_amount(contract_rent):
+    if contract_rent.period == PeriodType.PER_MONTH:
+        return Fraction(contract_rent.amount) * 12
+
+    return Fraction(contract_rent.amount)
+
+
+def get_cycle(rent):
+    return rent.cycle or RentCycle.JANUARY_TO_DECEMBER
+
+
+def get_base_amount(rent, start_date, end_date, intended_use_id=None):
+    """Returns the rent without the adjustments for the date range as a
+    Fraction
+
+    If intended_use_id is given, only the rent of that intended use is
+    included. The fixed initial year rents have no intended use, so they
+    are only included in the total of all the intended uses."""
+    cycle = get_cycle(rent)
+    fixed_ranges = [(fixed_rent.start_date, fixed_rent.end_date)
+                    for fixed_rent in rent.fixed_initial_year_rents.all()]
+    amount = Fraction(0)
+
+    def get_amount(yearly_amount, item_start_date, item_end_date, excluded_ranges):
+        overlap = get_range_overlap(start_date, end_date, item_start_date, item_end_date)
+        if overlap is None:
+            return Fraction(0)
+
+        return sum((get_prorated_amount(yearly_amount, cycle, part_start_date, part_end_date)
+                    for (part_start_date, part_end_date) in subtract_ranges(overlap[0], overlap[1], excluded_ranges)),
+                   Fraction(0))
+
+    if intended_use_id is None:
+        for fixed_rent in rent.fixed_initial_year_rents.all():
+            amount += get_amount(fixed_rent.amount, fixed_rent.start_date, fixed_rent.end_date, [])
+
+    index_adjusted_rents = []
+    if rent.type in (RentType.INDEX, RentType.MANUAL):
+        index_adjusted_rents = [index_adjusted_rent for index_adjusted_rent in rent.index_adjusted_rents.all()
+                                if intended_use_id is None or index_adjusted_rent.intended_use_id == intended_use_id]
+
+    for index_adjusted_rent in index_adjusted_rents:
+        amount += get_amount(index_adjusted_rent.amount, index_adjusted_rent.start_date,
+                             index_adjusted_rent.end_date, fixed_ranges)
+
+    for contract_rent in rent.contract_rents.all():
+        if intended_use_id is not None and contract_rent.intended_use_id != intended_use_id:
+            continue
+
+        # The index adjusted rents replace the contract rent of the same intended use
+        excluded_ranges = fixed_ranges + [
+            (index_adjusted_rent.start_date, index_adjusted_rent.end_date)
+            for index_adjusted_rent in index_adjusted_rents
+            if index_adjusted_rent.intended_use_id == contract_rent.intended_use_id
+        ]
+
+        amount += get_amount(get_contract_rent_yearly_amount(contract_rent), contract_rent.start_date,
+                             contract_rent.end_date, excluded_ranges)
+
+    return amount
+
+
+def get_adjustment_amount(rent, rent_adjustment, start_date, end_date):
+    """Returns the amount that the adjustment adds to the rent for the date
+    range as a Fraction. Discounts are negative."""
+    overlap = get_range_overlap(start_date, end_date, rent_adjustment.start_date, rent_adjustment.end_date)
+    if overlap is None or not rent_adjustment.full_amount:
+        return Fraction(0)
+
+    full_amount = Fraction(rent_adjustment.full_amount)
+    amount_type = rent_adjustment.amount_type
+
+    if amount_type in (RentAdjustmentAmountType.PERCENT_PER_YEAR, RentAdjustmentAmountType.PERCENT_TOTAL):
+        amount = get_base_amount(rent, *overlap, intended_use_id=rent_adjustment.intended_use_id) * full_amount / 100
+    elif amount_type == RentAdjustmentAmountType.AMOUNT_PER_YEAR:
+        amount = get_prorated_amount(full_amount, get_cycle(rent), *overlap)
+    elif rent_adjustment.start_date and rent_adjustment.end_date:
+        # The total amount is divided evenly to the days of the adjustment
+        adjustment_day_count = get_day_count(rent_adjustment.start_date, rent_adjustment.end_date)
+        amount = full_amount * get_day_count(*overlap) / adjustment_day_count
+    elif rent_adjustment.start_date and start_date <= rent_adjustment.start_date <= end_date:
+        amount = full_amount
+    else:
+        amount = Fraction(0)
+
+    if rent_adjustment.type == RentAdjustmentType.DISCOUNT:
+        return -amount
+
+    return amount
+
+
+def get_rent_amount_for_period(rent, start_date, end_date):
+    """Returns the rent for the date range, rounded to cents
+
+    The range is limited to the start and end dates of the lease. A one
+    time rent is due in full in the range that contains the start date of
+    the lease."""
+    lease = rent.lease
+
+    if rent.type == RentType.FREE:
+        return round_to_cents(0)
+
+    if rent.type == RentType.ONE_TIME:
+        if rent.amount and lease.start_date and start_date <= lease.start_date <= end_date:
+            return round_to_cents(rent.amount)
+
+        return round_to_cents(0)
+
+    overlap = get_range_overlap(start_date, end_date, lease.start_date, lease.end_date)
+    if overlap is None:
+        return round_to_cents(0)
+
+    amount = get_base_amount(rent, *overlap)
+
+    for rent_adjustment in rent.rent_adjustments.all():
+        amount += get_adjustment_amount(rent, rent_adjustment, *overlap)
+
+    return round_to_cents(max(amount, 0))
+
+
+def get_active_rents(lease):
+    return [rent for rent in lease.rents.all() if rent.is_active]
+
+
+def get_lease_rent_amount_for_period(lease, start_date, end_date):
+    """Returns the total of the active rents of the lease for the date range"""
+    return sum((get_rent_amount_for_period(rent, start_date, end_date) for rent in get_active_rents(lease)),
+               round_to_cents(0))
+
+
+def calculate_rent_amounts(leases, start_date, end_date, chunk_size=RENT_CALCULATION_CHUNK_SIZE):
+    """Returns a dict of the rents of the leases in the queryset for the
+    date range by lease id
+
+    The rent data is prefetched in chunks of leases, so the number of
+    queries doesn't depend on the number of the leases in a chunk."""
+    amounts = {}
+
+    for chunk in iterate_prefetched_chunks(leases, RENT_PREFETCH_LOOKUPS, chunk_size):
+        for lease in chunk:
+            amounts[lease.id] = get_lease_rent_amount_for_period(lease, start_date, end_date)
+
+    return amounts
+
+
+def get_billing_periods_for_year(rent, year):
+    """Returns the billing periods of the rent in the year as a list of
+    (start_date, end_date)
+
+    The year is divided into as many periods of whole months as there are
+    due dates in a year. With custom due dates, there is a period for each
+    due date. With fixed due dates, there are due_dates_per_year periods."""
+    if rent.due_dates_type == DueDatesType.CUSTOM:
+        period_count = len(rent.due_dates.all())
+    elif rent.due_dates_type == DueDatesType.FIXED:
+        period_count = rent.due_dates_per_year or 0
+    else:
+        period_count = 0
+
+    return get_year_billing_periods(period_count, year)
+
+
+def get_year_billing_periods(period_count, year):
+    """Returns the year divided into period_count periods of whole months,
+    at most 12, as a list of (start_date, end_date)"""
+    period_count = min(period_count, 12)
+    year_start = datetime.date(year, 1, 1)
+
+    return [(add_months(year_start, i * 12 // period_count),
+             add_months(year_start, (i + 1) * 12 // period_count) - datetime.timedelta(days=1))
+            for i in range(period_count)]
+
+
+def get_next_billing_period_for_date(lease, date):
+    """Returns the (start_date, end_date) of the first billing period of the
+    active rents of the lease that starts after the date, or None if the
+    rents have no billing periods"""
+    periods = []
+
+    for rent in get_active_rents(lease):
+        if rent.type == RentType.FREE:
+            continue
+
+        for year in (date.year, date.year + 1):
+            periods.extend(period for period in get_billing_periods_for_year(rent, year) if period[0] > date)
+
+    if not periods:
+        return None
+
+    return min(periods)
@@ -0,0 +1,151 @@
+"""The due date calendar
+
+The billing periods of the active rents are materialized as CalendarDueDate
+rows for a rolling horizon of DUE_DATE_CALENDAR_YEARS calendar years from
+the current one, so the rents that fall due in a date range are found with
+a range scan of the indexed due dates.
+
+A rent with fixed due dates falls due on the first day of each of its
+billing periods, like its invoices. A rent with custom due dates falls due
+on its due dates, paired with its billing periods in the order of the
+year. Only the billing periods that overlap the lease are included, and
+free rents never fall due.
+
+The rows of a lease are regenerated when the transaction that changes the
+dates of the lease, deletes it or saves or deletes one of its rents or a
+due date of a rent commits (see leasing.signals), so only the rents that
+changed are touched. The rows have no delete receivers, so they are
+replaced with one DELETE query. The whole
+calendar is regenerated with the generate_due_date_calendar command, e.g.
+at the turn of the year to move the horizon."""
+import datetime
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from leasing.batch_calculation import load_columns
+from leasing.calculation import get_year_billing_periods
+from leasing.enums import DueDatesType, RentType
+from leasing.models import CalendarDueDate, Rent, RentDueDate
+from leasing.utils import get_id_ranges, get_range_overlap, map_in_processes
+
+DUE_DATE_CALENDAR_YEARS = 2
+
+DUE_DATE_CALENDAR_CHUNK_SIZE = 500
+
+
+def get_calendar_years():
+    """Returns the years of the horizon of the calendar as a list"""
+    year = timezone.localtime(timezone.now()).year
+
+    return list(range(year, year + DUE_DATE_CALENDAR_YEARS))
+
+
+def get_custom_due_date(day, month, year):
+    """Returns the date of the day of the month in the year, or the last day
+    of the month if the month is shorter"""
+    next_month_start = datetime.date(year + month // 12, month % 12 + 1, 1)
+
+    return min(datetime.date(year, month, 1) + datetime.timedelta(days=day - 1),
+               next_month_start - datetime.timedelta(days=1))
+
+
+def get_calendar_rents(lease_ids):
+    return Rent.objects.filter(lease_id__in=lease_ids, lease__deleted__isnull=True, is_active=True).exclude(
+        type=RentType.FREE).filter(Q(due_dates_type=DueDatesType.FIXED) | Q(due_dates_type=DueDatesType.CUSTOM))
+
+
+def get_calendar_due_dates(lease_ids, years):
+    """Returns the unsaved calendar due dates of the rents of the leases in
+    the years"""
+    field_names = ('id', 'lease_id', 'due_dates_type', 'due_dates_per_year', 'lease__start_date', 'lease__end_date')
+    rents = load_columns(get_calendar_rents(lease_ids).order_by('id'), field_names)
+    custom_due_dates = {}
+    for (rent_id, day, month) in RentDueDate.objects.filter(rent_id__in=rents['id']).order_by(
+            'month', 'day').values_list('rent_id', 'day', 'month'):
+        custom_due_dates.setdefault(rent_id, []).append((day, month))
+
+    calendar_due_dates = []
+
+    for (rent_id, lease_id, due_dates_type, due_dates_per_year, lease_start_date, lease_end_date) in zip(
+            *(rents[field_name] for field_name in field_names)):
+        rent_due_dates = custom_due_dates.get(rent_id, [])
+
+        for year in years:
+            if due_dates_type == DueDatesType.CUSTOM:
+                periods = zip([get_custom_due_date(day, month, year) for (day, month) in rent_due_dates],
+                              get_year_billing_periods(len(rent_due_dates), year))
+            else:
+                periods = [(period[0], period) for period in get_year_billing_periods(due_dates_per_year or 0, year)]
+
+            calendar_due_dates.extend(
+                CalendarDueDate(rent_id=rent_id, lease_id=lease_id, due_date=due_date, period_start_date=period[0],
+                                period_end_date=period[1])
+                for (due_date, period) in periods
+                if get_range_overlap(period[0], period[1], lease_start_date, lease_end_date) is not None)
+
+    return calendar_due_dates
+
+
+def regenerate_lease_due_dates(lease_ids, years=None):
+    """Replaces the calendar due dates of the leases in one transaction
+
+    The years default to the horizon of the calendar. Returns the number of
+    the created rows."""
+    lease_ids = list(lease_ids)
+    calendar_due_dates = get_calendar_due_dates(lease_ids, years or get_calendar_years())
+
+    with transaction.atomic():
+        CalendarDueDate.objects.filter(lease_id__in=lease_ids).delete()
+        CalendarDueDate.objects.bulk_create(calendar_due_dates)
+
+    return len(calendar_due_dates)
+
+
+def regenerate_lease_range(years, first_lease_id, last_lease_id):
+    """Replaces the calendar due dates of the leases in the id range in one
+    transaction
+
+    Returns the numbers of the processed leases and the created rows as a
+    Counter."""
+    lease_ids = list(Rent.objects.filter(lease_id__gte=first_lease_id, lease_id__lte=last_lease_id).order_by(
+        'lease_id').values_list('lease_id', flat=True).distinct())
+    calendar_due_dates = get_calendar_due_dates(lease_ids, years)
+
+    with transaction.atomic():
+        CalendarDueDate.objects.filter(lease_id__gte=first_lease_id, lease_id__lte=last_lease_id).delete()
+        CalendarDueDate.objects.bulk_create(calendar_due_dates)
+
+    return Counter({'leases': len(lease_ids), 'due_dates': len(calendar_due_dates)})
+
+
+def regenerate_due_date_calendar(years=None, chunk_size=DUE_DATE_CALENDAR_CHUNK_SIZE, workers=1, progress=None):
+    """Regenerates the whole calendar for the years
+
+    The years default to the horizon of the calendar. The leases are
+    processed in ranges of chunk_size leases, in that many forked processes
+    with more than one worker. The optional progress function is called
+    after every range with the totals so far, the number of the leases to
+    process and the elapsed seconds. Returns the totals as a Counter."""
+    years = years or get_calendar_years()
+    # The leases that have no rents anymore are included to delete their rows
+    lease_ids = sorted(set(Rent.objects.order_by().values_list('lease_id', flat=True).distinct()) | set(
+        CalendarDueDate.objects.order_by().values_list('lease_id', flat=True).distinct()))
+    arguments = [(years,) + id_range for id_range in get_id_ranges(lease_ids, chunk_size)]
+    totals = Counter()
+    start_time = time.monotonic()
+
+    for result in map_in_processes(regenerate_lease_range, arguments, workers):
+        totals.update(result)
+        if progress:
+            progress(totals, len(lease_ids), time.monotonic() - start_time)
+
+    return totals
+
+
+def get_due_dates(start_date, end_date):
+    """Returns the calendar due dates in the date range"""
+    return CalendarDueDate.objects.filter(due_date__gte=start_date, due_date__lte=end_date)
@@ -268,3 +268,17 @@ class RentAdjustmentAmountType(Enum):
         PERCENT_TOTAL = _('% total')
         AMOUNT_PER_YEAR = _('€ per year')
         AMOUNT_TOTAL = _('€ total')
+
+
+class BillingRunState(Enum):
+    """
+    In Finnish: Laskutusajon tila
+    """
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+
+    class Labels:
+        RUNNING = _('Running')
+        FINISHED = _('Finished')
+        FAILED = _('Failed')
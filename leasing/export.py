@@ -0,0 +1,118 @@
+"""Streaming export of leases as JSON Lines or CSV
+
+The leases are read with a server-side cursor in chunks and the related
+items of each chunk are prefetched before the chunk is serialized, so the
+memory use doesn't grow with the number of leases."""
+import csv
+import json
+
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from leasing.serializers.lease import LeaseSerializer
+from leasing.serializers.utils import get_related_lookups
+from leasing.utils import iterate_prefetched_chunks
+
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """A file-like object that returns the written value instead of
+    storing it, for using csv.writer with a streaming response"""
+    def write(self, value):
+        return value
+
+
+def to_json(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+def get_csv_columns(serializer, prefix=''):
+    """Returns the CSV column names of the fields of the serializer
+
+    The fields of nested single serializers are flattened into dotted
+    column names. Lists of items are exported as JSON in one column."""
+    columns = []
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.Serializer):
+            columns.extend(get_csv_columns(field, prefix=prefix + name + '.'))
+        else:
+            columns.append(prefix + name)
+
+    return columns
+
+
+def get_csv_value(data, column):
+    value = data
+
+    for key in column.split('.'):
+        if value is None:
+            break
+
+        value = value.get(key)
+
+    if value is None:
+        return ''
+
+    if isinstance(value, (dict, list)):
+        return to_json(value)
+
+    return value
+
+
+class LeaseExporter:
+    """Serializes the leases in the queryset with LeaseSerializer one chunk
+    at a time
+
+    The serializer is given the context, so the fields, omit and expand
+    query parameters of the request in the context are honored."""
+    def __init__(self, queryset, file_format='jsonl', context=None, chunk_size=EXPORT_CHUNK_SIZE):
+        if file_format not in EXPORT_CONTENT_TYPES:
+            raise ValueError('Unknown export format "{}"'.format(file_format))
+
+        self.queryset = queryset
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        # The same serializer instance serializes all the leases so that the
+        # fields are built and the lookup tables are resolved only once.
+        self.serializer = LeaseSerializer(context=context or {})
+
+    @property
+    def content_type(self):
+        return EXPORT_CONTENT_TYPES[self.file_format]
+
+    def iterate_chunks(self):
+        select_related, prefetch_related = get_related_lookups(self.serializer)
+
+        return iterate_prefetched_chunks(self.queryset.select_related(*select_related), prefetch_related,
+                                         self.chunk_size)
+
+    def iterate_data(self):
+        for chunk in self.iterate_chunks():
+            for lease in chunk:
+                yield self.serializer.to_representation(lease)
+
+    def iterate_lines(self):
+        """Yields the export file line by line"""
+        if self.file_format == 'csv':
+            return self.iterate_csv_lines()
+
+        return (to_json(data) + '\n' for data in self.iterate_data())
+
+    def iterate_csv_lines(self):
+        writer = csv.writer(Echo())
+        columns = get_csv_columns(self.serializer)
+
+        yield writer.writerow(columns)
+
+        for data in self.iterate_data():
+            yield writer.writerow([get_csv_value(data, column) for column in columns])
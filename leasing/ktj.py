@@ -0,0 +1,156 @@
+"""The KTJ print service of the National Land Survey
+
+The prints are requested through one module level requests session, so
+the connections to the service are pooled and kept alive between the
+requests of a process. The session is created on the first request, i.e.
+after the web server has forked its workers.
+
+Every request has a connect and a read timeout. The connection errors,
+the read timeouts before the response headers and the responses with a
+gateway error status are retried KTJ_PRINT_RETRIES times with an
+exponential backoff, as the prints are only ever requested with GET.
+
+The content of a print is read in chunks of at most KTJ_PRINT_CHUNK_SIZE
+bytes, and the connection is returned to the pool when the content has
+been read or the reading is stopped."""
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+KTJ_PRINT_TYPES = [
+    'kiinteistorekisteriote_oik_tod/rekisteriyksikko',
+    'kiinteistorekisteriote_oik_tod/maaraala',
+    'kiinteistorekisteriote/rekisteriyksikko',
+    'kiinteistorekisteriote/maaraala',
+    'lainhuutotodistus_oik_tod',
+    'lainhuutotodistus',
+    'rasitustodistus_oik_tod',
+    'rasitustodistus',
+    'vuokraoikeustodistus_oik_tod',
+    'vuokraoikeustodistus',
+    'muodostumisketju_eteenpain',
+    'muodostumisketju_taaksepain',
+    'voimassa_olevat_muodostuneet',
+    'muodostajarekisteriyksikot_ajankohtana',
+    'muodostajaselvitys',
+    'yhteystiedot',
+    'ktjote_oik_tod/kayttooikeusyksikko',
+    'ktjote/kayttooikeusyksikko',
+]
+
+KTJ_PRINT_PARAMS = [
+    'kiinteistotunnus',
+    'maaraalatunnus',
+    'kohdetunnus',
+    'lang',
+    'leikkauspvm',
+]
+
+KTJ_PRINT_REQUIRED_SETTINGS = ('KTJ_PRINT_ROOT_URL', 'KTJ_PRINT_USERNAME', 'KTJ_PRINT_PASSWORD')
+
+# Seconds to wait for the connection and for each read from the service
+KTJ_PRINT_CONNECT_TIMEOUT = 5
+
+KTJ_PRINT_READ_TIMEOUT = 30
+
+KTJ_PRINT_RETRIES = 2
+
+KTJ_PRINT_BACKOFF_FACTOR = 0.5
+
+KTJ_PRINT_RETRY_STATUSES = (502, 503, 504)
+
+KTJ_PRINT_POOL_SIZE = 10
+
+KTJ_PRINT_CHUNK_SIZE = 64 * 1024
+
+_session = None
+
+
+def get_max_request_time():
+    """Returns the longest time in seconds request_print can take to return
+    the response headers with all the retries and their backoff"""
+    backoff = sum(KTJ_PRINT_BACKOFF_FACTOR * 2 ** retry for retry in range(KTJ_PRINT_RETRIES))
+
+    return (KTJ_PRINT_RETRIES + 1) * (KTJ_PRINT_CONNECT_TIMEOUT + KTJ_PRINT_READ_TIMEOUT) + backoff
+
+
+def get_missing_settings():
+    """Returns the names of the KTJ print settings that are not set"""
+    return [name for name in KTJ_PRINT_REQUIRED_SETTINGS if not getattr(settings, name, None)]
+
+
+def create_session():
+    retry = Retry(total=KTJ_PRINT_RETRIES, connect=KTJ_PRINT_RETRIES, read=KTJ_PRINT_RETRIES,
+                  status=KTJ_PRINT_RETRIES, backoff_factor=KTJ_PRINT_BACKOFF_FACTOR,
+                  status_forcelist=KTJ_PRINT_RETRY_STATUSES, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=KTJ_PRINT_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def get_session():
+    """Returns the session of the process, creating it on the first call"""
+    global _session
+
+    if _session is None:
+        _session = create_session()
+
+    return _session
+
+
+def close_session():
+    """Closes the pooled connections of the process"""
+    global _session
+
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+def get_print_params(params):
+    """Returns the allowed print parameters of the QueryDict as a new
+    QueryDict"""
+    print_params = params.copy()
+
+    for param in params:
+        if param not in KTJ_PRINT_PARAMS:
+            del print_params[param]
+
+    return print_params
+
+
+def request_print(base_type, print_type, params):
+    """Requests the print from the service and returns the response with
+    the content unread
+
+    Raises requests.Timeout if the service does not respond in time and
+    requests.RequestException if it cannot be reached otherwise."""
+    url = '{}/{}/tuloste/{}/pdf'.format(settings.KTJ_PRINT_ROOT_URL, base_type, print_type)
+
+    try:
+        return get_session().get(url, data=params,
+                                 auth=HTTPBasicAuth(settings.KTJ_PRINT_USERNAME, settings.KTJ_PRINT_PASSWORD),
+                                 timeout=(KTJ_PRINT_CONNECT_TIMEOUT, KTJ_PRINT_READ_TIMEOUT), stream=True)
+    except requests.ConnectionError as e:
+        # requests raises the read timeouts that have run out of retries as
+        # connection errors
+        if e.args and isinstance(getattr(e.args[0], 'reason', None), ReadTimeoutError):
+            raise requests.ReadTimeout(*e.args, request=e.request) from e
+        raise
+
+
+def iterate_content(response, chunk_size=KTJ_PRINT_CHUNK_SIZE):
+    """Yields the content of the response in chunks of at most chunk_size
+    bytes and closes the response after the content or when the generator
+    is closed"""
+    try:
+        yield from response.iter_content(chunk_size)
+    finally:
+        response.close()
@@ -0,0 +1,273 @@
+"""The on-disk cache of the KTJ prints
+
+The same prints of the same real property units are requested again and
+again, so the prints are cached as files in KTJ_PRINT_CACHE_ROOT. A print
+is stored under the SHA-256 digest of its base type, print type and
+allowed parameters, so the same request always maps to the same file.
+Only the successful PDF responses are cached.
+
+A cached print is served for KTJ_PRINT_CACHE_TTL seconds from the time it
+was written (the modification time of the file). Reading a print updates
+the access time of its file. The expired and then the least recently read
+prints are removed until the prints fit in KTJ_PRINT_CACHE_MAX_SIZE bytes
+by the evict_ktj_prints command, and by a process that has written a
+tenth of the maximum size since it last evicted, so the cache exceeds the
+maximum size by at most a tenth per process between the evictions.
+
+The identical requests in all the processes are fetched from the service
+only once: the first request locks the key with an exclusive flock and the
+others wait for it and then read the print it stored. A request that has
+waited for longer than the service may take with all the retries fetches
+the print itself. A lock is only held on a lock file that is still in
+place, as the eviction removes the unused lock files.
+
+A print is written to a temporary file that is renamed when it is
+complete, so the readers never see a partial print. The print is opened
+before it is returned, so it can be served even if it is evicted in
+between."""
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+from leasing import ktj
+
+KTJ_PRINT_CACHE_CONTENT_TYPE = 'application/pdf'
+
+KTJ_PRINT_CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# A process evicts after writing a 1/KTJ_PRINT_CACHE_EVICT_DIVISOR of the
+# maximum size
+KTJ_PRINT_CACHE_EVICT_DIVISOR = 10
+
+# The bytes written by the process since it last evicted by the cache root
+_written_sizes = Counter()
+
+_written_sizes_lock = threading.Lock()
+
+
+def get_cache_key(base_type, print_type, params):
+    """Returns the hex digest of the print and its parameters, given as a
+    QueryDict"""
+    data = json.dumps([base_type, print_type, sorted(params.lists())])
+
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def try_lock(file):
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+
+    return True
+
+
+def is_same_file(file, path):
+    """Returns True if the open file is still the file at the path"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+
+    file_stat = os.fstat(file.fileno())
+
+    return (stat.st_dev, stat.st_ino) == (file_stat.st_dev, file_stat.st_ino)
+
+
+def get_lock_timeout():
+    """Returns the seconds to wait for another request to fetch a print,
+    i.e. the longest time of the request and a read of the content"""
+    return ktj.get_max_request_time() + ktj.KTJ_PRINT_READ_TIMEOUT
+
+
+class KtjPrintCache:
+    """The cached prints in the root directory
+
+    The root, the time-to-live in seconds and the maximum size in bytes
+    default to the KTJ_PRINT_CACHE_* settings."""
+    def __init__(self, root=None, ttl=None, max_size=None):
+        self.root = Path(root or settings.KTJ_PRINT_CACHE_ROOT)
+        self.ttl = settings.KTJ_PRINT_CACHE_TTL if ttl is None else ttl
+        self.max_size = settings.KTJ_PRINT_CACHE_MAX_SIZE if max_size is None else max_size
+
+    def get_path(self, key, suffix='.pdf'):
+        return str(self.root / key[:2] / (key + suffix))
+
+    def open(self, key):
+        """Returns the cached print of the key opened for reading, or None if
+        it is missing or expired"""
+        path = self.get_path(key)
+
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        modified_at = os.fstat(file.fileno()).st_mtime
+        now = time.time()
+        if now - modified_at > self.ttl:
+            file.close()
+            return None
+
+        try:
+            os.utime(path, (now, modified_at))
+        except FileNotFoundError:
+            pass
+
+        return file
+
+    @contextmanager
+    def lock(self, key, timeout):
+        """Holds the lock of the key for the block
+
+        Yields False without the lock if the lock isn't released in timeout
+        seconds."""
+        path = self.get_path(key, '.lock')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with open(path, 'a') as file:
+                locked = try_lock(file)
+                while not locked and time.monotonic() < deadline:
+                    time.sleep(KTJ_PRINT_CACHE_LOCK_POLL_INTERVAL)
+                    locked = try_lock(file)
+
+                # The lock file has been removed while waiting for it, so
+                # the lock is taken again on the new file
+                if locked and not is_same_file(file, path):
+                    continue
+
+                yield locked
+                return
+
+    def store(self, key, response):
+        """Writes the content of the response as the print of the key and
+        returns the print opened for reading"""
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.{}.'.format(key), suffix='.tmp',
+                                         delete=False) as temporary_file:
+            try:
+                for chunk in ktj.iterate_content(response):
+                    temporary_file.write(chunk)
+            except BaseException:
+                os.unlink(temporary_file.name)
+                raise
+
+        os.replace(temporary_file.name, path)
+        file = open(path, 'rb')
+
+        if self.add_written_size(os.fstat(file.fileno()).st_size):
+            self.evict()
+
+        return file
+
+    def add_written_size(self, size):
+        """Adds the size to the bytes written by the process and returns True
+        if it is time to evict, resetting the count"""
+        with _written_sizes_lock:
+            _written_sizes[str(self.root)] += size
+
+            if _written_sizes[str(self.root)] * KTJ_PRINT_CACHE_EVICT_DIVISOR < self.max_size:
+                return False
+
+            _written_sizes[str(self.root)] = 0
+
+        return True
+
+    def evict(self):
+        """Removes the expired prints and then the least recently read prints
+        until the prints fit in the maximum size
+
+        Does nothing if another process is evicting. Returns the number of
+        the removed prints."""
+        os.makedirs(str(self.root), exist_ok=True)
+
+        with open(str(self.root / '.evict.lock'), 'a') as evict_lock:
+            if not try_lock(evict_lock):
+                return 0
+
+            entries = []
+            for path in self.root.glob('*/*.pdf'):
+                try:
+                    entries.append((path, path.stat()))
+                except FileNotFoundError:
+                    pass
+
+            now = time.time()
+            total_size = sum(stat.st_size for (path, stat) in entries)
+            removed_paths = []
+
+            for (path, stat) in sorted(entries, key=lambda entry: (now - entry[1].st_mtime <= self.ttl,
+                                                                   entry[1].st_atime)):
+                if total_size <= self.max_size and now - stat.st_mtime <= self.ttl:
+                    break
+
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total_size -= stat.st_size
+                removed_paths.append(path)
+
+            self.remove_unused_locks()
+
+        return len(removed_paths)
+
+    def remove_unused_locks(self):
+        """Removes the locks of the keys that have no print and that are not
+        being fetched"""
+        for path in self.root.glob('*/*.lock'):
+            if path.with_suffix('.pdf').exists():
+                continue
+
+            with open(str(path), 'a') as file:
+                if try_lock(file) and is_same_file(file, str(path)):
+                    path.unlink()
+
+    def get(self, base_type, print_type, params):
+        """Returns the print opened for reading and None, fetching it from
+        the service if it isn't cached
+
+        Returns None and the response of the service with the content unread
+        if the response can't be cached. Raises the exceptions of
+        leasing.ktj.request_print."""
+        key = get_cache_key(base_type, print_type, params)
+
+        file = self.open(key)
+        if file:
+            return file, None
+
+        with self.lock(key, get_lock_timeout()):
+            # The print may have been stored while waiting for the lock
+            file = self.open(key)
+            if file:
+                return file, None
+
+            response = ktj.request_print(base_type, print_type, params)
+            if response.status_code != 200 or response.headers.get('Content-Type') != KTJ_PRINT_CACHE_CONTENT_TYPE:
+                return None, response
+
+            return self.store(key, response), None
+
+
+def get_print(base_type, print_type, params):
+    """Returns the print opened for reading and None, or None and the
+    response of the service like KtjPrintCache.get
+
+    The prints are fetched without the cache if its size is set to 0."""
+    if not settings.KTJ_PRINT_CACHE_MAX_SIZE:
+        return None, ktj.request_print(base_type, print_type, params)
+
+    return KtjPrintCache().get(base_type, print_type, params)
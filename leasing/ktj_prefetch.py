@@ -0,0 +1,169 @@
+"""Prefetching the KTJ prints of a lease
+
+The lease page shows the KTJ prints of the real property units and the
+unseparated parcels of the plots and the plan units of the lease areas.
+Requesting them one by one from the service takes long, so they can be
+fetched into the print cache in advance, concurrently in a pool of
+KTJ_PREFETCH_WORKERS threads per process. The pool is created on the
+first prefetch, like the session of leasing.ktj, and the prints are then
+read from the cache by the proxy.
+
+A print that is already being prefetched is not queued again, so
+prefetching the same lease again while its prints are in flight only
+returns their futures. At most KTJ_PREFETCH_MAX_PENDING prints are queued
+or being fetched in a process, and the prefetches that would exceed it
+are rejected. The failed prefetches are logged.
+
+The prints are requested with the same parameters as the lease page
+requests them, as the parameters are a part of the cache key."""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.http import QueryDict
+
+from leasing.enums import PlotType
+from leasing.ktj_cache import get_cache_key, get_print
+from leasing.models import PlanUnit, Plot
+
+KTJ_PREFETCH_BASE_TYPE = 'ktjkii'
+
+KTJ_PREFETCH_LANGUAGE = 'fi'
+
+# The print types and the identifier parameter of each plot type
+KTJ_PREFETCH_PRINTS = {
+    PlotType.REAL_PROPERTY: (
+        ('kiinteistorekisteriote/rekisteriyksikko', 'kiinteistotunnus'),
+        ('lainhuutotodistus', 'kiinteistotunnus'),
+        ('rasitustodistus', 'kiinteistotunnus'),
+    ),
+    PlotType.UNSEPARATED_PARCEL: (
+        ('kiinteistorekisteriote/maaraala', 'maaraalatunnus'),
+    ),
+}
+
+KTJ_PREFETCH_WORKERS = 4
+
+KTJ_PREFETCH_MAX_PENDING = 100
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+# The futures of the prints being prefetched by the cache key
+_pending_prints = {}
+
+_pending_prints_lock = threading.RLock()
+
+
+class PrefetchQueueFull(Exception):
+    pass
+
+
+def get_lease_prints(lease):
+    """Returns the base type, the print type and the parameters as a
+    QueryDict of the prints of the plots and the plan units of the lease"""
+    identifiers = set()
+    for model in (Plot, PlanUnit):
+        identifiers.update(model.objects.filter(lease_area__lease=lease, lease_area__deleted__isnull=True).exclude(
+            identifier='').values_list('type', 'identifier'))
+
+    prints = []
+    for (plot_type, identifier) in sorted(identifiers, key=lambda item: (item[0].value, item[1])):
+        for (print_type, param) in KTJ_PREFETCH_PRINTS[plot_type]:
+            params = QueryDict(mutable=True)
+            params[param] = identifier
+            params['lang'] = KTJ_PREFETCH_LANGUAGE
+            prints.append((KTJ_PREFETCH_BASE_TYPE, print_type, params))
+
+    return prints
+
+
+def get_print_url(base_type, print_type, params):
+    """Returns the path of the print in the KTJ print proxy"""
+    return '/{}/tuloste/{}/pdf?{}'.format(base_type, print_type, params.urlencode())
+
+
+def fetch_print(base_type, print_type, params):
+    """Fetches the print into the cache unless it is cached already
+
+    Returns True if the print is in the cache. Raises requests.HTTPError if
+    the service responds with an error status."""
+    file, response = get_print(base_type, print_type, params)
+
+    if file is not None:
+        file.close()
+        return True
+
+    try:
+        response.raise_for_status()
+    finally:
+        response.close()
+
+    return False
+
+
+def finish_prefetch(key, print_args, future):
+    """Removes the finished prefetch from the pending prints and logs it if
+    it failed"""
+    with _pending_prints_lock:
+        if _pending_prints.get(key) is future:
+            del _pending_prints[key]
+
+    if future.cancelled():
+        return
+
+    exception = future.exception()
+    if exception is not None:
+        logger.error('Prefetching the KTJ print %s failed: %s', get_print_url(*print_args), exception,
+                     exc_info=(type(exception), exception, exception.__traceback__))
+    elif not future.result():
+        logger.warning('The KTJ print %s could not be cached', get_print_url(*print_args))
+
+
+def get_executor():
+    """Returns the prefetch pool of the process, creating it on the first
+    call"""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=KTJ_PREFETCH_WORKERS)
+
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    """Shuts down the prefetch pool of the process, by default after the
+    prefetches have finished"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def prefetch_prints(prints):
+    """Starts fetching the prints into the cache in the background
+
+    Returns a Future of the result of fetch_print for each print, or
+    nothing if the cache is disabled. The prints that are already being
+    prefetched get their pending futures. Raises PrefetchQueueFull without
+    queueing anything if the prints would exceed KTJ_PREFETCH_MAX_PENDING."""
+    if not settings.KTJ_PRINT_CACHE_MAX_SIZE:
+        return []
+
+    keys = [get_cache_key(*print_args) for print_args in prints]
+
+    with _pending_prints_lock:
+        futures = {key: _pending_prints[key] for key in keys if key in _pending_prints}
+        new_prints = {key: print_args for (key, print_args) in zip(keys, prints) if key not in futures}
+        if len(_pending_prints) + len(new_prints) > KTJ_PREFETCH_MAX_PENDING:
+            raise PrefetchQueueFull()
+
+        for (key, print_args) in new_prints.items():
+            futures[key] = _pending_prints[key] = get_executor().submit(fetch_print, *print_args)
+            futures[key].add_done_callback(partial(finish_prefetch, key, print_args))
+
+    return [futures[key] for key in keys]
@@ -1,227 +1,386 @@
 # -*- coding: utf-8 -*-
-
+"""Serialization of the invoices to SAP sales orders in the LASKE XML format
+
+The invoices are written in batches to files in the outbox directory
+LASKE_OUTBOX_ROOT, from where they are transferred to SAP. A file is
+written under a temporary name and renamed when it is complete, so the
+transfer never picks up a partial file."""
+import datetime
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
 from xml.etree import ElementTree
+from xml.sax.saxutils import escape
 
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-from .models import Contact
+from .batch_calculation import BatchRentCalculator
+from .billing_summary import calculate_billing_summaries, get_billing_summaries
+from .enums import TenantContactType
+from .models import Invoice
+from .utils import iterate_prefetched_chunks
 
+LASKE_CHUNK_SIZE = 500
 
-def serialize_invoice(invoice):
-    lease = invoice.tenants.first().lease
+LASKE_INVOICES_PER_FILE = 5000
 
-    root = ElementTree.Element('SBO_SalesOrder')
-    sender_id = ElementTree.SubElement(root, 'SenderId')
-    sender_id.text = get_laske_value('SenderId')
-    reference = ElementTree.SubElement(root, 'Reference')
-    if invoice.reference_number:
-        reference.text = invoice.reference_number
-    ElementTree.SubElement(root, 'OriginalOrder')
-    contract_number = ElementTree.SubElement(root, 'ContractNumber')
-    contract_number.text = lease.get_contract_number()
-    order_type = ElementTree.SubElement(root, 'OrderType')
-    order_type.text = get_laske_value('OrderType')
-    sales_org = ElementTree.SubElement(root, 'SalesOrg')
-    sales_org.text = get_laske_value('SalesOrg')
-    distribution_channel = ElementTree.SubElement(root, 'distribution_channel')
-    distribution_channel.text = get_laske_value('distribution_channel')
-    division = ElementTree.SubElement(root, 'Division')
-    division.text = get_laske_value('Division')
-    sales_office = ElementTree.SubElement(root, 'SalesOffice')
-    sales_office.text = get_laske_value('SalesOffice')
-    ElementTree.SubElement(root, 'SalesGroup')
-    ElementTree.SubElement(root, 'PONumber')
-    ElementTree.SubElement(root, 'BillingBlock')
-    ElementTree.SubElement(root, 'SalesDistrict')
-    ElementTree.SubElement(root, 'HiddenTextL1')
-    ElementTree.SubElement(root, 'HiddenTextL2')
-    ElementTree.SubElement(root, 'HiddenTextL3')
-    ElementTree.SubElement(root, 'HiddenTextL4')
-    ElementTree.SubElement(root, 'HiddenTextL5')
-    ElementTree.SubElement(root, 'HiddenTextL6')
-
-    root.extend(get_laske_bill_text_elements(invoice))
-
-    ElementTree.SubElement(root, 'ReferenceText')
-    pmntterm = ElementTree.SubElement(root, 'PMNTTERM')
-    pmntterm.text = get_laske_value('PMNTTERM')
-    ElementTree.SubElement(root, 'OrderReason')
-    billing_date = ElementTree.SubElement(root, 'BillingDate')
-    billing_date.text = invoice.created_at.strftime('%Y%m%d')
-    ElementTree.SubElement(root, 'PricingDate')
-    value_date = ElementTree.SubElement(root, 'ValueDate')
-    value_date.text = invoice.created_at.strftime('%Y%m%d')
-    ElementTree.SubElement(root, 'PaymentReference')
-    ElementTree.SubElement(root, 'AlreadyPrintedFlag')
-
-    root.extend(get_laske_parties(invoice))
-    root.append(get_laske_line_item(invoice))
+LASKE_BATCH_ROOT_TAG = 'SBO_SalesOrders'
 
-    return root
+LASKE_SELECT_RELATED = ('billing_contact', 'lease')
+
+LASKE_PREFETCH_LOOKUPS = ('tenants', 'lease__contracts', 'lease__tenants__tenantcontact_set__contact')
+
+LASKE_PARTY_TAGS = ('OrderParty', 'BillingParty1', 'BillingParty2', 'PayerParty')
+
+TEMPLATE_FIELD_MARKER = '\x00'
+
+
+def serialize_invoice(invoice, year_rent=None, summary=None):
+    """Returns the SBO_SalesOrder element of the invoice
+
+    The billing summary of the lease and the year rent are calculated if
+    they are not given."""
+    return build_sales_order(get_sales_order_values(invoice, year_rent, summary))
+
+
+def render_invoice(invoice, year_rent=None, summary=None):
+    """Returns the SBO_SalesOrder of the invoice as an XML string
+
+    The string is the same as the serialized element of serialize_invoice,
+    but only the variable fields are filled into a precompiled template."""
+    return get_sales_order_template().render(get_sales_order_values(invoice, year_rent, summary))
 
 
 def get_laske_value(name):
     return getattr(settings, 'LASKE_VALUES', {}).get(name, '')
 
 
-def get_laske_bill_text_elements(invoice):
-    elements = []
+def get_contract_number(lease):
+    for contract in lease.contracts.all():
+        if contract.contract_number:
+            return contract.contract_number
+
+    return None
+
+
+def get_contact_name(contact):
+    if contact.is_business:
+        return contact.business_name
+
+    return ' '.join(name for name in (contact.first_name, contact.last_name) if name) or None
+
+
+def get_sales_order_values(invoice, year_rent=None, summary=None):
+    """Returns the variable fields of the SBO_SalesOrder of the invoice as a
+    dict by field name
 
-    lease = invoice.tenants.first().lease
+    The year rent is the rent of the lease for the calendar year of the
+    start of the billing period."""
+    if summary is None:
+        summary = calculate_billing_summaries([invoice.lease_id], invoice.period_start_date.year)[0]
 
-    bill_text_l1 = ElementTree.Element('BillTextL1')
-    bill_text_l1.text = 'Vuokraustunnus: {}  Vuokra ajalta: {}-{}'.format(
-        lease.identifier_string(),
-        invoice.period_start_date.strftime('%d.%m.%Y'),
-        invoice.period_end_date.strftime('%d.%m.%Y'),
-    )
-    elements.append(bill_text_l1)
+    if year_rent is None:
+        year_rent = summary.year_rent
 
-    bill_text_l2 = ElementTree.Element('BillTextL2')
-    bill_text_l2.text = 'Sopimuksen päättymispvm: {}'.format(
-        lease.end_date.strftime('%d.%m.%Y') if lease.end_date else '-'
-    )
-    elements.append(bill_text_l2)
+    values = {
+        'Reference': invoice.reference_number,
+        'ContractNumber': get_contract_number(invoice.lease),
+        'BillingDate': invoice.created_at.strftime('%Y%m%d'),
+        'ValueDate': invoice.created_at.strftime('%Y%m%d'),
+        'NetPrice': '{:.2f}'.format(invoice.amount).replace('.', ','),
+        'LineTextL1': get_other_tenants_text(invoice),
+    }
+    values.update(get_bill_text_values(invoice, year_rent, summary))
 
-    bill_text_l3 = ElementTree.Element('BillTextL3')
-    bill_text_l3.text = 'Käyttötarkoitus: TODO'
-    elements.append(bill_text_l3)
+    for (tag_name, contact) in zip(LASKE_PARTY_TAGS, get_laske_party_contacts(invoice)):
+        values.update(get_contact_values(contact, tag_name))
 
-    bill_text_l4 = ElementTree.Element('BillTextL4')
-    bill_text_l4.text = 'Indeksin tark.pvm: -  Vuosivuokra: {}'.format(
-        lease.get_year_rent()
-    )
-    elements.append(bill_text_l4)
+    return values
 
-    bill_text_l5 = ElementTree.Element('BillTextL5')
-    bill_text_l5.text = 'Kiinteistötunnus: {}'.format(
-        ', '.join(lease.get_real_property_unit_identifiers())
-    )
-    elements.append(bill_text_l5)
 
-    bill_text_l6 = ElementTree.Element('BillTextL6')
-    bill_text_l6.text = 'Vuokrakohteen osoite: {}'.format(
-        ', '.join(lease.get_real_property_unit_addresses())
-    )
-    elements.append(bill_text_l6)
+def get_bill_text_values(invoice, year_rent, summary):
+    lease = invoice.lease
 
-    return elements
+    return {
+        'BillTextL1': 'Vuokraustunnus: {}  Vuokra ajalta: {}-{}'.format(
+            summary.identifier,
+            invoice.period_start_date.strftime('%d.%m.%Y'),
+            invoice.period_end_date.strftime('%d.%m.%Y'),
+        ),
+        'BillTextL2': 'Sopimuksen päättymispvm: {}'.format(
+            lease.end_date.strftime('%d.%m.%Y') if lease.end_date else '-'
+        ),
+        'BillTextL3': 'Käyttötarkoitus: {}'.format(summary.intended_use or '-'),
+        'BillTextL4': 'Indeksin tark.pvm: -  Vuosivuokra: {}'.format(year_rent),
+        'BillTextL5': 'Kiinteistötunnus: {}'.format(summary.real_property_unit_identifiers),
+        'BillTextL6': 'Vuokrakohteen osoite: {}'.format(summary.addresses),
+    }
 
 
-def get_laske_parties(invoice):
-    elements = []
+def get_laske_party_contacts(invoice):
+    """Returns the contacts of the parties of LASKE_PARTY_TAGS
 
+    None stands for an empty party."""
     if invoice.billing_contact:
-        elements.append(serialize_contact(invoice.billing_contact, 'OrderParty'))
-        elements.append(serialize_contact(invoice.billing_contact, 'BillingParty1'))
-        elements.append(serialize_contact(Contact(), 'BillingParty2'))
-        elements.append(serialize_contact(invoice.billing_contact, 'PayerParty'))
+        return [invoice.billing_contact, invoice.billing_contact, None, invoice.billing_contact]
+
+    return [None] * len(LASKE_PARTY_TAGS)
+
+
+def get_contact_values(contact, tag_name):
+    """Returns the variable fields of the party element of the contact"""
+    if contact is None:
+        business_id = name = address = None
     else:
-        elements.append(serialize_contact(Contact(), 'OrderParty'))
-        elements.append(serialize_contact(Contact(), 'BillingParty1'))
-        elements.append(serialize_contact(Contact(), 'BillingParty2'))
-        elements.append(serialize_contact(Contact(), 'PayerParty'))
+        business_id = contact.business_id
+        name = get_contact_name(contact)
+        address = contact.address
+
+    return {
+        '{}.BusinessId'.format(tag_name): business_id,
+        '{}.Name'.format(tag_name): name,
+        '{}.Address'.format(tag_name): address,
+    }
+
+
+def get_other_tenants_text(invoice):
+    invoice_tenant_ids = {tenant.id for tenant in invoice.tenants.all()}
+    names = [get_contact_name(tenant_contact.contact)
+             for tenant in invoice.lease.tenants.all() if tenant.id not in invoice_tenant_ids
+             for tenant_contact in tenant.tenantcontact_set.all() if tenant_contact.type == TenantContactType.TENANT]
+
+    if not names:
+        return None
+
+    return 'Muita vuokraajia : {}'.format(', '.join(name for name in names if name))
+
 
-    return elements
+def add_elements(parent, tag_names):
+    for tag_name in tag_names:
+        ElementTree.SubElement(parent, tag_name)
 
 
-def serialize_contact(contact, tag_name):
+def add_text_element(parent, tag_name, text):
+    element = ElementTree.SubElement(parent, tag_name)
+    element.text = text
+
+
+def build_sales_order(values):
+    """Returns the SBO_SalesOrder element with the variable fields from the
+    values of get_sales_order_values"""
+    root = ElementTree.Element('SBO_SalesOrder')
+    add_text_element(root, 'SenderId', get_laske_value('SenderId'))
+    add_text_element(root, 'Reference', values['Reference'])
+    add_elements(root, ('OriginalOrder',))
+    add_text_element(root, 'ContractNumber', values['ContractNumber'])
+    for name in ('OrderType', 'SalesOrg', 'distribution_channel', 'Division', 'SalesOffice'):
+        add_text_element(root, name, get_laske_value(name))
+    add_elements(root, ('SalesGroup', 'PONumber', 'BillingBlock', 'SalesDistrict', 'HiddenTextL1', 'HiddenTextL2',
+                        'HiddenTextL3', 'HiddenTextL4', 'HiddenTextL5', 'HiddenTextL6'))
+    for name in ('BillTextL1', 'BillTextL2', 'BillTextL3', 'BillTextL4', 'BillTextL5', 'BillTextL6'):
+        add_text_element(root, name, values[name])
+    add_elements(root, ('ReferenceText',))
+    add_text_element(root, 'PMNTTERM', get_laske_value('PMNTTERM'))
+    add_elements(root, ('OrderReason',))
+    add_text_element(root, 'BillingDate', values['BillingDate'])
+    add_elements(root, ('PricingDate',))
+    add_text_element(root, 'ValueDate', values['ValueDate'])
+    add_elements(root, ('PaymentReference', 'AlreadyPrintedFlag'))
+
+    for tag_name in LASKE_PARTY_TAGS:
+        root.append(build_party(values, tag_name))
+
+    root.append(build_line_item(values))
+
+    return root
+
+
+def build_party(values, tag_name):
     root = ElementTree.Element(tag_name)
-    ElementTree.SubElement(root, 'SAPCustomerID')
-    ElementTree.SubElement(root, 'CustomerID')
-    customer_yid = ElementTree.SubElement(root, 'CustomerYID')
-    customer_yid.text = contact.organization_id if contact.organization_id else None
-    ElementTree.SubElement(root, 'CustomerOVT')
-    ElementTree.SubElement(root, 'TemporaryAddress1')
-    ElementTree.SubElement(root, 'TemporaryAddress2')
-    ElementTree.SubElement(root, 'TemporaryPOCode')
-    ElementTree.SubElement(root, 'TemporaryPOCity')
-    ElementTree.SubElement(root, 'TemporaryPOPostalcode')
-    ElementTree.SubElement(root, 'TemporaryCity')
-    ElementTree.SubElement(root, 'TemporaryPostalcode')
-    priority_name1 = ElementTree.SubElement(root, 'PriorityName1')
-    if contact.organization_name:
-        priority_name1.text = contact.organization_name
-    elif contact.name:
-        priority_name1.text = contact.name
-    ElementTree.SubElement(root, 'PriorityName2')
-    ElementTree.SubElement(root, 'PriorityName3')
-    ElementTree.SubElement(root, 'PriorityName4')
-    priority_address1 = ElementTree.SubElement(root, 'PriorityAddress1')
-    if contact.organization_address:
-        priority_address1.text = contact.organization_address
-    elif contact.address:
-        priority_address1.text = contact.address
-    ElementTree.SubElement(root, 'PriorityAddress2')
-    ElementTree.SubElement(root, 'PriorityPOCode')
-    ElementTree.SubElement(root, 'PriorityPOCity')
-    ElementTree.SubElement(root, 'PriorityPOPostalcode')
-    ElementTree.SubElement(root, 'PriorityCity')
-    ElementTree.SubElement(root, 'PriorityPostalcode')
-    ElementTree.SubElement(root, 'InfoCustomerID')
-    info_customer_yid = ElementTree.SubElement(root, 'InfoCustomerYID')
-    info_customer_yid.text = contact.organization_id if contact.organization_id else None
-    ElementTree.SubElement(root, 'InfoCustomerOVT')
-    info_name1 = ElementTree.SubElement(root, 'InfoName1')
-    if contact.organization_name:
-        info_name1.text = contact.organization_name
-    elif contact.name:
-        info_name1.text = contact.name
-    ElementTree.SubElement(root, 'InfoName2')
-    ElementTree.SubElement(root, 'InfoName3')
-    ElementTree.SubElement(root, 'InfoName4')
-    info_address1 = ElementTree.SubElement(root, 'InfoAddress1')
-    if contact.organization_address:
-        info_address1.text = contact.organization_address
-    elif contact.address:
-        info_address1.text = contact.address
-    ElementTree.SubElement(root, 'InfoAddress2')
-    ElementTree.SubElement(root, 'InfoPOCode')
-    ElementTree.SubElement(root, 'InfoPOCity')
-    ElementTree.SubElement(root, 'InfoPOPostalcode')
-    ElementTree.SubElement(root, 'InfoCity')
-    ElementTree.SubElement(root, 'InfoPostalcode')
+    business_id = values['{}.BusinessId'.format(tag_name)]
+    name = values['{}.Name'.format(tag_name)]
+    address = values['{}.Address'.format(tag_name)]
+
+    add_elements(root, ('SAPCustomerID', 'CustomerID'))
+    add_text_element(root, 'CustomerYID', business_id)
+    add_elements(root, ('CustomerOVT', 'TemporaryAddress1', 'TemporaryAddress2', 'TemporaryPOCode',
+                        'TemporaryPOCity', 'TemporaryPOPostalcode', 'TemporaryCity', 'TemporaryPostalcode'))
+    add_text_element(root, 'PriorityName1', name)
+    add_elements(root, ('PriorityName2', 'PriorityName3', 'PriorityName4'))
+    add_text_element(root, 'PriorityAddress1', address)
+    add_elements(root, ('PriorityAddress2', 'PriorityPOCode', 'PriorityPOCity', 'PriorityPOPostalcode',
+                        'PriorityCity', 'PriorityPostalcode', 'InfoCustomerID'))
+    add_text_element(root, 'InfoCustomerYID', business_id)
+    add_elements(root, ('InfoCustomerOVT',))
+    add_text_element(root, 'InfoName1', name)
+    add_elements(root, ('InfoName2', 'InfoName3', 'InfoName4'))
+    add_text_element(root, 'InfoAddress1', address)
+    add_elements(root, ('InfoAddress2', 'InfoPOCode', 'InfoPOCity', 'InfoPOPostalcode', 'InfoCity',
+                        'InfoPostalcode'))
 
     return root
 
 
-def get_laske_line_item(invoice):
+def build_line_item(values):
     line_item = ElementTree.Element('LineItem')
 
-    ElementTree.SubElement(line_item, 'GroupingFactor')
-    material = ElementTree.SubElement(line_item, 'Material')
-    material.text = 'TODO'
-    ElementTree.SubElement(line_item, 'MaterialDescription')
-    quantity = ElementTree.SubElement(line_item, 'Quantity')
-    quantity.text = '1,00'
-    ElementTree.SubElement(line_item, 'Unit')
-    net_price = ElementTree.SubElement(line_item, 'NetPrice')
-    net_price.text = '{:.2f}'.format(invoice.amount).replace('.', ',')
-    line_text_l1 = ElementTree.SubElement(line_item, 'LineTextL1')
-
-    lease = invoice.tenants.first().lease
-    lease_tenants = set(lease.tenants.all())
-    invoice_tenants = set(invoice.tenants.all())
-
-    if lease_tenants.difference(invoice_tenants):
-        names = [str(tenant.contact) for tenant in lease_tenants.difference(invoice_tenants)]
-        line_text_l1.text = 'Muita vuokraajia : {}'.format(', '.join(names))
-
-    ElementTree.SubElement(line_item, 'LineTextL2')
-    ElementTree.SubElement(line_item, 'LineTextL3')
-    line_text_l4 = ElementTree.SubElement(line_item, 'LineTextL4')
-    line_text_l4.text = '   Maksun suorittaminen: Maksu on suoritettava viimeistään eräpäivänä.'
-    line_text_l5 = ElementTree.SubElement(line_item, 'LineTextL5')
-    line_text_l5.text = ' Eräpäivän jälkeen peritään korkolain mukainen viivästyskorko ja'.format()
-    line_text_l6 = ElementTree.SubElement(line_item, 'LineTextL6')
-    line_text_l6.text = ' mahdollisista perimistoimenpiteistä perimispalkkio.'.format()
-    ElementTree.SubElement(line_item, 'ProfitCenter')
-    order_item_number = ElementTree.SubElement(line_item, 'OrderItemNumber')
-    order_item_number.text = 'TODO'
-    ElementTree.SubElement(line_item, 'WBS_Element')
-    ElementTree.SubElement(line_item, 'FunctionalArea')
-    ElementTree.SubElement(line_item, 'BusinessEntity')
-    ElementTree.SubElement(line_item, 'Building')
-    ElementTree.SubElement(line_item, 'RentalObject')
+    add_elements(line_item, ('GroupingFactor',))
+    add_text_element(line_item, 'Material', 'TODO')
+    add_elements(line_item, ('MaterialDescription',))
+    add_text_element(line_item, 'Quantity', '1,00')
+    add_elements(line_item, ('Unit',))
+    add_text_element(line_item, 'NetPrice', values['NetPrice'])
+    add_text_element(line_item, 'LineTextL1', values['LineTextL1'])
+    add_elements(line_item, ('LineTextL2', 'LineTextL3'))
+    add_text_element(line_item, 'LineTextL4',
+                     '   Maksun suorittaminen: Maksu on suoritettava viimeistään eräpäivänä.')
+    add_text_element(line_item, 'LineTextL5', ' Eräpäivän jälkeen peritään korkolain mukainen viivästyskorko ja')
+    add_text_element(line_item, 'LineTextL6', ' mahdollisista perimistoimenpiteistä perimispalkkio.')
+    add_elements(line_item, ('ProfitCenter',))
+    add_text_element(line_item, 'OrderItemNumber', 'TODO')
+    add_elements(line_item, ('WBS_Element', 'FunctionalArea', 'BusinessEntity', 'Building', 'RentalObject'))
 
     return line_item
+
+
+class TemplateFieldMarkers(dict):
+    """Values that mark every field with its name"""
+    def __missing__(self, name):
+        return '{0}{1}{0}'.format(TEMPLATE_FIELD_MARKER, name)
+
+
+class LaskeTemplate:
+    """An element serialized once with markers in place of its variable
+    fields
+
+    Rendering fills the fields between the precompiled static parts. The
+    output is the same as ElementTree.tostring(encoding='unicode') of the
+    element built with the values."""
+    field_pattern = re.compile('<(\\w+)>{0}([\\w.]+){0}</\\1>'.format(TEMPLATE_FIELD_MARKER))
+
+    def __init__(self, element):
+        parts = self.field_pattern.split(ElementTree.tostring(element, encoding='unicode'))
+        self.static_parts = parts[0::3]
+        self.fields = list(zip(parts[1::3], parts[2::3]))
+
+        if any(TEMPLATE_FIELD_MARKER in static_part for static_part in self.static_parts):
+            raise ValueError('A template field must be the only text of its element')
+
+    def render(self, values):
+        output = [self.static_parts[0]]
+
+        for (tag_name, name), static_part in zip(self.fields, self.static_parts[1:]):
+            value = values[name]
+            if value:
+                output.append('<{0}>{1}</{0}>'.format(tag_name, escape(value)))
+            else:
+                # ElementTree writes elements without text as empty elements
+                output.append('<{} />'.format(tag_name))
+            output.append(static_part)
+
+        return ''.join(output)
+
+
+@lru_cache(maxsize=1)
+def compile_sales_order_template(laske_values):
+    # The argument is only the cache key of the static LASKE_VALUES
+    return LaskeTemplate(build_sales_order(TemplateFieldMarkers()))
+
+
+def get_sales_order_template():
+    return compile_sales_order_template(tuple(sorted(getattr(settings, 'LASKE_VALUES', {}).items())))
+
+
+def get_year_rents(invoices, summaries):
+    """Returns the year rents of the leases of the invoices as a dict by
+    (lease id, year)
+
+    The year rents of the year of the billing summaries are read from the
+    summaries and the others are calculated."""
+    year_rents = {}
+    lease_ids_by_year = {}
+    for invoice in invoices:
+        summary = summaries.get(invoice.lease_id)
+        if summary is not None and summary.year == invoice.period_start_date.year:
+            year_rents[(invoice.lease_id, summary.year)] = summary.year_rent
+        else:
+            lease_ids_by_year.setdefault(invoice.period_start_date.year, set()).add(invoice.lease_id)
+
+    for year, lease_ids in lease_ids_by_year.items():
+        amounts = BatchRentCalculator(datetime.date(year, 1, 1), datetime.date(year, 12, 31)).calculate(lease_ids)
+        year_rents.update({(lease_id, year): amount for lease_id, amount in amounts.items()})
+
+    return year_rents
+
+
+class LaskeOutboxFile:
+    """A file of SBO_SalesOrder elements in the outbox
+
+    The elements are written to a temporary file as they come, so the memory
+    use doesn't grow with the number of the elements."""
+    def __init__(self, outbox_path, name):
+        self.path = Path(outbox_path) / name
+        self.temporary_path = Path(outbox_path) / '.{}.tmp'.format(name)
+        self.invoice_ids = []
+        self.file = open(str(self.temporary_path), 'w', encoding='utf-8')
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n<{}>\n'.format(LASKE_BATCH_ROOT_TAG))
+
+    def write(self, invoice, xml):
+        self.file.write(xml)
+        self.file.write('\n')
+        self.invoice_ids.append(invoice.id)
+
+    def close(self):
+        """Moves the complete file to the outbox and marks its invoices sent"""
+        self.file.write('</{}>\n'.format(LASKE_BATCH_ROOT_TAG))
+        self.file.close()
+
+        # The invoices stay unsent if the file can't be moved to the outbox
+        with transaction.atomic():
+            Invoice.objects.filter(id__in=self.invoice_ids).update(sent_to_sap_at=timezone.now())
+            os.replace(str(self.temporary_path), str(self.path))
+
+        return self.path
+
+
+def export_invoices(invoices, outbox_path=None, invoices_per_file=LASKE_INVOICES_PER_FILE,
+                    chunk_size=LASKE_CHUNK_SIZE):
+    """Writes the invoices of the queryset to files of at most
+    invoices_per_file sales orders in the outbox and marks them sent
+
+    The invoices are read in chunks of chunk_size invoices with their
+    leases, tenants and contacts prefetched and the billing summaries of
+    their leases read for each chunk. The invoices without a reference
+    number are skipped, as SAP requires one. Returns the paths of the
+    written files."""
+    outbox_path = Path(outbox_path or settings.LASKE_OUTBOX_ROOT)
+    os.makedirs(str(outbox_path), exist_ok=True)
+    file_name_prefix = 'laske_{:%Y%m%d%H%M%S}'.format(timezone.localtime(timezone.now()))
+    paths = []
+    outbox_file = None
+
+    queryset = invoices.exclude(reference_number__isnull=True).exclude(reference_number='').select_related(
+        *LASKE_SELECT_RELATED).order_by('id')
+
+    for chunk in iterate_prefetched_chunks(queryset, LASKE_PREFETCH_LOOKUPS, chunk_size):
+        summaries = get_billing_summaries({invoice.lease_id for invoice in chunk})
+        year_rents = get_year_rents(chunk, summaries)
+
+        for invoice in chunk:
+            if outbox_file is None:
+                outbox_file = LaskeOutboxFile(outbox_path, '{}_{:04}.xml'.format(file_name_prefix, len(paths) + 1))
+
+            year_rent = year_rents[(invoice.lease_id, invoice.period_start_date.year)]
+            outbox_file.write(invoice, render_invoice(invoice, year_rent, summaries[invoice.lease_id]))
+
+            if len(outbox_file.invoice_ids) >= invoices_per_file:
+                paths.append(outbox_file.close())
+                outbox_file = None
+
+    if outbox_file is not None:
+        paths.append(outbox_file.close())
+
+    return paths
@@ -1,53 +1,44 @@
-from decimal import Decimal
-
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from leasing.models import Invoice, Lease
+from leasing.billing import BILLING_CHUNK_SIZE, run_billing
+from leasing.models import BillingRun
 
 
 class Command(BaseCommand):
-    help = 'A Bogus Invoice creator'
+    help = 'Creates the invoices of the next billing period of the leases that have billing enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=parse_date, help='The invoices are created for the billing periods that '
+                                                            'start after this date (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=BILLING_CHUNK_SIZE,
+                            help='Number of leases to bill in one transaction (default: {})'.format(
+                                BILLING_CHUNK_SIZE))
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1)')
+        parser.add_argument('--resume', type=int, metavar='RUN_ID',
+                            help='Resume the billing run with this id from its last checkpoints')
+
+    def progress(self, totals, lease_count, elapsed):
+        self.stdout.write('{}/{} leases, {} invoices ({:.1f} leases/s)'.format(
+            totals['leases'], lease_count, totals['invoices'], totals['leases'] / elapsed if elapsed else 0))
 
     def handle(self, *args, **options):
-        now = timezone.localtime(timezone.now())
-
-        leases = Lease.objects.filter(is_billing_enabled=True)
-
-        for lease in leases:
-            next_billing_period = lease.get_next_billing_period_for_date(now.date())
-
-            amount = lease.get_rent_amount_for_period(*next_billing_period)
-
-            shares = {}
-            for tenant in lease.tenants.all():
-                if tenant.get_billing_contact() not in shares:
-                    shares[tenant.get_billing_contact()] = {
-                        'share': 0,
-                        'tenants': []
-                    }
-
-                shares[tenant.get_billing_contact()]['share'] += tenant.get_share()
-                shares[tenant.get_billing_contact()]['tenants'].append(tenant)
-
-            for contact, share in shares.items():
-                invoice_exists = Invoice.objects.filter(
-                    period_start_date=next_billing_period[0],
-                    period_end_date=next_billing_period[1],
-                    billing_contact=contact,
-                ).count()
-
-                if invoice_exists:
-                    continue
-
-                invoice = Invoice.objects.create(
-                    period_start_date=next_billing_period[0],
-                    period_end_date=next_billing_period[1],
-                    due_date=next_billing_period[0],
-                    amount=amount * Decimal(share['share']),
-                    billing_contact=contact,
-                )
-
-                invoice.tenants.set(share['tenants'])
-
-                invoice.create_reference_number()
+        if options['resume']:
+            try:
+                run = BillingRun.objects.get(pk=options['resume'])
+            except BillingRun.DoesNotExist:
+                raise CommandError('Billing run {} does not exist'.format(options['resume']))
+        else:
+            run = BillingRun.objects.create(date=options['date'] or timezone.localtime(timezone.now()).date(),
+                                            chunk_size=options['chunk_size'])
+
+        run_billing(run, workers=options['workers'], progress=self.progress if options['verbosity'] > 0 else None)
+
+        statistics = run.get_statistics()
+        self.stdout.write(
+            'Billing run {}: {}. {} invoices for {} leases in {:.1f} s ({:.1f} leases/s, {:.1f} invoices/s), '
+            '{} invoices already existed, {} failed chunks'.format(
+                run.id, run.state.label, statistics['invoices'], statistics['leases'], statistics['duration'],
+                statistics['leases_per_second'], statistics['invoices_per_second'], statistics['existing_invoices'],
+                statistics['errors']))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from leasing.ktj_cache import KtjPrintCache
+
+
+class Command(BaseCommand):
+    help = 'Removes the expired and the least recently read KTJ prints until the print cache fits in its size'
+
+    def handle(self, *args, **options):
+        removed_count = KtjPrintCache().evict()
+
+        self.stdout.write('Removed {} prints'.format(removed_count))
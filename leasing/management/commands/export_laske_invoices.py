@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from leasing.laske import LASKE_CHUNK_SIZE, LASKE_INVOICES_PER_FILE, export_invoices
+from leasing.models import Invoice
+
+
+class Command(BaseCommand):
+    help = 'Writes the invoices that have not been sent to SAP to LASKE XML files in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--outbox', help='Outbox directory (default: settings.LASKE_OUTBOX_ROOT)')
+        parser.add_argument('--invoices-per-file', type=int, default=LASKE_INVOICES_PER_FILE,
+                            help='Maximum number of invoices in a file (default: {})'.format(LASKE_INVOICES_PER_FILE))
+        parser.add_argument('--chunk-size', type=int, default=LASKE_CHUNK_SIZE,
+                            help='Number of invoices to read at a time (default: {})'.format(LASKE_CHUNK_SIZE))
+
+    def handle(self, *args, **options):
+        paths = export_invoices(Invoice.objects.filter(sent_to_sap_at__isnull=True), outbox_path=options['outbox'],
+                                invoices_per_file=options['invoices_per_file'], chunk_size=options['chunk_size'])
+
+        for path in paths:
+            self.stdout.write(str(path))
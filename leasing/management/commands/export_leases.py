@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from leasing.export import EXPORT_CHUNK_SIZE, EXPORT_CONTENT_TYPES, LeaseExporter
+from leasing.models import Lease
+
+
+class Command(BaseCommand):
+    help = 'Exports all the leases with their related items as JSON Lines or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=EXPORT_CONTENT_TYPES.keys(), default='jsonl',
+                            help='Export format (default: jsonl)')
+        parser.add_argument('--output', help='Output file (default: standard output)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='Number of leases to read at a time (default: {})'.format(EXPORT_CHUNK_SIZE))
+
+    def handle(self, *args, **options):
+        queryset = Lease.objects.order_by('id')
+        exporter = LeaseExporter(queryset, file_format=options['file_format'], chunk_size=options['chunk_size'])
+
+        if not options['output']:
+            for line in exporter.iterate_lines():
+                self.stdout.write(line, ending='')
+            return
+
+        # The csv module does its own newline translation
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output_file:
+            for line in exporter.iterate_lines():
+                output_file.write(line)
@@ -0,0 +1,23 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from leasing.rent_forecast import RENT_FORECAST_YEARS, get_forecast
+
+FORECAST_COLUMNS = ('year', 'municipality', 'district', 'intended_use', 'type', 'amount')
+
+
+class Command(BaseCommand):
+    help = 'Writes the projected rents by year, municipality, district, intended use and rent type as CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--first-year', type=int, help='The first year of the forecast (default: the next year)')
+        parser.add_argument('--years', type=int, default=RENT_FORECAST_YEARS,
+                            help='Number of years to forecast (default: {})'.format(RENT_FORECAST_YEARS))
+
+    def handle(self, *args, **options):
+        data_version, rows = get_forecast(options['first_year'], options['years'])
+
+        writer = csv.DictWriter(self.stdout, FORECAST_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
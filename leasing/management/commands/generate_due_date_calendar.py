@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from leasing.due_date_calendar import DUE_DATE_CALENDAR_CHUNK_SIZE, regenerate_due_date_calendar
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the due date calendar of all the rents for the current horizon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DUE_DATE_CALENDAR_CHUNK_SIZE,
+                            help='Number of leases to regenerate in one transaction (default: {})'.format(
+                                DUE_DATE_CALENDAR_CHUNK_SIZE))
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1)')
+
+    def progress(self, totals, lease_count, elapsed):
+        self.stdout.write('{}/{} leases, {} due dates ({:.1f} leases/s)'.format(
+            totals['leases'], lease_count, totals['due_dates'], totals['leases'] / elapsed if elapsed else 0))
+
+    def handle(self, *args, **options):
+        start_time = time.monotonic()
+
+        totals = regenerate_due_date_calendar(chunk_size=options['chunk_size'], workers=options['workers'],
+                                              progress=self.progress if options['verbosity'] > 0 else None)
+
+        self.stdout.write('Created {} due dates for {} leases in {:.1f} s'.format(
+            totals['due_dates'], totals['leases'], time.monotonic() - start_time))
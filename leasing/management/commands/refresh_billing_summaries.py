@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from leasing.billing_summary import BILLING_SUMMARY_CHUNK_SIZE, refresh_stale_billing_summaries
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the stale billing summaries of the leases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='The year of the year rents (default: the current year)')
+        parser.add_argument('--chunk-size', type=int, default=BILLING_SUMMARY_CHUNK_SIZE,
+                            help='Number of leases to refresh in one transaction (default: {})'.format(
+                                BILLING_SUMMARY_CHUNK_SIZE))
+        parser.add_argument('--all', action='store_true', dest='refresh_all',
+                            help='Refresh all the summaries and not only the stale ones')
+
+    def progress(self, refreshed_count, lease_count):
+        self.stdout.write('{}/{} leases'.format(refreshed_count, lease_count))
+
+    def handle(self, *args, **options):
+        start_time = time.monotonic()
+
+        count = refresh_stale_billing_summaries(year=options['year'], chunk_size=options['chunk_size'],
+                                                refresh_all=options['refresh_all'],
+                                                progress=self.progress if options['verbosity'] > 0 else None)
+
+        self.stdout.write('Refreshed the billing summaries of {} leases in {:.1f} s'.format(
+            count, time.monotonic() - start_time))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from leasing.rent_regeneration import REGENERATION_CHUNK_SIZE, regenerate_rents
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the index adjusted and payable rents of the index rents for a rent year'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='The rent year. The rents are adjusted with the index of the '
+                                                     'previous year. (default: the current year)')
+        parser.add_argument('--chunk-size', type=int, default=REGENERATION_CHUNK_SIZE,
+                            help='Number of leases to regenerate in one transaction (default: {})'.format(
+                                REGENERATION_CHUNK_SIZE))
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes (default: 1)')
+
+    def progress(self, totals, lease_count, elapsed):
+        self.stdout.write('{}/{} leases, {} rents ({:.1f} leases/s)'.format(
+            totals['leases'], lease_count, totals['rents'], totals['leases'] / elapsed if elapsed else 0))
+
+    def handle(self, *args, **options):
+        year = options['year'] or timezone.localtime(timezone.now()).year
+        start_time = time.monotonic()
+
+        totals = regenerate_rents(year, chunk_size=options['chunk_size'], workers=options['workers'],
+                                  progress=self.progress if options['verbosity'] > 0 else None)
+
+        self.stdout.write('Created {} index adjusted rents and {} payable rents for {} rents of {} leases in '
+                          '{:.1f} s'.format(totals['index_adjusted_rents'], totals['payable_rents'], totals['rents'],
+                                            totals['leases'], time.monotonic() - start_time))
@@ -0,0 +1,43 @@
+# Generated by Django 2.0.4 on 2026-10-17 06:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_sequences(apps, schema_editor):
+    LeaseIdentifier = apps.get_model('leasing', 'LeaseIdentifier')
+    LeaseIdentifierSequence = apps.get_model('leasing', 'LeaseIdentifierSequence')
+
+    max_sequences = LeaseIdentifier.objects.values('type', 'municipality', 'district').annotate(
+        max_sequence=models.Max('sequence')).order_by()
+
+    LeaseIdentifierSequence.objects.bulk_create([
+        LeaseIdentifierSequence(type_id=row['type'], municipality_id=row['municipality'],
+                                district_id=row['district'], last_sequence=row['max_sequence'])
+        for row in max_sequences
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0013_add_basis_of_rent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaseIdentifierSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_sequence', models.PositiveIntegerField(default=0, verbose_name='Last sequence number')),
+                ('district', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='leasing.District', verbose_name='District')),
+                ('municipality', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='leasing.Municipality', verbose_name='Municipality')),
+                ('type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='leasing.LeaseType', verbose_name='Lease type')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaseidentifiersequence',
+            unique_together={('type', 'municipality', 'district')},
+        ),
+        migrations.RunPython(create_sequences, migrations.RunPython.noop),
+    ]
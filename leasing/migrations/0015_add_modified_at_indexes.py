@@ -0,0 +1,25 @@
+# Generated by Django 2.0.4 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0014_add_lease_identifier_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['modified_at', 'id'], name='leasing_com_modified_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['modified_at', 'id'], name='leasing_con_modified_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lease',
+            index=models.Index(fields=['modified_at', 'id'], name='leasing_lea_modified_id_idx'),
+        ),
+    ]
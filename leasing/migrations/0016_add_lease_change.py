@@ -0,0 +1,37 @@
+# Generated by Django 2.0.4 on 2026-10-17 06:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_lease_changes(apps, schema_editor):
+    Lease = apps.get_model('leasing', 'Lease')
+    LeaseChange = apps.get_model('leasing', 'LeaseChange')
+
+    # The manager of the historical model returns the soft deleted leases too
+    LeaseChange.objects.bulk_create([
+        LeaseChange(lease_id=lease_id, changed_at=modified_at, deleted=deleted is not None)
+        for (lease_id, modified_at, deleted) in Lease.objects.values_list('id', 'modified_at', 'deleted')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0015_add_modified_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaseChange',
+            fields=[
+                ('lease', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='leasing.Lease', verbose_name='Lease')),
+                ('changed_at', models.DateTimeField(db_index=True, verbose_name='Time changed')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Deleted')),
+            ],
+            options={
+                'ordering': ('changed_at', 'lease_id'),
+            },
+        ),
+        migrations.RunPython(create_lease_changes, migrations.RunPython.noop),
+    ]
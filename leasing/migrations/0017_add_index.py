@@ -0,0 +1,54 @@
+# Generated by Django 2.0.4 on 2026-10-17 06:58
+
+import django.core.validators
+from django.db import migrations, models
+import enumfields.fields
+import leasing.enums
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0016_add_lease_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Index',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', enumfields.fields.EnumField(enum=leasing.enums.IndexType, max_length=30, verbose_name='Index type')),
+                ('number', models.PositiveIntegerField(verbose_name='Index point number')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('month', models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(12)], verbose_name='Month')),
+            ],
+            options={
+                'verbose_name': 'Index',
+                'verbose_name_plural': 'Indexes',
+                'ordering': ('type', '-year', '-month'),
+            },
+        ),
+        migrations.CreateModel(
+            name='IndexFactor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', enumfields.fields.EnumField(enum=leasing.enums.IndexType, max_length=30, verbose_name='Index type')),
+                ('base_index', models.PositiveIntegerField(verbose_name='Base index')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('rounding', models.PositiveSmallIntegerField(verbose_name='Rounding')),
+                ('factor', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='Factor')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='indexfactor',
+            unique_together={('type', 'base_index', 'year', 'rounding')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='index',
+            unique_together={('type', 'year', 'month')},
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX leasing_index_yearly_uniq ON leasing_index (type, year) WHERE month IS NULL',
+            'DROP INDEX leasing_index_yearly_uniq',
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.0.4 on 2026-10-17 07:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0017_add_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Time created')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Time modified')),
+                ('period_start_date', models.DateField(verbose_name='Period start date')),
+                ('period_end_date', models.DateField(verbose_name='Period end date')),
+                ('due_date', models.DateField(verbose_name='Due date')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Amount')),
+                ('reference_number', models.CharField(blank=True, max_length=20, null=True, verbose_name='Reference number')),
+                ('billing_contact', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='invoices', to='leasing.Contact', verbose_name='Billing contact')),
+            ],
+            options={
+                'verbose_name': 'Invoice',
+                'verbose_name_plural': 'Invoices',
+            },
+        ),
+        migrations.AddField(
+            model_name='lease',
+            name='is_billing_enabled',
+            field=models.BooleanField(default=False, verbose_name='Is billing enabled'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='lease',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='invoices', to='leasing.Lease', verbose_name='Lease'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='tenants',
+            field=models.ManyToManyField(related_name='invoices', to='leasing.Tenant', verbose_name='Tenants'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='invoice',
+            unique_together={('lease', 'billing_contact', 'period_start_date', 'period_end_date')},
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.0.4 on 2026-10-17 07:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import enumfields.fields
+import leasing.enums
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0018_add_invoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Time created')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Time modified')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('chunk_size', models.PositiveIntegerField(verbose_name='Chunk size')),
+                ('state', enumfields.fields.EnumField(default='running', enum=leasing.enums.BillingRunState, max_length=30, verbose_name='State')),
+                ('duration', models.FloatField(default=0, verbose_name='Duration')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Time finished')),
+            ],
+            options={
+                'verbose_name': 'Billing run',
+                'verbose_name_plural': 'Billing runs',
+                'ordering': ('-created_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='BillingRunChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_lease_id', models.PositiveIntegerField(verbose_name='First lease id')),
+                ('last_lease_id', models.PositiveIntegerField(verbose_name='Last lease id')),
+                ('lease_count', models.PositiveIntegerField(default=0, verbose_name='Lease count')),
+                ('invoice_count', models.PositiveIntegerField(default=0, verbose_name='Invoice count')),
+                ('existing_invoice_count', models.PositiveIntegerField(default=0, verbose_name='Existing invoice count')),
+                ('duration', models.FloatField(verbose_name='Duration')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Time created')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='leasing.BillingRun', verbose_name='Billing run')),
+            ],
+            options={
+                'verbose_name': 'Billing run chunk',
+                'verbose_name_plural': 'Billing run chunks',
+                'ordering': ('run', 'first_lease_id'),
+            },
+        ),
+    ]
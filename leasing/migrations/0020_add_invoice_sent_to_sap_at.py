@@ -0,0 +1,18 @@
+# Generated by Django 2.0.4 on 2026-10-17 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0019_add_billing_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='sent_to_sap_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Sent to SAP at'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.0.4 on 2026-10-17 07:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0020_add_invoice_sent_to_sap_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaseBillingSummary',
+            fields=[
+                ('lease', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='billing_summary', serialize=False, to='leasing.Lease', verbose_name='Lease')),
+                ('identifier', models.CharField(max_length=255, verbose_name='Lease identifier')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('year_rent', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Year rent')),
+                ('real_property_unit_identifiers', models.TextField(blank=True, verbose_name='Real property unit identifiers')),
+                ('addresses', models.TextField(blank=True, verbose_name='Addresses')),
+                ('intended_use', models.CharField(blank=True, max_length=255, null=True, verbose_name='Intended use')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Time refreshed')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.0.4 on 2026-10-17 07:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0021_add_lease_billing_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarDueDate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_date', models.DateField(db_index=True, verbose_name='Due date')),
+                ('period_start_date', models.DateField(verbose_name='Billing period start date')),
+                ('period_end_date', models.DateField(verbose_name='Billing period end date')),
+                ('lease', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='leasing.Lease', verbose_name='Lease')),
+                ('rent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_due_dates', to='leasing.Rent', verbose_name='Rent')),
+            ],
+            options={
+                'ordering': ('due_date', 'rent_id'),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.4 on 2026-10-17 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0022_add_calendar_due_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='indexadjustedrent',
+            name='factor',
+            field=models.DecimalField(decimal_places=4, max_digits=12, verbose_name='Factor'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.0.4 on 2026-10-17 08:16
+
+from django.db import migrations, models
+
+
+def assign_versions(apps, schema_editor):
+    LeaseChange = apps.get_model('leasing', 'LeaseChange')
+
+    # The existing changes have all been committed, so they share the first
+    # version. The counter is created from it on the next commit.
+    LeaseChange.objects.update(version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0023_widen_index_adjusted_rent_factor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaseChangeVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_version', models.BigIntegerField(default=0, verbose_name='Last version')),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='leasechange',
+            options={'ordering': ('version', 'lease_id')},
+        ),
+        migrations.AddField(
+            model_name='leasechange',
+            name='version',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True, verbose_name='Version'),
+        ),
+        migrations.RunPython(assign_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.4 on 2026-10-17 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0024_add_lease_change_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leasebillingsummary',
+            name='lease_version',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Lease change version'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.4 on 2026-10-17 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leasing', '0025_add_billing_summary_lease_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingrunchunk',
+            name='is_retried',
+            field=models.BooleanField(default=False, verbose_name='Is retried'),
+        ),
+    ]
@@ -5,13 +5,15 @@ from .contact import Contact
 from .contract import Contract, ContractChange, ContractType, MortgageDocument
 from .decision import Condition, ConditionType, Decision, DecisionMaker, DecisionType
 from .inspection import Inspection
+from .invoice import BillingRun, BillingRunChunk, Invoice
 from .land_area import ConstructabilityDescription, LeaseArea, PlanUnit, PlanUnitState, PlanUnitType, Plot
 from .lease import (
-    District, Financing, Hitas, IntendedUse, Lease, LeaseIdentifier, LeaseStateLog, LeaseType, Management, Municipality,
-    NoticePeriod, Regulation, RelatedLease, StatisticalUse, SupportiveHousing)
+    District, Financing, Hitas, IntendedUse, Lease, LeaseBillingSummary, LeaseChange, LeaseChangeVersion,
+    LeaseIdentifier, LeaseIdentifierSequence, LeaseStateLog, LeaseType, Management, Municipality, NoticePeriod,
+    Regulation, RelatedLease, StatisticalUse, SupportiveHousing)
 from .rent import (
-    ContractRent, FixedInitialYearRent, IndexAdjustedRent, LeaseBasisOfRent, PayableRent, Rent, RentAdjustment,
-    RentDueDate, RentIntendedUse)
+    CalendarDueDate, ContractRent, FixedInitialYearRent, Index, IndexAdjustedRent, IndexFactor, LeaseBasisOfRent,
+    PayableRent, Rent, RentAdjustment, RentDueDate, RentIntendedUse)
 from .tenant import Tenant, TenantContact
 
 __all__ = [
@@ -20,6 +22,9 @@ __all__ = [
     'BasisOfRentPlotType',
     'BasisOfRentPropertyIdentifier',
     'BasisOfRentRate',
+    'BillingRun',
+    'BillingRunChunk',
+    'CalendarDueDate',
     'Comment',
     'CommentTopic',
     'Condition',
@@ -37,13 +42,20 @@ __all__ = [
     'Financing',
     'FixedInitialYearRent',
     'Hitas',
+    'Index',
     'IndexAdjustedRent',
+    'IndexFactor',
     'Inspection',
+    'Invoice',
     'IntendedUse',
     'Lease',
     'LeaseArea',
     'LeaseBasisOfRent',
+    'LeaseBillingSummary',
+    'LeaseChange',
+    'LeaseChangeVersion',
     'LeaseIdentifier',
+    'LeaseIdentifierSequence',
     'LeaseStateLog',
     'LeaseType',
     'Management',
@@ -29,6 +29,10 @@ class Comment(TimeStampedSafeDeleteModel):
 
     class Meta:
         ordering = ('-created_at', )
+        indexes = [
+            # For the cursor pagination
+            models.Index(fields=['modified_at', 'id'], name='leasing_com_modified_id_idx'),
+        ]
 
 
 auditlog.register(Comment)
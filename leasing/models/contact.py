@@ -66,6 +66,12 @@ class Contact(TimeStampedSafeDeleteModel):
     # In Finnish: Onko vuokranantaja
     is_lessor = models.BooleanField(verbose_name=_("Is a lessor"), default=False)
 
+    class Meta:
+        indexes = [
+            # For the cursor pagination
+            models.Index(fields=['modified_at', 'id'], name='leasing_con_modified_id_idx'),
+        ]
+
     def __str__(self):
         if self.is_business:
             return self.business_name
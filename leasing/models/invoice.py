@@ -0,0 +1,134 @@
+from auditlog.registry import auditlog
+from django.db import models
+from django.db.models import Count, Q, Sum
+from django.utils.translation import ugettext_lazy as _
+from enumfields import EnumField
+
+from leasing.enums import BillingRunState
+
+from .contact import Contact
+from .mixins import TimeStampedModel
+from .tenant import Tenant
+
+
+class Invoice(TimeStampedModel):
+    """
+    In Finnish: Lasku
+    """
+    lease = models.ForeignKey('leasing.Lease', verbose_name=_("Lease"), related_name='invoices',
+                              on_delete=models.PROTECT)
+
+    # In Finnish: Laskunsaaja
+    billing_contact = models.ForeignKey(Contact, verbose_name=_("Billing contact"), related_name='invoices',
+                                        on_delete=models.PROTECT)
+
+    # In Finnish: Vuokralaiset
+    tenants = models.ManyToManyField(Tenant, verbose_name=_("Tenants"), related_name='invoices')
+
+    # In Finnish: Laskutuskauden alkupvm
+    period_start_date = models.DateField(verbose_name=_("Period start date"))
+
+    # In Finnish: Laskutuskauden loppupvm
+    period_end_date = models.DateField(verbose_name=_("Period end date"))
+
+    # In Finnish: Eräpäivä
+    due_date = models.DateField(verbose_name=_("Due date"))
+
+    # In Finnish: Laskun summa
+    amount = models.DecimalField(verbose_name=_("Amount"), max_digits=10, decimal_places=2)
+
+    # In Finnish: Viitenumero
+    reference_number = models.CharField(verbose_name=_("Reference number"), null=True, blank=True, max_length=20)
+
+    # In Finnish: Lähetetty SAP:iin
+    sent_to_sap_at = models.DateTimeField(verbose_name=_("Sent to SAP at"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Invoice")
+        verbose_name_plural = _("Invoices")
+        # A billing contact is billed only once for a billing period of a lease
+        unique_together = ('lease', 'billing_contact', 'period_start_date', 'period_end_date')
+
+
+class BillingRun(TimeStampedModel):
+    """
+    In Finnish: Laskutusajo
+
+    The journal of a run of leasing.billing.create_invoices. The run is
+    checkpointed with a BillingRunChunk for every range of leases, so an
+    interrupted run can be resumed.
+    """
+    # In Finnish: Laskutuspäivä
+    date = models.DateField(verbose_name=_("Date"))
+
+    chunk_size = models.PositiveIntegerField(verbose_name=_("Chunk size"))
+
+    state = EnumField(BillingRunState, verbose_name=_("State"), default=BillingRunState.RUNNING, max_length=30)
+
+    # The seconds spent in the run, which can have been resumed several times
+    duration = models.FloatField(verbose_name=_("Duration"), default=0)
+
+    finished_at = models.DateTimeField(verbose_name=_("Time finished"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Billing run")
+        verbose_name_plural = _("Billing runs")
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return '{} ({})'.format(self.date, self.state)
+
+    def get_statistics(self):
+        """Returns the totals of the chunks and the throughput of the run as a
+        dict"""
+        statistics = self.chunks.aggregate(
+            leases=Sum('lease_count'), invoices=Sum('invoice_count'), existing_invoices=Sum('existing_invoice_count'),
+            errors=Count('id', filter=Q(error__isnull=False, is_retried=False)))
+        statistics = {key: value or 0 for key, value in statistics.items()}
+
+        statistics['duration'] = self.duration
+        statistics['leases_per_second'] = statistics['leases'] / self.duration if self.duration else 0
+        statistics['invoices_per_second'] = statistics['invoices'] / self.duration if self.duration else 0
+
+        return statistics
+
+
+class BillingRunChunk(models.Model):
+    """
+    A processed range of leases in a billing run
+
+    A chunk without an error is committed in the same transaction as its
+    invoices. A failed chunk is recorded with its error and is processed
+    again when the run is resumed. When the resumed run has processed all
+    the remaining leases, the failed chunk is marked retried: its leases
+    are then either in a completed chunk or in a new failed chunk.
+    """
+    run = models.ForeignKey(BillingRun, verbose_name=_("Billing run"), related_name='chunks',
+                            on_delete=models.CASCADE)
+
+    first_lease_id = models.PositiveIntegerField(verbose_name=_("First lease id"))
+
+    last_lease_id = models.PositiveIntegerField(verbose_name=_("Last lease id"))
+
+    lease_count = models.PositiveIntegerField(verbose_name=_("Lease count"), default=0)
+
+    invoice_count = models.PositiveIntegerField(verbose_name=_("Invoice count"), default=0)
+
+    existing_invoice_count = models.PositiveIntegerField(verbose_name=_("Existing invoice count"), default=0)
+
+    # In seconds
+    duration = models.FloatField(verbose_name=_("Duration"))
+
+    error = models.TextField(verbose_name=_("Error"), null=True, blank=True)
+
+    is_retried = models.BooleanField(verbose_name=_("Is retried"), default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Time created"))
+
+    class Meta:
+        verbose_name = _("Billing run chunk")
+        verbose_name_plural = _("Billing run chunks")
+        ordering = ('run', 'first_lease_id')
+
+
+auditlog.register(Invoice)
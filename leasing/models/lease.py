@@ -1,12 +1,15 @@
 from auditlog.registry import auditlog
-from django.db import models, transaction
-from django.db.models import Max
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from enumfields import EnumField
 
+from leasing.calculation import get_lease_rent_amount_for_period, get_next_billing_period_for_date
 from leasing.enums import Classification, LeaseRelationType, LeaseState, NoticePeriodType
 from leasing.models import Contact
 from leasing.models.mixins import NameModel, TimeStampedModel, TimeStampedSafeDeleteModel
+from leasing.utils import OnCommitBatch
 
 
 class LeaseType(NameModel):
@@ -147,6 +150,57 @@ class LeaseIdentifier(TimeStampedSafeDeleteModel):
         return '{}{}{:02}-{}'.format(self.type.id, self.municipality.id, self.district.identifier, self.sequence)
 
 
+class LeaseIdentifierSequenceManager(models.Manager):
+    def allocate(self, type, municipality, district, count=1):
+        """Reserves count consecutive sequence numbers for the lease identifiers
+        of the type, municipality and district, and returns the first of them
+
+        The counter row stays locked until the end of the transaction, so
+        concurrent allocations for the same combination wait for each other
+        instead of racing for the same numbers. Allocations for other
+        combinations are not blocked."""
+        counter = self.filter(type=type, municipality=municipality, district=district)
+
+        with transaction.atomic():
+            if not counter.update(last_sequence=F('last_sequence') + count):
+                self._create_counter(type, municipality, district)
+                counter.update(last_sequence=F('last_sequence') + count)
+
+            last_sequence = counter.values_list('last_sequence', flat=True).get()
+
+        return last_sequence - count + 1
+
+    def _create_counter(self, type, municipality, district):
+        # The counter starts from the largest sequence already in use, including
+        # the ones of the deleted identifiers as they are still unique.
+        max_sequence = LeaseIdentifier.all_objects.filter(
+            type=type,
+            municipality=municipality,
+            district=district).aggregate(Max('sequence'))['sequence__max']
+
+        try:
+            with transaction.atomic():
+                self.create(type=type, municipality=municipality, district=district,
+                            last_sequence=max_sequence or 0)
+        except IntegrityError:
+            # Another transaction created the counter first
+            pass
+
+
+class LeaseIdentifierSequence(models.Model):
+    """Counter of the last used lease identifier sequence number of a type,
+    municipality and district combination"""
+    type = models.ForeignKey(LeaseType, verbose_name=_("Lease type"), on_delete=models.PROTECT)
+    municipality = models.ForeignKey(Municipality, verbose_name=_("Municipality"), on_delete=models.PROTECT)
+    district = models.ForeignKey(District, verbose_name=_("District"), on_delete=models.PROTECT)
+    last_sequence = models.PositiveIntegerField(verbose_name=_("Last sequence number"), default=0)
+
+    objects = LeaseIdentifierSequenceManager()
+
+    class Meta:
+        unique_together = ('type', 'municipality', 'district')
+
+
 class Lease(TimeStampedSafeDeleteModel):
     """
     In Finnish: Vuokraus
@@ -190,6 +244,9 @@ class Lease(TimeStampedSafeDeleteModel):
     # In Finnish: Irtisanomisilmoituksen selite
     notice_note = models.TextField(verbose_name=_("Notice note"), null=True, blank=True)
 
+    # In Finnish: Laskutus käynnissä
+    is_billing_enabled = models.BooleanField(verbose_name=_("Is billing enabled"), default=False)
+
     # Relations
     # In Finnish: Vuokranantaja
     lessor = models.ForeignKey(Contact, verbose_name=_("Lessor"), null=True, blank=True, on_delete=models.PROTECT)
@@ -227,6 +284,12 @@ class Lease(TimeStampedSafeDeleteModel):
     related_leases = models.ManyToManyField('self', through='leasing.RelatedLease', symmetrical=False,
                                             related_name='related_to')
 
+    class Meta:
+        indexes = [
+            # For the cursor pagination
+            models.Index(fields=['modified_at', 'id'], name='leasing_lea_modified_id_idx'),
+        ]
+
     def __str__(self):
         return self.get_identifier_string()
 
@@ -244,22 +307,22 @@ class Lease(TimeStampedSafeDeleteModel):
         if not self.type or not self.municipality or not self.district:
             return
 
-        max_sequence = LeaseIdentifier.objects.filter(
-            type=self.type,
-            municipality=self.municipality,
-            district=self.district).aggregate(Max('sequence'))['sequence__max']
-
-        if not max_sequence:
-            max_sequence = 0
+        sequence = LeaseIdentifierSequence.objects.allocate(self.type, self.municipality, self.district)
 
         lease_identifier = LeaseIdentifier.objects.create(
             type=self.type,
             municipality=self.municipality,
             district=self.district,
-            sequence=max_sequence + 1)
+            sequence=sequence)
 
         self.identifier = lease_identifier
 
+    def get_rent_amount_for_period(self, start_date, end_date):
+        return get_lease_rent_amount_for_period(self, start_date, end_date)
+
+    def get_next_billing_period_for_date(self, date):
+        return get_next_billing_period_for_date(self, date)
+
     def save(self, *args, **kwargs):
         self.create_identifier()
 
@@ -280,5 +343,135 @@ class RelatedLease(TimeStampedSafeDeleteModel):
     end_date = models.DateField(verbose_name=_("End date"), null=True, blank=True)
 
 
+class LeaseChangeManager(models.Manager):
+    def record(self, lease_ids, deleted=False):
+        """Marks the leases changed now
+
+        Updates the existing rows with one query and creates the missing ones.
+        The changes get their version when the transaction commits."""
+        lease_ids = set(lease_ids)
+        if not lease_ids:
+            return
+
+        changed_at = timezone.now()
+        values = {'changed_at': changed_at, 'deleted': deleted, 'version': None}
+
+        if self.filter(lease_id__in=lease_ids).update(**values) != len(lease_ids):
+            missing_ids = lease_ids - set(self.filter(lease_id__in=lease_ids).values_list('lease_id', flat=True))
+
+            for lease_id in missing_ids:
+                try:
+                    # A concurrent transaction may have created the row
+                    with transaction.atomic():
+                        self.create(lease_id=lease_id, **values)
+                except IntegrityError:
+                    self.filter(lease_id=lease_id).update(**values)
+
+        pending_lease_changes.add(lease_ids, using=self.db)
+
+    def assign_versions(self):
+        """Gives the next version to the changes that have no version yet and
+        returns the number of the changes
+
+        Called when a transaction that has recorded changes commits. The
+        changes left without a version, e.g. by a process that stopped
+        before its callback, get the version of the next commit."""
+        with transaction.atomic(using=self.db):
+            version = LeaseChangeVersion.objects.allocate()
+
+            return self.filter(version__isnull=True).update(version=version)
+
+
+def assign_lease_change_versions(lease_ids):
+    LeaseChange.objects.assign_versions()
+
+
+# The changes recorded in the transaction get their version when it commits
+pending_lease_changes = OnCommitBatch(assign_lease_change_versions)
+
+
+class LeaseChange(models.Model):
+    """The latest change to a lease or to any of its related items
+
+    One row per lease, kept up to date by the signal receivers in
+    leasing.signals. The row is kept when the lease is deleted, so that
+    it can be reported to the clients as a tombstone.
+
+    The version orders the changes by the commits of their transactions:
+    the changes of a transaction get the same version after it has
+    committed, and a later commit gets a greater version. A change has no
+    version until then."""
+    lease = models.OneToOneField(Lease, verbose_name=_("Lease"), primary_key=True, related_name='+',
+                                 db_constraint=False, on_delete=models.DO_NOTHING)
+    changed_at = models.DateTimeField(verbose_name=_("Time changed"), db_index=True)
+    deleted = models.BooleanField(verbose_name=_("Deleted"), default=False)
+    version = models.BigIntegerField(verbose_name=_("Version"), null=True, blank=True, db_index=True)
+
+    objects = LeaseChangeManager()
+
+    class Meta:
+        ordering = ('version', 'lease_id')
+
+
+# The primary key of the only row of LeaseChangeVersion
+LEASE_CHANGE_VERSION_COUNTER_ID = 1
+
+
+class LeaseChangeVersionManager(models.Manager):
+    def allocate(self):
+        """Reserves the next version of the lease changes and returns it
+
+        The counter row stays locked until the end of the transaction, so
+        the versions are allocated one transaction at a time and a version
+        is committed before the next one is allocated."""
+        counter = self.filter(pk=LEASE_CHANGE_VERSION_COUNTER_ID)
+
+        with transaction.atomic(using=self.db):
+            if not counter.update(last_version=F('last_version') + 1):
+                self._create_counter()
+                counter.update(last_version=F('last_version') + 1)
+
+            return counter.values_list('last_version', flat=True).get()
+
+    def _create_counter(self):
+        # The counter starts from the largest version already in use
+        max_version = LeaseChange.objects.aggregate(Max('version'))['version__max']
+
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(pk=LEASE_CHANGE_VERSION_COUNTER_ID, last_version=max_version or 0)
+        except IntegrityError:
+            # Another transaction created the counter first
+            pass
+
+
+class LeaseChangeVersion(models.Model):
+    """Counter of the last allocated version of the lease changes
+
+    There is only one row."""
+    last_version = models.BigIntegerField(verbose_name=_("Last version"), default=0)
+
+    objects = LeaseChangeVersionManager()
+
+
+class LeaseBillingSummary(models.Model):
+    """The values of a lease that the invoice texts and the list view show
+
+    Denormalized from the lease and its related items by
+    leasing.billing_summary. A summary is stale when the version of the
+    LeaseChange of the lease is greater than the lease version of the
+    summary or missing, or when the summary is of an earlier year."""
+    lease = models.OneToOneField(Lease, verbose_name=_("Lease"), primary_key=True, related_name='billing_summary',
+                                 on_delete=models.CASCADE)
+    identifier = models.CharField(verbose_name=_("Lease identifier"), max_length=255)
+    year = models.PositiveSmallIntegerField(verbose_name=_("Year"))
+    year_rent = models.DecimalField(verbose_name=_("Year rent"), max_digits=12, decimal_places=2)
+    real_property_unit_identifiers = models.TextField(verbose_name=_("Real property unit identifiers"), blank=True)
+    addresses = models.TextField(verbose_name=_("Addresses"), blank=True)
+    intended_use = models.CharField(verbose_name=_("Intended use"), null=True, blank=True, max_length=255)
+    refreshed_at = models.DateTimeField(verbose_name=_("Time refreshed"))
+    lease_version = models.BigIntegerField(verbose_name=_("Lease change version"), null=True, blank=True)
+
+
 auditlog.register(Lease)
 auditlog.register(RelatedLease)
@@ -1,15 +1,21 @@
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
 from auditlog.registry import auditlog
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils.translation import ugettext_lazy as _
 from enumfields import EnumField
 
+from leasing.calculation import get_billing_periods_for_year, get_rent_amount_for_period
 from leasing.enums import (
     DueDatesType, IndexType, PeriodType, RentAdjustmentAmountType, RentAdjustmentType, RentCycle, RentType)
 
 from .decision import Decision
 from .mixins import NameModel, TimeStampedSafeDeleteModel
 
+DEFAULT_INDEX_ROUNDING = 2
+
 
 class RentIntendedUse(NameModel):
     """
@@ -68,6 +74,12 @@ class Rent(TimeStampedSafeDeleteModel):
 
     is_active = models.BooleanField(verbose_name=_("Active?"), default=True)
 
+    def get_amount_for_period(self, start_date, end_date):
+        return get_rent_amount_for_period(self, start_date, end_date)
+
+    def get_billing_periods_for_year(self, year):
+        return get_billing_periods_for_year(self, year)
+
 
 class RentDueDate(TimeStampedSafeDeleteModel):
     """
@@ -78,6 +90,23 @@ class RentDueDate(TimeStampedSafeDeleteModel):
     month = models.IntegerField(verbose_name=_("Month"), validators=[MinValueValidator(1), MaxValueValidator(12)])
 
 
+class CalendarDueDate(models.Model):
+    """A due date of a rent in the due date calendar
+
+    The calendar is materialized from the billing periods of the rents by
+    leasing.due_date_calendar, so the rents that fall due in a date range
+    are found with an index range scan."""
+    rent = models.ForeignKey(Rent, verbose_name=_("Rent"), related_name='calendar_due_dates',
+                             on_delete=models.CASCADE)
+    lease = models.ForeignKey('leasing.Lease', verbose_name=_("Lease"), related_name='+', on_delete=models.CASCADE)
+    due_date = models.DateField(verbose_name=_("Due date"), db_index=True)
+    period_start_date = models.DateField(verbose_name=_("Billing period start date"))
+    period_end_date = models.DateField(verbose_name=_("Billing period end date"))
+
+    class Meta:
+        ordering = ('due_date', 'rent_id')
+
+
 class FixedInitialYearRent(TimeStampedSafeDeleteModel):
     """
     In Finnish: Kiinteä alkuvuosivuokra
@@ -127,6 +156,150 @@ class ContractRent(TimeStampedSafeDeleteModel):
     end_date = models.DateField(verbose_name=_("End date"), null=True, blank=True)
 
 
+class IndexManager(models.Manager):
+    def get_yearly_numbers(self, keys):
+        """Returns the yearly point numbers of the (index type, year) keys as a
+        dict
+
+        If there is no yearly number, the average of the monthly numbers is
+        used when all twelve of them are available. Keys without a number are
+        left out."""
+        keys = set(keys)
+        if not keys:
+            return {}
+
+        indexes = self.filter(type__in={index_type for (index_type, year) in keys},
+                              year__in={year for (index_type, year) in keys})
+        yearly_numbers = {}
+        monthly_numbers = defaultdict(list)
+
+        for (index_type, year, month, number) in indexes.values_list('type', 'year', 'month', 'number'):
+            if (index_type, year) not in keys:
+                continue
+
+            if month is None:
+                yearly_numbers[(index_type, year)] = number
+            else:
+                monthly_numbers[(index_type, year)].append(number)
+
+        for key, numbers in monthly_numbers.items():
+            if key not in yearly_numbers and len(numbers) == 12:
+                yearly_numbers[key] = int((Decimal(sum(numbers)) / 12).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+        return yearly_numbers
+
+
+class Index(models.Model):
+    """
+    In Finnish: Indeksi
+
+    The point number of an index for a month, or for a whole year if the
+    month is empty.
+    """
+    type = EnumField(IndexType, verbose_name=_("Index type"), max_length=30)
+
+    # In Finnish: Pisteluku
+    number = models.PositiveIntegerField(verbose_name=_("Index point number"))
+
+    year = models.PositiveSmallIntegerField(verbose_name=_("Year"))
+
+    month = models.PositiveSmallIntegerField(verbose_name=_("Month"), null=True, blank=True,
+                                             validators=[MinValueValidator(1), MaxValueValidator(12)])
+
+    objects = IndexManager()
+
+    class Meta:
+        verbose_name = _("Index")
+        verbose_name_plural = _("Indexes")
+        ordering = ('type', '-year', '-month')
+        # The yearly numbers have no month, so their uniqueness is enforced
+        # by a partial unique index that is created in the migration
+        unique_together = ('type', 'year', 'month')
+
+    def __str__(self):
+        if self.month:
+            return '{} {}/{}: {}'.format(self.type, self.month, self.year, self.number)
+
+        return '{} {}: {}'.format(self.type, self.year, self.number)
+
+
+def calculate_index_factor(number, base_index, rounding):
+    """Returns the index point number divided by the base index, rounded half
+    up to the given number of decimals"""
+    return (Decimal(number) / Decimal(base_index)).quantize(Decimal(1).scaleb(-rounding), rounding=ROUND_HALF_UP)
+
+
+class IndexFactorManager(models.Manager):
+    def get_factors(self, keys):
+        """Returns the factors of the (index type, base index, year, rounding)
+        keys as a dict
+
+        The cached factors are read with one query. The missing ones are
+        calculated from the yearly index numbers and added to the cache with
+        one query. Keys without a base index or an index number for the year
+        are left out. A rounding of None is DEFAULT_INDEX_ROUNDING decimals."""
+        keys = {(index_type, base_index, year, DEFAULT_INDEX_ROUNDING if rounding is None else rounding)
+                for (index_type, base_index, year, rounding) in keys if base_index}
+        if not keys:
+            return {}
+
+        cached_factors = self.filter(type__in={key[0] for key in keys}, base_index__in={key[1] for key in keys},
+                                     year__in={key[2] for key in keys})
+        factors = {}
+
+        for (index_type, base_index, year, rounding, factor) in cached_factors.values_list(
+                'type', 'base_index', 'year', 'rounding', 'factor'):
+            if (index_type, base_index, year, rounding) in keys:
+                factors[(index_type, base_index, year, rounding)] = factor
+
+        missing_keys = keys - set(factors)
+        if not missing_keys:
+            return factors
+
+        numbers = Index.objects.get_yearly_numbers((key[0], key[2]) for key in missing_keys)
+        new_factors = [
+            IndexFactor(type=index_type, base_index=base_index, year=year, rounding=rounding,
+                        factor=calculate_index_factor(numbers[(index_type, year)], base_index, rounding))
+            for (index_type, base_index, year, rounding) in missing_keys if (index_type, year) in numbers
+        ]
+
+        try:
+            with transaction.atomic():
+                self.bulk_create(new_factors)
+        except IntegrityError:
+            # A concurrent call has cached some of the same factors. The
+            # factors are deterministic, so the calculated ones are used.
+            pass
+
+        factors.update({(factor.type, factor.base_index, factor.year, factor.rounding): factor.factor
+                        for factor in new_factors})
+
+        return factors
+
+
+class IndexFactor(models.Model):
+    """
+    Cached index factors. The rows are deleted when the index numbers of their
+    year change.
+    """
+    type = EnumField(IndexType, verbose_name=_("Index type"), max_length=30)
+
+    # In Finnish: Perusindeksi
+    base_index = models.PositiveIntegerField(verbose_name=_("Base index"))
+
+    year = models.PositiveSmallIntegerField(verbose_name=_("Year"))
+
+    # In Finnish: Pyöristys
+    rounding = models.PositiveSmallIntegerField(verbose_name=_("Rounding"))
+
+    factor = models.DecimalField(verbose_name=_("Factor"), max_digits=12, decimal_places=4)
+
+    objects = IndexFactorManager()
+
+    class Meta:
+        unique_together = ('type', 'base_index', 'year', 'rounding')
+
+
 class IndexAdjustedRent(models.Model):
     """
     In Finnish: Indeksitarkistettu vuokra
@@ -147,7 +320,7 @@ class IndexAdjustedRent(models.Model):
     end_date = models.DateField(verbose_name=_("End date"))
 
     # In Finnish: Laskentak.
-    factor = models.DecimalField(verbose_name=_("Factor"), max_digits=10, decimal_places=2)
+    factor = models.DecimalField(verbose_name=_("Factor"), max_digits=12, decimal_places=4)
 
 
 class RentAdjustment(TimeStampedSafeDeleteModel):
@@ -0,0 +1,96 @@
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class OptionalCountLimitOffsetPagination(LimitOffsetPagination):
+    """LimitOffsetPagination that can skip the count query
+
+    With ?count=false the total count is not queried and returned as null.
+    Instead, one extra row is fetched to find out if there is a next page."""
+    count_query_param = 'count'
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() not in ('false', '0')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.include_count(request):
+            return super().paginate_queryset(queryset, request, view=view)
+
+        self.count = None
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.request = request
+
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+
+        return results[:self.limit]
+
+    def get_next_link(self):
+        if self.count is not None:
+            return super().get_next_link()
+
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+
+class ModifiedAtCursorPagination(CursorPagination):
+    """Cursor pagination in the order of modification
+
+    The position in the table is kept in the cursor, so the pages are fetched
+    without OFFSET scans and count queries. Suitable for walking through the
+    whole table, e.g. when syncing changes."""
+    ordering = ('modified_at', 'id')
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+
+class LeaseChangeCursorPagination(ModifiedAtCursorPagination):
+    ordering = ('version', 'lease_id')
+
+
+class CursorOrLimitOffsetPagination(BasePagination):
+    """Uses cursor pagination when the cursor is given or it is requested with
+    ?pagination=cursor, and OptionalCountLimitOffsetPagination otherwise"""
+    pagination_query_param = 'pagination'
+    limit_offset_pagination_class = OptionalCountLimitOffsetPagination
+    cursor_pagination_class = ModifiedAtCursorPagination
+
+    def __init__(self):
+        self.paginator = self.limit_offset_pagination_class()
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
+
+    def use_cursor(self, request):
+        return (self.cursor_pagination_class.cursor_query_param in request.query_params or
+                request.query_params.get(self.pagination_query_param) == 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.paginator = self.cursor_pagination_class()
+
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    def get_schema_fields(self, view):
+        return (self.limit_offset_pagination_class().get_schema_fields(view) +
+                [field for field in self.cursor_pagination_class().get_schema_fields(view)
+                 if field.name == self.cursor_pagination_class.cursor_query_param])
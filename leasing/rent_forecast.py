@@ -0,0 +1,99 @@
+"""Rent forecasts
+
+Projects the rent income of the coming calendar years by municipality,
+district, intended use and rent type. The rents of each year are
+calculated from the current rent data with the batch rent calculation, so
+e.g. the index rents are projected with their contract rents for the
+years that have no index adjusted rents yet.
+
+A forecast is cached in the Django cache by the data version, i.e. the
+version of the latest committed change in the lease change feed. Every
+save and delete of a lease or of its rents updates the feed, and the
+change gets a greater version when it commits, so a cached forecast is
+used until some lease changes. A forecast calculated in a transaction
+that has changes not committed yet has no data version and is not cached."""
+import datetime
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from leasing.batch_calculation import BATCH_CHUNK_SIZE, BatchRentCalculator, load_columns
+from leasing.models import Lease, LeaseChange
+
+RENT_FORECAST_YEARS = 5
+
+RENT_FORECAST_MAX_YEARS = 20
+
+RENT_FORECAST_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_data_version():
+    """Returns the version of the latest lease change as a string, or None if
+    some changes have no version yet"""
+    versions = LeaseChange.objects.aggregate(latest_version=Max('version'),
+                                             pending_count=Count('lease_id', filter=Q(version__isnull=True)))
+    if versions['pending_count']:
+        return None
+
+    return str(versions['latest_version']) if versions['latest_version'] else ''
+
+
+def get_forecast_key(row):
+    year, municipality_id, district_id, intended_use_id, rent_type = row
+
+    return year, municipality_id, district_id, intended_use_id is not None, intended_use_id or 0, rent_type.value
+
+
+def calculate_forecast(first_year, year_count=RENT_FORECAST_YEARS, chunk_size=BATCH_CHUNK_SIZE):
+    """Returns the projected rents of the years as a list of dicts of year,
+    municipality, district, intended_use, type and amount
+
+    The leases are calculated in chunks of chunk_size leases."""
+    years = range(first_year, first_year + year_count)
+    calculators = [(year, BatchRentCalculator(datetime.date(year, 1, 1), datetime.date(year, 12, 31)))
+                   for year in years]
+    lease_ids = list(Lease.objects.filter(rents__is_active=True).order_by('id').values_list('id', flat=True).distinct())
+    amounts = {}
+
+    for chunk_start in range(0, len(lease_ids), chunk_size):
+        chunk_lease_ids = lease_ids[chunk_start:chunk_start + chunk_size]
+        leases = load_columns(Lease.objects.filter(id__in=chunk_lease_ids), ('id', 'municipality_id', 'district_id'))
+        locations = dict(zip(leases['id'], zip(leases['municipality_id'], leases['district_id'])))
+
+        for year, calculator in calculators:
+            for (lease_id, rent_type, use_amounts) in calculator.calculate_intended_use_rents(
+                    chunk_lease_ids).values():
+                for intended_use_id, amount in use_amounts.items():
+                    key = (year,) + locations[lease_id] + (intended_use_id, rent_type)
+                    amounts[key] = amounts.get(key, 0) + amount
+
+    return [{
+        'year': year,
+        'municipality': municipality_id,
+        'district': district_id,
+        'intended_use': intended_use_id,
+        'type': rent_type.value,
+        'amount': amount,
+    } for (year, municipality_id, district_id, intended_use_id, rent_type), amount in sorted(
+        amounts.items(), key=lambda item: get_forecast_key(item[0])) if amount]
+
+
+def get_forecast(first_year=None, year_count=RENT_FORECAST_YEARS):
+    """Returns the data version and the rows of calculate_forecast from the
+    cache, calculating them if the cache has none for the data version
+
+    The first year defaults to the next year."""
+    first_year = first_year or timezone.localtime(timezone.now()).year + 1
+    data_version = get_data_version()
+    if data_version is None:
+        return data_version, calculate_forecast(first_year, year_count)
+
+    cache_key = 'rent_forecast:{}:{}:{}'.format(data_version, first_year, year_count)
+
+    rows = cache.get(cache_key)
+    if rows is None:
+        rows = calculate_forecast(first_year, year_count)
+        cache.set(cache_key, rows, RENT_FORECAST_CACHE_TIMEOUT)
+
+    return data_version, rows
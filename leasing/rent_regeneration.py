@@ -0,0 +1,178 @@
+"""Regeneration of the index adjusted and payable rents
+
+When the index numbers of a year are published, the index adjusted rents
+and the payable rents of every index rent are recalculated for the rent
+year that starts in the following year. The index adjusted rent of each
+contract rent is its yearly base amount times the index factor of the
+rent, and the payable rent is the rent calculated for the rent year.
+
+The leases are processed in ranges of lease ids, each in its own
+transaction that replaces the earlier rows of the rent year with bulk
+queries. The ranges can be processed in parallel worker processes.
+Regenerating is idempotent, so an interrupted run can simply be started
+again."""
+import datetime
+import time
+from collections import Counter
+from fractions import Fraction
+
+from django.db import transaction
+from django.db.models import Q
+
+from leasing.batch_calculation import BatchRentCalculator, load_columns
+from leasing.calculation import get_cycle_year_start, round_to_cents
+from leasing.enums import PeriodType, RentCycle, RentType
+from leasing.models import ContractRent, IndexAdjustedRent, IndexFactor, LeaseChange, PayableRent, Rent
+from leasing.utils import add_months, get_id_ranges, get_range_overlap, map_in_processes
+
+REGENERATION_CHUNK_SIZE = 500
+
+
+def get_rent_year(cycle, year):
+    """Returns the (start, end) of the rent cycle year that starts in the year"""
+    start_date = get_cycle_year_start(cycle or RentCycle.JANUARY_TO_DECEMBER, datetime.date(year, 12, 31))
+
+    return start_date, add_months(start_date, 12) - datetime.timedelta(days=1)
+
+
+def get_previous_rent_year(rent_year):
+    start_date = rent_year[0]
+
+    return add_months(start_date, -12), start_date - datetime.timedelta(days=1)
+
+
+def get_difference_percent(amount, previous_amount):
+    if not previous_amount:
+        return round_to_cents(0)
+
+    return round_to_cents(Fraction(amount - previous_amount) * 100 / Fraction(previous_amount))
+
+
+def get_index_rents(year):
+    """Returns the active index rents of the leases that haven't ended before
+    the year"""
+    return Rent.objects.filter(
+        Q(lease__end_date__isnull=True) | Q(lease__end_date__gte=datetime.date(year, 1, 1)),
+        type=RentType.INDEX, is_active=True, lease__deleted__isnull=True)
+
+
+def get_index_adjusted_rents(year, rents, rent_years):
+    """Returns the unsaved index adjusted rents of the rent year for the
+    contract rents of the rents"""
+    # The rents of a year are adjusted with the index of the previous year
+    factor_keys = {
+        rent_id: (index_type, elementary_index, year - 1, index_rounding)
+        for (rent_id, index_type, elementary_index, index_rounding) in zip(
+            rents['id'], rents['index_type'], rents['elementary_index'], rents['index_rounding'])
+        if index_type and elementary_index
+    }
+    factors = IndexFactor.objects.get_factors(factor_keys.values())
+    rent_factors = {rent_id: factors[key] for rent_id, key in factor_keys.items() if key in factors}
+
+    field_names = ('rent_id', 'intended_use_id', 'base_amount', 'base_amount_period', 'start_date', 'end_date')
+    contract_rents = load_columns(ContractRent.objects.filter(rent_id__in=list(rent_factors)), field_names)
+    index_adjusted_rents = []
+
+    for (rent_id, intended_use_id, base_amount, base_amount_period, start_date, end_date) in zip(
+            *(contract_rents[field_name] for field_name in field_names)):
+        (rent_year_start, rent_year_end) = rent_years[rent_id]
+        overlap = get_range_overlap(rent_year_start, rent_year_end, start_date, end_date)
+        if overlap is None:
+            continue
+
+        yearly_amount = base_amount * 12 if base_amount_period == PeriodType.PER_MONTH else base_amount
+        index_adjusted_rents.append(IndexAdjustedRent(
+            rent_id=rent_id,
+            intended_use_id=intended_use_id,
+            amount=round_to_cents(Fraction(yearly_amount) * Fraction(rent_factors[rent_id])),
+            start_date=overlap[0],
+            end_date=overlap[1],
+            factor=rent_factors[rent_id],
+        ))
+
+    return index_adjusted_rents
+
+
+def get_payable_rents(year, rents, rent_years):
+    """Returns the unsaved payable rents of the rent year for the rents"""
+    lease_ids = set(rents['lease_id'])
+    calendar_year = (datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+    date_ranges = {calendar_year} | set(rent_years.values()) | set(map(get_previous_rent_year, rent_years.values()))
+    # The (lease id, amount) of the rents by date range and rent id
+    amounts = {date_range: BatchRentCalculator(*date_range).calculate_rents(lease_ids)[1]
+               for date_range in date_ranges}
+    payable_rents = []
+
+    for rent_id in rents['id']:
+        rent_year = rent_years[rent_id]
+        amount = amounts[rent_year][rent_id][1]
+
+        payable_rents.append(PayableRent(
+            rent_id=rent_id,
+            amount=amount,
+            start_date=rent_year[0],
+            end_date=rent_year[1],
+            difference_percent=get_difference_percent(amount, amounts[get_previous_rent_year(rent_year)][rent_id][1]),
+            calendar_year_rent=amounts[calendar_year][rent_id][1],
+        ))
+
+    return payable_rents
+
+
+def regenerate_lease_range(year, first_lease_id, last_lease_id):
+    """Regenerates the index adjusted and payable rents of the rent year for
+    the index rents of the leases in the id range in one transaction
+
+    Returns the numbers of the processed leases and rents and the created
+    rows as a Counter."""
+    rents = load_columns(
+        get_index_rents(year).filter(lease_id__gte=first_lease_id, lease_id__lte=last_lease_id).order_by('id'),
+        ('id', 'lease_id', 'cycle', 'index_type', 'elementary_index', 'index_rounding'))
+    rent_years = {rent_id: get_rent_year(cycle, year) for (rent_id, cycle) in zip(rents['id'], rents['cycle'])}
+
+    with transaction.atomic():
+        for (start_date, end_date) in set(rent_years.values()):
+            rent_ids = [rent_id for rent_id, rent_year in rent_years.items() if rent_year == (start_date, end_date)]
+            # The change feed is updated once below, so the rows are deleted
+            # without fetching them for the delete signals
+            for model in (IndexAdjustedRent, PayableRent):
+                queryset = model.objects.filter(rent_id__in=rent_ids, start_date__gte=start_date,
+                                                start_date__lte=end_date)
+                queryset._raw_delete(queryset.db)
+
+        # The payable rents are calculated from the new index adjusted rents
+        index_adjusted_rents = IndexAdjustedRent.objects.bulk_create(
+            get_index_adjusted_rents(year, rents, rent_years))
+        payable_rents = PayableRent.objects.bulk_create(get_payable_rents(year, rents, rent_years))
+
+        # bulk_create doesn't send the signals that update the change feed
+        LeaseChange.objects.record(rents['lease_id'])
+
+    return Counter({
+        'leases': len(set(rents['lease_id'])),
+        'rents': len(rents['id']),
+        'index_adjusted_rents': len(index_adjusted_rents),
+        'payable_rents': len(payable_rents),
+    })
+
+
+def regenerate_rents(year, chunk_size=REGENERATION_CHUNK_SIZE, workers=1, progress=None):
+    """Regenerates the index adjusted and payable rents of the rent year for
+    all the index rents
+
+    The leases are processed in ranges of chunk_size leases. With more than
+    one worker the ranges are divided between that many forked processes.
+    The optional progress function is called after every range with the
+    totals so far, the number of the leases to process and the elapsed
+    seconds. Returns the totals as a Counter."""
+    lease_ids = list(get_index_rents(year).order_by('lease_id').values_list('lease_id', flat=True).distinct())
+    arguments = [(year,) + id_range for id_range in get_id_ranges(lease_ids, chunk_size)]
+    totals = Counter()
+    start_time = time.monotonic()
+
+    for result in map_in_processes(regenerate_lease_range, arguments, workers):
+        totals.update(result)
+        if progress:
+            progress(totals, len(lease_ids), time.monotonic() - start_time)
+
+    return totals
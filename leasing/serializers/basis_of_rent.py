@@ -34,7 +34,8 @@ class BasisOfRentRateSerializer(EnumSupportSerializerMixin, serializers.ModelSer
     id = serializers.IntegerField(required=False)
     intended_use = InstanceDictPrimaryKeyRelatedField(instance_class=RentIntendedUse,
                                                       queryset=RentIntendedUse.objects.all(),
-                                                      related_serializer=RentIntendedUseSerializer)
+                                                      related_serializer=RentIntendedUseSerializer,
+                                                      bulk_resolve=True)
 
     class Meta:
         model = BasisOfRentRate
@@ -18,7 +18,7 @@ class CommentSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
     user = UserSerializer(read_only=True, default=serializers.CurrentUserDefault())
     topic = InstanceDictPrimaryKeyRelatedField(instance_class=CommentTopic, queryset=CommentTopic.objects.all(),
-                                               related_serializer=CommentTopicSerializer)
+                                               related_serializer=CommentTopicSerializer, bulk_resolve=True)
 
     class Meta:
         model = Comment
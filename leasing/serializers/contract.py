@@ -54,7 +54,7 @@ class ContractSerializer(serializers.ModelSerializer):
 class ContractCreateUpdateSerializer(UpdateNestedMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     type = InstanceDictPrimaryKeyRelatedField(instance_class=ContractType, queryset=ContractType.objects.all(),
-                                              related_serializer=ContractTypeSerializer)
+                                              related_serializer=ContractTypeSerializer, bulk_resolve=True)
     decision = InstanceDictPrimaryKeyRelatedField(instance_class=Decision,
                                                   queryset=Decision.objects.all(),
                                                   related_serializer=DecisionSerializer,
@@ -21,8 +21,8 @@ class ConditionSerializer(serializers.ModelSerializer):
 class ConditionCreateUpdateSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     type = InstanceDictPrimaryKeyRelatedField(instance_class=ConditionType, queryset=ConditionType.objects.filter(),
-                                              related_serializer=ConditionTypeSerializer, required=False,
-                                              allow_null=True)
+                                              related_serializer=ConditionTypeSerializer, bulk_resolve=True,
+                                              required=False, allow_null=True)
 
     class Meta:
         model = Condition
@@ -58,12 +58,13 @@ class DecisionCreateUpdateNestedSerializer(UpdateNestedMixin, serializers.ModelS
     """
     id = serializers.IntegerField(required=False)
     type = InstanceDictPrimaryKeyRelatedField(instance_class=DecisionType, queryset=DecisionType.objects.filter(),
-                                              related_serializer=DecisionTypeSerializer, required=False,
-                                              allow_null=True)
+                                              related_serializer=DecisionTypeSerializer, bulk_resolve=True,
+                                              required=False, allow_null=True)
     conditions = ConditionCreateUpdateSerializer(many=True, required=False, allow_null=True)
     decision_maker = InstanceDictPrimaryKeyRelatedField(instance_class=DecisionMaker,
                                                         queryset=DecisionMaker.objects.filter(),
                                                         related_serializer=DecisionMakerSerializer,
+                                                        bulk_resolve=True,
                                                         required=False,
                                                         allow_null=True)
 
@@ -81,6 +82,7 @@ class DecisionCreateUpdateSerializer(UpdateNestedMixin, serializers.ModelSeriali
     decision_maker = InstanceDictPrimaryKeyRelatedField(instance_class=DecisionMaker,
                                                         queryset=DecisionMaker.objects.filter(),
                                                         related_serializer=DecisionMakerSerializer,
+                                                        bulk_resolve=True,
                                                         required=False,
                                                         allow_null=True)
 
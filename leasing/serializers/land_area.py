@@ -34,10 +34,11 @@ class PlanUnitSerializer(EnumSupportSerializerMixin, serializers.ModelSerializer
 class PlanUnitCreateUpdateSerializer(EnumSupportSerializerMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     plan_unit_type = InstanceDictPrimaryKeyRelatedField(
-        instance_class=PlanUnitType, queryset=PlanUnitType.objects.filter(), related_serializer=PlanUnitTypeSerializer)
+        instance_class=PlanUnitType, queryset=PlanUnitType.objects.filter(), related_serializer=PlanUnitTypeSerializer,
+        bulk_resolve=True)
     plan_unit_state = InstanceDictPrimaryKeyRelatedField(
         instance_class=PlanUnitState, queryset=PlanUnitState.objects.filter(),
-        related_serializer=PlanUnitTypeSerializer)
+        related_serializer=PlanUnitTypeSerializer, bulk_resolve=True)
 
     class Meta:
         model = PlanUnit
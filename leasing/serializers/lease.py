@@ -1,9 +1,16 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import CharField, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.expressions import Case
+from django.db.models.functions import Concat
+from django.utils import timezone
 from enumfields.drf import EnumSupportSerializerMixin
 from rest_framework import serializers
 
+from ..billing_summary import get_fresh_billing_summaries, get_summary_year
+from ..enums import TenantContactType
 from ..models import (
-    Contact, District, Financing, Hitas, IntendedUse, Lease, LeaseIdentifier, LeaseType, Management, Municipality,
-    NoticePeriod, Regulation, StatisticalUse, SupportiveHousing)
+    Contact, District, Financing, Hitas, IntendedUse, Lease, LeaseArea, LeaseChange, LeaseIdentifier, LeaseType,
+    Management, Municipality, NoticePeriod, Regulation, StatisticalUse, SupportiveHousing, TenantContact)
 from .contact import ContactSerializer
 from .contract import ContractCreateUpdateSerializer, ContractSerializer
 from .decision import DecisionCreateUpdateNestedSerializer, DecisionSerializer
@@ -11,7 +18,7 @@ from .inspection import InspectionSerializer
 from .land_area import LeaseAreaCreateUpdateSerializer, LeaseAreaSerializer
 from .rent import LeaseBasisOfRentSerializer, RentCreateUpdateSerializer, RentSerializer
 from .tenant import TenantCreateUpdateSerializer, TenantSerializer
-from .utils import InstanceDictPrimaryKeyRelatedField, NameModelSerializer, UpdateNestedMixin
+from .utils import FieldSelectionMixin, InstanceDictPrimaryKeyRelatedField, NameModelSerializer, UpdateNestedMixin
 
 
 class DistrictSerializer(serializers.ModelSerializer):
@@ -86,7 +93,7 @@ class LeaseIdentifierSerializer(serializers.ModelSerializer):
         fields = ('type', 'municipality', 'district', 'sequence')
 
 
-class LeaseSerializer(EnumSupportSerializerMixin, serializers.ModelSerializer):
+class LeaseSerializer(FieldSelectionMixin, EnumSupportSerializerMixin, serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
     identifier = LeaseIdentifierSerializer(read_only=True)
     tenants = TenantSerializer(many=True, required=False, allow_null=True)
@@ -103,6 +110,74 @@ class LeaseSerializer(EnumSupportSerializerMixin, serializers.ModelSerializer):
         fields = '__all__'
 
 
+class LeaseListSerializer(FieldSelectionMixin, EnumSupportSerializerMixin, serializers.ModelSerializer):
+    """Compact representation of a lease for the list view
+
+    The tenant names, the area totals and the year rent of the billing
+    summary are annotated to the queryset by annotate_queryset, so the leases
+    are serialized without any additional queries. The year rent is of the
+    current year, and it is null while the billing summary of the lease for
+    the current year is missing or stale."""
+    identifier = serializers.SerializerMethodField()
+    tenant_names = serializers.ReadOnlyField()
+    area_total = serializers.ReadOnlyField()
+    section_area_total = serializers.ReadOnlyField()
+    year_rent = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Lease
+        fields = ('id', 'identifier', 'type', 'municipality', 'district', 'start_date', 'end_date', 'state',
+                  'tenant_names', 'area_total', 'section_area_total', 'year_rent')
+
+    @staticmethod
+    def annotate_queryset(queryset):
+        today = timezone.now().date()
+
+        tenant_names = TenantContact.objects.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=today),
+            tenant__lease=OuterRef('pk'),
+            tenant__deleted__isnull=True,
+            type=TenantContactType.TENANT,
+        ).order_by().values('tenant__lease').annotate(names=StringAgg(Case(
+            When(contact__is_business=True, then=F('contact__business_name')),
+            default=Concat('contact__first_name', Value(' '), 'contact__last_name'),
+            output_field=CharField(),
+        ), delimiter=', ')).values('names')
+
+        lease_areas = LeaseArea.objects.filter(lease=OuterRef('pk')).order_by().values('lease')
+
+        billing_summaries = get_fresh_billing_summaries(get_summary_year()).filter(lease=OuterRef('pk'))
+
+        return queryset.select_related(None).annotate(
+            identifier_type_id=F('identifier__type_id'),
+            identifier_municipality_id=F('identifier__municipality_id'),
+            identifier_district_identifier=F('identifier__district__identifier'),
+            identifier_sequence=F('identifier__sequence'),
+            district_identifier=F('district__identifier'),
+            tenant_names=Subquery(tenant_names, output_field=CharField()),
+            area_total=Subquery(lease_areas.annotate(total=Sum('area')).values('total'),
+                                output_field=IntegerField()),
+            section_area_total=Subquery(lease_areas.annotate(total=Sum('section_area')).values('total'),
+                                        output_field=IntegerField()),
+            year_rent=Subquery(billing_summaries.values('year_rent'),
+                               output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+
+    def get_identifier(self, obj):
+        """Same as Lease.get_identifier_string but uses the annotated values"""
+        if obj.identifier_id:
+            return '{}{}{:02}-{}'.format(obj.identifier_type_id, obj.identifier_municipality_id,
+                                         obj.identifier_district_identifier, obj.identifier_sequence)
+
+        return '{}{}{:02}-'.format(obj.type_id, obj.municipality_id, obj.district_identifier)
+
+
+class LeaseChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LeaseChange
+        fields = ('lease', 'version', 'changed_at', 'deleted')
+
+
 class LeaseCreateUpdateSerializer(UpdateNestedMixin, EnumSupportSerializerMixin, serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
     identifier = LeaseIdentifierSerializer(read_only=True)
@@ -34,7 +34,8 @@ class ContractRentSerializer(EnumSupportSerializerMixin, serializers.ModelSerial
     id = serializers.IntegerField(required=False)
     intended_use = InstanceDictPrimaryKeyRelatedField(instance_class=RentIntendedUse,
                                                       queryset=RentIntendedUse.objects.all(),
-                                                      related_serializer=RentIntendedUseSerializer)
+                                                      related_serializer=RentIntendedUseSerializer,
+                                                      bulk_resolve=True)
 
     class Meta:
         model = ContractRent
@@ -64,7 +65,8 @@ class RentAdjustmentSerializer(EnumSupportSerializerMixin, serializers.ModelSeri
                                                   related_serializer=DecisionSerializer, required=False)
     intended_use = InstanceDictPrimaryKeyRelatedField(instance_class=RentIntendedUse,
                                                       queryset=RentIntendedUse.objects.all(),
-                                                      related_serializer=RentIntendedUseSerializer)
+                                                      related_serializer=RentIntendedUseSerializer,
+                                                      bulk_resolve=True)
 
     class Meta:
         model = RentAdjustment
@@ -110,9 +112,20 @@ class LeaseBasisOfRentSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     intended_use = InstanceDictPrimaryKeyRelatedField(instance_class=RentIntendedUse,
                                                       queryset=RentIntendedUse.objects.all(),
-                                                      related_serializer=RentIntendedUseSerializer)
+                                                      related_serializer=RentIntendedUseSerializer,
+                                                      bulk_resolve=True)
 
     class Meta:
         model = LeaseBasisOfRent
         fields = ('id', 'intended_use', 'floor_m2', 'index', 'amount_per_floor_m2_index_100',
                   'amount_per_floor_m2_index', 'percent', 'year_rent_index_100', 'year_rent_index')
+
+
+class RentForecastSerializer(serializers.Serializer):
+    """A row of leasing.rent_forecast.calculate_forecast"""
+    year = serializers.IntegerField()
+    municipality = serializers.IntegerField()
+    district = serializers.IntegerField()
+    intended_use = serializers.IntegerField(allow_null=True)
+    type = serializers.CharField()
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2)
@@ -1,28 +1,77 @@
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 
-from django.core.exceptions import ObjectDoesNotExist
+from auditlog.registry import auditlog
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.fields import empty
+from rest_framework.utils import model_meta
+from safedelete.config import SOFT_DELETE
+from safedelete.signals import post_softdelete, pre_softdelete
+
+from leasing.bulk import BULK_BATCH_SIZE, bulk_update, copy_instance, get_log_entries, save_log_entries
 
 
 class InstanceDictPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
     """
     Like PrimaryKeyRelatedField but the id can be alternatively supplied inside a model instance or a dict.
+
+    When a related_serializer is given, the related instance is serialized with it. If the related
+    instance is already loaded (e.g. by select_related or prefetch_related) it is used as is. Otherwise
+    the instance is fetched by its primary key. With bulk_resolve=True all the objects in the queryset
+    are fetched with a single query the first time they are needed and reused for the rest of the
+    serializer pass, both when validating and when serializing. That is meant for small lookup tables
+    that are referenced by many rows.
     """
 
     def __init__(self, *args, **kwargs):
         self.instance_class = kwargs.pop('instance_class', None)
         self.related_serializer = kwargs.pop('related_serializer', None)
+        self.bulk_resolve = kwargs.pop('bulk_resolve', False)
 
         super().__init__(**kwargs)
 
+    def get_attribute(self, instance):
+        if self.related_serializer and len(self.source_attrs) == 1 and isinstance(instance, models.Model):
+            try:
+                field = instance._meta.get_field(self.source_attrs[0])
+            except FieldDoesNotExist:
+                field = None
+
+            if field is not None and field.many_to_one and field.is_cached(instance):
+                return getattr(instance, field.name)
+
+        return super().get_attribute(instance)
+
     def to_representation(self, obj):
         if self.related_serializer and hasattr(obj, 'pk') and obj.pk:
-            obj = self.get_queryset().get(pk=obj.pk)
+            if not isinstance(obj, models.Model):
+                obj = self.resolve_instance(obj.pk)
+
             return self.related_serializer(obj, context=self.context).to_representation(obj)
 
         return super().to_representation(obj)
 
+    def resolve_instance(self, pk):
+        if not self.bulk_resolve:
+            return self.get_queryset().get(pk=pk)
+
+        # The resolved instances are kept in the context of the root
+        # serializer so that they are shared during the serializer pass.
+        cache = self.context.setdefault('_instance_dict_cache', {})
+        cache_key = id(self.queryset)
+
+        if cache_key not in cache:
+            cache[cache_key] = self.get_queryset().in_bulk()
+
+        if pk in cache[cache_key]:
+            return cache[cache_key][pk]
+
+        return self.get_queryset().get(pk=pk)
+
     def to_internal_value(self, value):
         pk = value
 
@@ -32,6 +81,14 @@ class InstanceDictPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
         if self.instance_class and isinstance(value, self.instance_class):
             pk = value.id
 
+        if self.bulk_resolve and self.pk_field is None:
+            try:
+                return self.resolve_instance(pk)
+            except ObjectDoesNotExist:
+                self.fail('does_not_exist', pk_value=pk)
+            except (TypeError, ValueError):
+                self.fail('incorrect_type', data_type=type(pk).__name__)
+
         return super().to_internal_value(pk)
 
     def get_choices(self, cutoff=None):
@@ -46,6 +103,158 @@ class InstanceDictPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
         return OrderedDict((item.pk, self.display_value(item)) for item in queryset)
 
 
+def get_related_lookups(serializer, prefix='', joinable=True):
+    """Returns the select_related and prefetch_related lookups needed to
+    serialize instances with the serializer without additional queries
+
+    The serializer tree is walked recursively. Single related objects that
+    can be reached from the root through foreign keys only are joined with
+    select_related. Everything under a to-many relation is prefetched, which
+    keeps the number of queries fixed regardless of the number of instances.
+    """
+    select_related = []
+    prefetch_related = []
+
+    for field in serializer.fields.values():
+        if field.source == '*' or not field.source_attrs:
+            continue
+
+        path = prefix + '__'.join(field.source_attrs)
+
+        if isinstance(field, serializers.ListSerializer):
+            prefetch_related.append(path)
+            nested_select, nested_prefetch = get_related_lookups(field.child, prefix=path + '__', joinable=False)
+        elif isinstance(field, serializers.BaseSerializer):
+            (select_related if joinable else prefetch_related).append(path)
+            nested_select, nested_prefetch = get_related_lookups(field, prefix=path + '__', joinable=joinable)
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch_related.append(path)
+            continue
+        elif isinstance(field, InstanceDictPrimaryKeyRelatedField) and field.related_serializer:
+            (select_related if joinable else prefetch_related).append(path)
+            related_serializer = field.related_serializer(context=serializer.context)
+            nested_select, nested_prefetch = get_related_lookups(related_serializer, prefix=path + '__',
+                                                                 joinable=joinable)
+        else:
+            continue
+
+        select_related.extend(nested_select)
+        prefetch_related.extend(nested_prefetch)
+
+    return select_related, prefetch_related
+
+
+def parse_field_paths(value):
+    """Parses a comma separated list of dotted field paths to a tree of dicts
+
+    For example "id,tenants.share_numerator,tenants.reference" is parsed to
+    {'id': {}, 'tenants': {'share_numerator': {}, 'reference': {}}}."""
+    tree = {}
+
+    for path in value.split(','):
+        node = tree
+        for field_name in [name.strip() for name in path.split('.') if name.strip()]:
+            node = node.setdefault(field_name, {})
+
+    return tree
+
+
+def get_collapsed_field(field_name, field):
+    """Returns a read only field that serializes the nested serializer field
+    as primary keys"""
+    kwargs = {
+        'read_only': True,
+        'many': isinstance(field, serializers.ListSerializer),
+    }
+
+    if field.source != field_name:
+        kwargs['source'] = field.source
+
+    return serializers.PrimaryKeyRelatedField(**kwargs)
+
+
+def select_nested_fields(serializer, field_name, fields, omit, expand):
+    field = serializer.fields[field_name]
+    is_expanded = expand is None or field_name in expand or bool(fields)
+
+    if isinstance(field, InstanceDictPrimaryKeyRelatedField):
+        if not is_expanded:
+            field.related_serializer = None
+        return
+
+    if not isinstance(field, serializers.BaseSerializer):
+        return
+
+    if not is_expanded:
+        serializer.fields[field_name] = get_collapsed_field(field_name, field)
+        return
+
+    nested_serializer = field.child if isinstance(field, serializers.ListSerializer) else field
+    select_fields(nested_serializer, fields=fields or None, omit=omit,
+                  expand=expand.get(field_name, {}) if expand is not None else None)
+
+
+def select_fields(serializer, fields=None, omit=None, expand=None):
+    """Removes and collapses the fields of the serializer and its nested
+    serializers in place
+
+    The arguments are field trees returned by parse_field_paths. Only the
+    `fields` are included, or all of them if it's None. The `omit` fields
+    are left out. If `expand` is given, only the related objects in it, or
+    the ones with selected subfields, are serialized as nested objects. The
+    rest are serialized as primary keys. Related objects serialized by an
+    InstanceDictPrimaryKeyRelatedField can only be expanded or collapsed as
+    a whole.
+    """
+    omit = omit or {}
+
+    for field_name in list(serializer.fields.keys()):
+        if (fields is not None and field_name not in fields) or omit.get(field_name) == {}:
+            del serializer.fields[field_name]
+            continue
+
+        select_nested_fields(serializer, field_name, fields=fields.get(field_name) if fields else None,
+                             omit=omit.get(field_name), expand=expand)
+
+
+class FieldSelectionMixin:
+    """Selects the fields of the root serializer and its nested serializers
+    with the fields, omit and expand query parameters of the request
+
+    The parameters are comma separated lists of dotted field paths, e.g.
+    ?fields=id,identifier,tenants.share_numerator&expand=identifier. As the
+    serializer tree is pruned, the lookups returned by get_related_lookups
+    are pruned too."""
+    field_selection_params = ('fields', 'omit', 'expand')
+
+    @property
+    def fields(self):
+        fields = super().fields
+
+        if not getattr(self, '_fields_selected', False):
+            self._fields_selected = True
+            self.select_fields_from_request()
+
+        return fields
+
+    def is_root_serializer(self):
+        return self.parent is None or (isinstance(self.parent, serializers.ListSerializer) and
+                                       self.parent.parent is None)
+
+    def select_fields_from_request(self):
+        request = self.context.get('request')
+
+        if request is None or not self.is_root_serializer():
+            return
+
+        query_params = getattr(request, 'query_params', request.GET)
+        field_trees = {param: parse_field_paths(query_params[param]) if param in query_params else None
+                       for param in self.field_selection_params}
+
+        if any(tree is not None for tree in field_trees.values()):
+            select_fields(self, **field_trees)
+
+
 def instance_replace_related(instance=None, related_name=None, serializer_class=None,
                              validated_data=None, context=None):
     manager = getattr(instance, related_name)
@@ -69,61 +278,250 @@ def instance_replace_related(instance=None, related_name=None, serializer_class=
             manager.add(item_instance)
 
 
-def sync_new_items_to_manager(new_items, manager):
-    if not new_items or not hasattr(manager, 'add'):
+def complete_item_data(serializer, data, related_name):
+    """Adds the default values of the missing fields to the validated data of
+    a nested item and checks that the required fields are present
+
+    Nested items are validated as a part of the root serializer. When the root
+    is partially updated, the defaults and the required fields of the items
+    are not handled by the validation, so it's done here instead."""
+    errors = {}
+
+    for field in serializer._writable_fields:
+        if field.source == '*' or field.source in data:
+            continue
+
+        if field.default is not empty:
+            default = field.default
+            if hasattr(default, 'set_context'):
+                default.set_context(field)
+
+            data[field.source] = default() if callable(default) else default
+        elif field.required:
+            errors[field.field_name] = [field.error_messages['required']]
+
+    if errors:
+        raise ValidationError({
+            related_name: errors
+        }, code='required')
+
+
+def get_existing_related_items(model, related_field, parents):
+    """Fetches the items referred to by id in the validated data and the
+    current items of the parent instances with one query
+
+    Returns the items by their primary key and the primary keys of the current
+    items by the primary key of the parent instance."""
+    parents_by_pk = {instance.pk: instance for instance, items in parents}
+    pks = {item['id'] for instance, items in parents for item in items if item.get('id')}
+
+    queryset = model._default_manager.filter(
+        Q(pk__in=pks) | Q(**{'{}__in'.format(related_field.name): list(parents_by_pk.keys())}))
+
+    if auditlog.contains(model):
+        # The old values of the foreign keys are needed for the audit log
+        queryset = queryset.select_related(*[field.name for field in model._meta.concrete_fields
+                                             if field.many_to_one and field is not related_field])
+
+    existing = queryset.in_bulk()
+    current_pks = defaultdict(set)
+
+    for item_instance in existing.values():
+        parent_pk = getattr(item_instance, related_field.attname)
+        current_pks[parent_pk].add(item_instance.pk)
+
+        if parent_pk in parents_by_pk:
+            related_field.set_cached_value(item_instance, parents_by_pk[parent_pk])
+
+    return existing, current_pks
+
+
+def split_item_data(serializer, item, related_name):
+    """Splits the validated data of an item to the primary key, the model
+    field values, the many to many values and the nested item data"""
+    data = dict(item)
+    pk = data.pop('id', None)
+    nested_data = serializer.extract_nested(data) if isinstance(serializer, UpdateNestedMixin) else {}
+
+    complete_item_data(serializer, data, related_name)
+
+    relations = model_meta.get_field_info(serializer.Meta.model).relations
+    many_to_many = {field_name: data.pop(field_name) for field_name in list(data.keys())
+                    if field_name in relations and relations[field_name].to_many}
+
+    return pk, data, many_to_many, nested_data
+
+
+def add_written_row_count(serializer, count):
+    """Adds to the number of the rows written by the root serializer"""
+    root = serializer.root
+    root.written_row_count = getattr(root, 'written_row_count', 0) + count
+
+
+def save_related_items(model, created, updated):
+    """Inserts the created and updates the changed item instances
+
+    `updated` is a list of (old, new) instance pairs. Only the fields that
+    have changed are updated and the unchanged instances are not written at
+    all. Returns the unsaved audit log entries of the changes and the number
+    of the rows written."""
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    changed = []
+    changed_field_names = set()
+
+    for old, item_instance in updated:
+        field_names = {field.name for field in fields
+                       if field.value_from_object(old) != field.value_from_object(item_instance)}
+
+        if field_names:
+            changed.append((old, item_instance))
+            changed_field_names.update(field_names)
+
+    # Like in the pre_save signal, the changes are logged before the
+    # automatically updated fields get their new values.
+    log_entries = get_log_entries(changed)
+
+    if created:
+        model._default_manager.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        log_entries.extend(get_log_entries((None, item_instance) for item_instance in created))
+
+    if changed:
+        item_instances = [item_instance for old, item_instance in changed]
+        auto_now_fields = [field for field in fields if getattr(field, 'auto_now', False)]
+
+        for item_instance in item_instances:
+            for field in auto_now_fields:
+                field.pre_save(item_instance, False)
+
+        changed_field_names.update(field.name for field in auto_now_fields)
+
+        bulk_update(model, item_instances, [field.name for field in fields if field.name in changed_field_names])
+
+    return log_entries, len(created) + len(changed)
+
+
+def bulk_create_or_update_related(parents, related_name, serializer, context=None):
+    """Creates, updates and deletes the related items of many instances at once
+
+    `parents` is a list of (instance, validated_data) tuples, where the
+    validated data is the list of validated items of the related_name relation
+    of the instance. Items with an existing id are updated, other items are
+    created and the previous items of the instance missing from a non-empty
+    list are removed. Items whose values don't change are not written. The
+    nested items of the items are saved the same way with one set of queries
+    per relation for all of the parents.
+    """
+    parents = [(instance, items) for instance, items in parents if items]
+    if not parents:
         return
 
-    existing_items = set(manager.all())
+    model = serializer.Meta.model
+    related_field = getattr(parents[0][0], related_name).field
+    existing, current_pks = get_existing_related_items(model, related_field, parents)
 
-    for item in existing_items.difference(new_items):
-        if hasattr(manager, 'remove'):
-            manager.remove(item)
-        else:
-            item.delete()
+    created = []
+    updated = OrderedDict()
+    many_to_many = []
+    nested = []
+    removed_pks = set()
 
-    for item in new_items.difference(existing_items):
-        manager.add(item)
+    for instance, items in parents:
+        kept_pks = set()
 
+        for item in items:
+            pk, data, item_many_to_many, item_nested_data = split_item_data(serializer, item, related_name)
+            item_instance = existing.get(pk) if pk else None
 
-def instance_create_or_update_related(instance=None, related_name=None, serializer_class=None,
-                                      validated_data=None, context=None):
-    manager = getattr(instance, related_name)
-    new_items = set()
+            if item_instance is None:
+                item_instance = model(**data)
+                created.append(item_instance)
+            else:
+                updated.setdefault(item_instance.pk, (copy_instance(item_instance), item_instance))
+                kept_pks.add(item_instance.pk)
 
-    for item in validated_data:
-        pk = item.pop('id', None)
+                for attr, value in data.items():
+                    setattr(item_instance, attr, value)
 
-        serializer_params = {
-            'data': item,
-            'context': context,
-        }
+            setattr(item_instance, related_field.name, instance)
 
-        if pk:
-            try:
-                item_instance = serializer_class.Meta.model._default_manager.get(id=pk)
-                serializer_params['instance'] = item_instance
-            except ObjectDoesNotExist:
-                pass
+            many_to_many.append((item_instance, item_many_to_many))
+            nested.append((item_instance, item_nested_data))
 
-        serializer = serializer_class(**serializer_params)
+        removed_pks.update(current_pks[instance.pk] - kept_pks)
 
-        try:
-            serializer.is_valid(raise_exception=True)
-        except ValidationError as e:
-            raise ValidationError({
-                related_name: e.detail
-            })
+    removed_pks.difference_update(updated.keys())
 
-        item_instance = serializer.save(**{
-            manager.field.name: instance
-        })
+    log_entries, written_row_count = save_related_items(model, created, list(updated.values()))
+    log_entries.extend(remove_related_items(model, related_field, [existing[pk] for pk in removed_pks]))
+
+    save_log_entries(log_entries)
+    add_written_row_count(serializer, written_row_count + len(removed_pks))
+
+    for item_instance, item_many_to_many in many_to_many:
+        for attr, value in item_many_to_many.items():
+            getattr(item_instance, attr).set(value)
+
+    if isinstance(serializer, UpdateNestedMixin):
+        serializer.save_nested_bulk(nested, context=context)
+
+
+def remove_related_items(model, related_field, item_instances):
+    """Removes the items from the relation and returns the unsaved audit log
+    entries of the removal
+
+    Items are detached if the foreign key is nullable. Otherwise they are
+    soft deleted or deleted depending on the model."""
+    pks = [item_instance.pk for item_instance in item_instances]
+
+    if not pks:
+        return []
 
-        new_items.add(item_instance)
+    if related_field.null:
+        model._base_manager.filter(pk__in=pks).update(**{related_field.name: None})
+        return []
 
-    sync_new_items_to_manager(new_items, manager)
+    if getattr(model, '_safedelete_policy', None) != SOFT_DELETE:
+        # Deleting sends the post_delete signals, which also write the audit log
+        model._default_manager.filter(pk__in=pks).delete()
+        return []
+
+    now = timezone.now()
+    instance_pairs = []
+
+    for item_instance in item_instances:
+        old = copy_instance(item_instance)
+        item_instance.deleted = now
+        instance_pairs.append((old, item_instance))
+        pre_softdelete.send(sender=model, instance=item_instance, using=item_instance._state.db)
+
+    log_entries = get_log_entries(instance_pairs)
+
+    values = {'deleted': now}
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now', False):
+            values[field.name] = now
+
+    model._base_manager.filter(pk__in=pks).update(**values)
+
+    for item_instance in item_instances:
+        post_softdelete.send(sender=model, instance=item_instance, using=item_instance._state.db)
+
+    return log_entries
+
+
+def instance_create_or_update_related(instance=None, related_name=None, serializer_class=None,
+                                      validated_data=None, context=None):
+    bulk_create_or_update_related([(instance, validated_data)], related_name=related_name,
+                                  serializer=serializer_class(context=context), context=context)
 
 
 class UpdateNestedMixin:
+    """Saves the nested items of the instance after the instance itself
+
+    The number of rows written, the instance included, is available in
+    the written_row_count attribute after the save."""
+    written_row_count = 0
+
     def extract_nested(self, validated_data):
         nested = {}
         for field_name, field in self.fields.items():
@@ -142,16 +540,24 @@ class UpdateNestedMixin:
         return nested
 
     def save_nested(self, instance, nested_data, context=None):
-        for nested_name, nested_datum in nested_data.items():
-            instance_create_or_update_related(instance=instance, related_name=nested_name,
-                                              serializer_class=self.fields[nested_name].child.__class__,
-                                              validated_data=nested_datum,
+        self.save_nested_bulk([(instance, nested_data)], context=context)
+
+    def save_nested_bulk(self, instances, context=None):
+        """Saves the nested data of many instances with one set of queries
+        per nested relation"""
+        for field_name, field in self.fields.items():
+            parents = [(instance, nested_data[field_name]) for instance, nested_data in instances
+                       if nested_data.get(field_name)]
+
+            if parents:
+                bulk_create_or_update_related(parents, related_name=field_name, serializer=field.child,
                                               context=context)
 
     def create(self, validated_data):
         nested_data = self.extract_nested(validated_data)
 
         instance = super().create(validated_data)
+        self.written_row_count = 1
 
         self.save_nested(instance, nested_data, context=self.context)
 
@@ -161,6 +567,7 @@ class UpdateNestedMixin:
         nested_data = self.extract_nested(validated_data)
 
         instance = super().update(instance, validated_data)
+        self.written_row_count = 1
 
         self.save_nested(instance, nested_data, context=self.context)
 
@@ -0,0 +1,158 @@
+"""Signal receivers of the leasing app
+
+The lease change feed: every save and delete of a lease or one of its
+related items marks the lease changed in LeaseChange. The nested
+serializers write the related items with bulk queries that don't send the
+model signals, but they always save the lease or the item that owns the
+related items, so the change is recorded through it.
+
+Soft deleting and undeleting save the instance, so they are handled by
+the post_save receivers, and a soft deleted lease is recorded as deleted.
+
+The index factor cache: the cached factors of a year are deleted when an
+index number of the year is saved or deleted.
+
+The due date calendar: the calendar due dates of a lease are regenerated
+when a transaction commits that deletes the lease, changes its start date,
+end date or deleted time, or saves or deletes one of its rents or a due
+date of a rent. Regenerating waits for the commit, because the nested
+serializers write the due dates after they have saved the rent or the
+lease. The leases of a transaction are regenerated together once."""
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from leasing.due_date_calendar import regenerate_lease_due_dates
+from leasing.models import (
+    Comment, Condition, ConstructabilityDescription, Contract, ContractChange, ContractRent, Decision,
+    FixedInitialYearRent, Index, IndexAdjustedRent, IndexFactor, Inspection, Lease, LeaseArea, LeaseBasisOfRent,
+    LeaseChange, MortgageDocument, PayableRent, PlanUnit, Plot, RelatedLease, Rent, RentAdjustment, RentDueDate, Tenant,
+    TenantContact)
+from leasing.utils import OnCommitBatch
+
+# The fields of a lease that the due date calendar depends on
+DUE_DATE_CALENDAR_LEASE_FIELDS = ('start_date', 'end_date', 'deleted')
+
+# The attribute paths from the related items to the lease id
+LEASE_ID_PATHS = {
+    Comment: ('lease_id',),
+    Condition: ('decision.lease_id',),
+    ConstructabilityDescription: ('lease_area.lease_id',),
+    Contract: ('lease_id',),
+    ContractChange: ('contract.lease_id',),
+    ContractRent: ('rent.lease_id',),
+    Decision: ('lease_id',),
+    FixedInitialYearRent: ('rent.lease_id',),
+    IndexAdjustedRent: ('rent.lease_id',),
+    Inspection: ('lease_id',),
+    LeaseArea: ('lease_id',),
+    LeaseBasisOfRent: ('lease_id',),
+    MortgageDocument: ('contract.lease_id',),
+    PayableRent: ('rent.lease_id',),
+    PlanUnit: ('lease_area.lease_id',),
+    Plot: ('lease_area.lease_id',),
+    RelatedLease: ('from_lease_id', 'to_lease_id'),
+    Rent: ('lease_id',),
+    RentAdjustment: ('rent.lease_id',),
+    RentDueDate: ('rent.lease_id',),
+    Tenant: ('lease_id',),
+    TenantContact: ('tenant.lease_id',),
+}
+
+
+def get_lease_ids(instance):
+    lease_ids = []
+
+    for path in LEASE_ID_PATHS[instance.__class__]:
+        value = instance
+        for attribute in path.split('.'):
+            value = getattr(value, attribute, None)
+            if value is None:
+                break
+
+        if value is not None:
+            lease_ids.append(value)
+
+    return lease_ids
+
+
+def record_lease_change(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+
+    LeaseChange.objects.record([instance.id], deleted=bool(getattr(instance, 'deleted', None)))
+
+
+def record_lease_delete(sender, instance, **kwargs):
+    LeaseChange.objects.record([instance.id], deleted=True)
+
+
+def record_related_change(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+
+    LeaseChange.objects.record(get_lease_ids(instance))
+
+
+# The leases are collected for the transaction, so that a lease is
+# regenerated once however many of its rents are saved
+due_date_regeneration = OnCommitBatch(regenerate_lease_due_dates)
+
+
+def schedule_due_date_regeneration(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+
+    due_date_regeneration.add([instance.id] if sender is Lease else get_lease_ids(instance))
+
+
+def check_lease_due_date_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Marks the lease if the save changes the fields of the lease that the
+    calendar due dates depend on
+
+    A new lease has no rents yet. Its rents schedule the regeneration when
+    they are saved."""
+    instance._due_date_fields_changed = False
+
+    if raw or instance.pk is None:
+        return
+
+    if update_fields is not None and not set(update_fields) & set(DUE_DATE_CALENDAR_LEASE_FIELDS):
+        return
+
+    old_values = Lease.all_objects.filter(pk=instance.pk).values_list(*DUE_DATE_CALENDAR_LEASE_FIELDS).first()
+    instance._due_date_fields_changed = old_values != tuple(
+        getattr(instance, field_name) for field_name in DUE_DATE_CALENDAR_LEASE_FIELDS)
+
+
+def schedule_lease_due_date_regeneration(sender, instance, **kwargs):
+    # Outside a transaction the regeneration runs right away, so it is
+    # scheduled only after the lease has been written
+    if getattr(instance, '_due_date_fields_changed', False):
+        instance._due_date_fields_changed = False
+        due_date_regeneration.add([instance.id])
+
+
+def clear_index_factors(sender, instance, **kwargs):
+    IndexFactor.objects.filter(type=instance.type, year=instance.year).delete()
+
+
+def connect_signals():
+    post_save.connect(record_lease_change, sender=Lease, dispatch_uid='lease_change_save')
+    post_delete.connect(record_lease_delete, sender=Lease, dispatch_uid='lease_change_delete')
+
+    for model in LEASE_ID_PATHS:
+        uid = 'lease_change_{}'.format(model._meta.model_name)
+        post_save.connect(record_related_change, sender=model, dispatch_uid=uid + '_save')
+        post_delete.connect(record_related_change, sender=model, dispatch_uid=uid + '_delete')
+
+    # The old values of a lease are compared before they are overwritten
+    pre_save.connect(check_lease_due_date_fields, sender=Lease, dispatch_uid='due_date_calendar_lease_check')
+    post_save.connect(schedule_lease_due_date_regeneration, sender=Lease, dispatch_uid='due_date_calendar_lease_save')
+    post_delete.connect(schedule_due_date_regeneration, sender=Lease, dispatch_uid='due_date_calendar_lease_delete')
+
+    for model in (Rent, RentDueDate):
+        uid = 'due_date_calendar_{}'.format(model._meta.model_name)
+        post_save.connect(schedule_due_date_regeneration, sender=model, dispatch_uid=uid + '_save')
+        post_delete.connect(schedule_due_date_regeneration, sender=model, dispatch_uid=uid + '_delete')
+
+    post_save.connect(clear_index_factors, sender=Index, dispatch_uid='index_factor_save')
+    post_delete.connect(clear_index_factors, sender=Index, dispatch_uid='index_factor_delete')
@@ -0,0 +1,63 @@
+"""Shares of the billing contacts of the leases
+
+The share of a tenant is share_numerator / share_denominator of the rent
+of the lease. A tenant is billed through its billing contact, or through
+its tenant contact when it has no billing contact, on a given date, and a
+tenant without a tenant contact on the date is not billed. The shares of
+the tenants billed through the same contact are summed as exact
+fractions.
+
+An amount is split between the contacts to the cent with
+leasing.calculation.split_amount."""
+from fractions import Fraction
+
+from django.db.models import Q
+
+from leasing.enums import TenantContactType
+from leasing.models import TenantContact
+
+
+def get_contact_shares(dates):
+    """Returns the shares of the billing contacts of the leases on the dates
+
+    The dates are given as a dict of the date by lease id, e.g. the first
+    days of the billing periods of the leases. Returns a dict by lease id of
+    dicts of [share, tenant ids] by contact id. The contacts and the shares
+    are read with one query."""
+    if not dates:
+        return {}
+
+    tenant_contacts = TenantContact.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=min(dates.values())),
+        tenant__lease_id__in=list(dates),
+        tenant__deleted__isnull=True,
+        type__in=(TenantContactType.TENANT, TenantContactType.BILLING),
+        start_date__lte=max(dates.values()),
+    ).order_by('tenant_id', 'start_date').values_list(
+        'tenant__lease_id', 'tenant_id', 'tenant__share_numerator', 'tenant__share_denominator', 'type', 'contact_id',
+        'start_date', 'end_date')
+
+    tenants = {}
+    contact_ids = {}
+
+    for (lease_id, tenant_id, share_numerator, share_denominator, contact_type, contact_id, start_date,
+         end_date) in tenant_contacts:
+        tenants[tenant_id] = (lease_id, Fraction(share_numerator, share_denominator or 1))
+        date = dates[lease_id]
+
+        if start_date <= date and (end_date is None or end_date >= date):
+            contact_ids.setdefault(tenant_id, {})[contact_type] = contact_id
+
+    shares = {}
+
+    for tenant_id, (lease_id, share) in sorted(tenants.items()):
+        tenant_contact_ids = contact_ids.get(tenant_id, {})
+        if TenantContactType.TENANT not in tenant_contact_ids:
+            continue
+
+        contact_id = tenant_contact_ids.get(TenantContactType.BILLING, tenant_contact_ids[TenantContactType.TENANT])
+        contact_share = shares.setdefault(lease_id, {}).setdefault(contact_id, [0, []])
+        contact_share[0] += share
+        contact_share[1].append(tenant_id)
+
+    return shares
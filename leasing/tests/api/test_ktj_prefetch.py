@@ -0,0 +1,93 @@
+import pytest
+from django.http import QueryDict
+from django.urls import reverse
+
+from leasing import ktj_prefetch
+from leasing.enums import PlotType
+
+
+@pytest.mark.django_db
+def test_ktj_prefetch(django_db_setup, admin_client, fake_ktj_server, lease_graph_factory, plot_factory):
+    lease = lease_graph_factory()
+    plot_factory(lease_area=lease.lease_areas.get(), identifier='91-1-1-1-M601', area=10, section_area=10,
+                 address='Test address 1', postal_code='00100', city='Helsinki', type=PlotType.UNSEPARATED_PARCEL)
+    other_lease = lease_graph_factory()
+    other_lease.lease_areas.get().plots.update(identifier='91-2-2-2')
+
+    response = admin_client.post(reverse('lease-ktj-prefetch', kwargs={'pk': lease.id}))
+
+    assert response.status_code == 202, '%s %s' % (response.status_code, response.data)
+    # The plot and the plan unit of the lease have the same identifier
+    assert response.data['prints'] == [
+        '/ktjkii/tuloste/kiinteistorekisteriote/rekisteriyksikko/pdf?kiinteistotunnus=91-1-1-1&lang=fi',
+        '/ktjkii/tuloste/lainhuutotodistus/pdf?kiinteistotunnus=91-1-1-1&lang=fi',
+        '/ktjkii/tuloste/rasitustodistus/pdf?kiinteistotunnus=91-1-1-1&lang=fi',
+        '/ktjkii/tuloste/kiinteistorekisteriote/maaraala/pdf?maaraalatunnus=91-1-1-1-M601&lang=fi',
+    ]
+
+    ktj_prefetch.shutdown_executor()
+
+    assert len(fake_ktj_server.requests) == 4
+
+    # The prints are read from the cache
+    for url in response.data['prints']:
+        print_response = admin_client.get(url)
+
+        assert print_response.status_code == 200
+        assert b''.join(print_response.streaming_content) == fake_ktj_server.content
+
+    assert len(fake_ktj_server.requests) == 4
+
+
+def test_prefetch_prints(fake_ktj_server, settings):
+    prints = [('ktjkii', 'lainhuutotodistus', params) for params in (
+        QueryDict('kiinteistotunnus=1'), QueryDict('kiinteistotunnus=2'))]
+
+    assert [future.result() for future in ktj_prefetch.prefetch_prints(prints)] == [True, True]
+    assert [future.result() for future in ktj_prefetch.prefetch_prints(prints)] == [True, True]
+    assert len(fake_ktj_server.requests) == 2
+
+    settings.KTJ_PRINT_CACHE_MAX_SIZE = 0
+
+    assert ktj_prefetch.prefetch_prints(prints) == []
+
+
+def test_prefetch_is_coalesced_and_bounded(fake_ktj_server, monkeypatch):
+    fake_ktj_server.delay = 0.2
+    prints = [('ktjkii', 'lainhuutotodistus', QueryDict('kiinteistotunnus={}'.format(i))) for i in range(2)]
+
+    futures = ktj_prefetch.prefetch_prints(prints)
+
+    # The prints in flight are not queued again
+    assert ktj_prefetch.prefetch_prints(prints) == futures
+
+    monkeypatch.setattr(ktj_prefetch, 'KTJ_PREFETCH_MAX_PENDING', 3)
+    with pytest.raises(ktj_prefetch.PrefetchQueueFull):
+        ktj_prefetch.prefetch_prints(prints + [('ktjkii', 'rasitustodistus', QueryDict('kiinteistotunnus={}'.format(
+            i))) for i in range(2)])
+
+    assert [future.result() for future in futures] == [True, True]
+    assert len(fake_ktj_server.requests) == 2
+
+
+def test_failed_prefetch_is_logged(fake_ktj_server, caplog):
+    fake_ktj_server.failures = 100
+    futures = ktj_prefetch.prefetch_prints([('ktjkii', 'lainhuutotodistus', QueryDict('kiinteistotunnus=1'))])
+
+    ktj_prefetch.shutdown_executor()
+
+    assert futures[0].exception() is not None
+    assert [(record.levelname, record.getMessage().split(':')[0]) for record in caplog.records
+            if record.name == 'leasing.ktj_prefetch'] == [
+        ('ERROR', 'Prefetching the KTJ print /ktjkii/tuloste/lainhuutotodistus/pdf?kiinteistotunnus=1 failed')]
+
+
+@pytest.mark.django_db
+def test_ktj_prefetch_queue_full(django_db_setup, admin_client, fake_ktj_server, lease_graph_factory, monkeypatch):
+    lease = lease_graph_factory()
+    monkeypatch.setattr(ktj_prefetch, 'KTJ_PREFETCH_MAX_PENDING', 2)
+
+    response = admin_client.post(reverse('lease-ktj-prefetch', kwargs={'pk': lease.id}))
+
+    assert response.status_code == 503, '%s %s' % (response.status_code, response.data)
+    assert not fake_ktj_server.requests
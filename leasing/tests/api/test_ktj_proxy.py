@@ -0,0 +1,73 @@
+import pytest
+
+from leasing import ktj
+
+PRINT_PATH = '/ktjkii/tuloste/lainhuutotodistus/pdf'
+
+
+def read_content(response):
+    return b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+def test_ktj_proxy(django_db_setup, admin_client, fake_ktj_server):
+    for i in range(3):
+        response = admin_client.get(PRINT_PATH, {'kiinteistotunnus': '91-1-1-{}'.format(i), 'lang': 'fi',
+                                                 'extra': 'x'})
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/pdf'
+        assert read_content(response) == fake_ktj_server.content
+
+    assert fake_ktj_server.requests == [(PRINT_PATH, {'kiinteistotunnus': ['91-1-1-{}'.format(i)], 'lang': ['fi']})
+                                        for i in range(3)]
+    # The connection is kept alive for the next requests
+    assert len(fake_ktj_server.connections) == 1
+
+
+@pytest.mark.django_db
+def test_ktj_proxy_retries_unavailable_service(django_db_setup, admin_client, fake_ktj_server):
+    fake_ktj_server.failures = 1
+
+    response = admin_client.get(PRINT_PATH)
+
+    assert response.status_code == 200
+    assert read_content(response) == fake_ktj_server.content
+    assert len(fake_ktj_server.requests) == 2
+
+
+@pytest.mark.django_db
+def test_ktj_proxy_timeout(django_db_setup, admin_client, fake_ktj_server, monkeypatch):
+    monkeypatch.setattr(ktj, 'KTJ_PRINT_READ_TIMEOUT', 0.1)
+    fake_ktj_server.delay = 1
+
+    response = admin_client.get(PRINT_PATH)
+
+    assert response.status_code == 504
+    assert len(fake_ktj_server.requests) == ktj.KTJ_PRINT_RETRIES + 1
+
+
+@pytest.mark.django_db
+def test_ktj_proxy_unreachable_service(django_db_setup, admin_client, fake_ktj_server):
+    fake_ktj_server.server_close()
+
+    assert admin_client.get(PRINT_PATH).status_code in (502, 504)
+
+
+@pytest.mark.django_db
+def test_ktj_proxy_unknown_print(django_db_setup, admin_client, fake_ktj_server):
+    assert admin_client.get('/ktjkii/tuloste/unknown/pdf').status_code == 404
+    assert not fake_ktj_server.requests
+
+
+def test_iterate_content(fake_ktj_server):
+    fake_ktj_server.chunk_size = 100 * 1024
+    response = ktj.request_print('ktjkii', 'lainhuutotodistus', {})
+
+    chunks = list(ktj.iterate_content(response, chunk_size=1000))
+
+    assert b''.join(chunks) == fake_ktj_server.content
+    assert max(len(chunk) for chunk in chunks) == 1000
+    # The connection has been returned to the pool
+    ktj.request_print('ktjkii', 'lainhuutotodistus', {}).close()
+    assert len(fake_ktj_server.connections) == 1
@@ -0,0 +1,138 @@
+import datetime
+import json
+
+import pytest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from leasing.models import LeaseChange
+
+
+def get_changes(client, query_string=''):
+    url = reverse('lease-changes') + query_string
+    changes = []
+
+    while url:
+        response = client.get(url)
+
+        assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+
+        changes.extend(response.data['results'])
+        url = response.data['next']
+
+    return changes
+
+
+def set_changed_at(lease, changed_at):
+    LeaseChange.objects.filter(lease=lease).update(changed_at=changed_at)
+
+
+def test_changes_since(committed_admin_client, lease_factory):
+    leases = [lease_factory(type_id='A1', municipality_id=1, district_id=5) for i in range(3)]
+
+    changes = get_changes(committed_admin_client, '?limit=1')
+
+    assert [change['lease'] for change in changes] == [lease.id for lease in leases]
+
+    changes = get_changes(committed_admin_client, '?since={}'.format(changes[0]['version']))
+
+    assert [change['lease'] for change in changes] == [leases[1].id, leases[2].id]
+    assert not any(change['deleted'] for change in changes)
+
+    # A changed lease moves after the changes already read
+    leases[0].save()
+
+    changes = get_changes(committed_admin_client, '?since={}'.format(changes[-1]['version']))
+
+    assert [change['lease'] for change in changes] == [leases[0].id]
+
+
+def test_changes_get_version_on_commit(committed_admin_client, lease_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+    other_lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+    version = LeaseChange.objects.get(lease=other_lease).version
+
+    with transaction.atomic():
+        lease.save()
+
+        assert LeaseChange.objects.get(lease=lease).version is None
+        assert get_changes(committed_admin_client, '?since={}'.format(version)) == []
+
+    with pytest.raises(DatabaseError):
+        with transaction.atomic():
+            other_lease.save()
+            raise DatabaseError()
+
+    changes = get_changes(committed_admin_client, '?since={}'.format(version))
+
+    assert [(change['lease'], change['version']) for change in changes] == [(lease.id, version + 1)]
+
+    # A change left without a version gets the version of the next commit
+    LeaseChange.objects.filter(lease=lease).update(version=None)
+    other_lease.save()
+
+    changes = get_changes(committed_admin_client, '?since={}'.format(version + 1))
+
+    assert [(change['lease'], change['version']) for change in changes] == [
+        (lease.id, version + 2), (other_lease.id, version + 2)]
+
+
+@pytest.mark.django_db
+def test_related_item_change(django_db_setup, admin_client, lease_factory, tenant_factory, contact_factory,
+                             tenant_contact_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+    tenant = tenant_factory(lease=lease, share_numerator=1, share_denominator=1)
+    past = timezone.now() - datetime.timedelta(days=1)
+    set_changed_at(lease, past)
+
+    tenant_contact_factory(tenant=tenant, contact=contact_factory(first_name='First', last_name='Last'),
+                           type='tenant', start_date=datetime.date.today())
+
+    assert LeaseChange.objects.get(lease=lease).changed_at > past
+
+
+@pytest.mark.django_db
+def test_nested_update_change(django_db_setup, admin_client, lease_test_data):
+    lease = lease_test_data['lease']
+    tenant = lease_test_data['tenants'][0]
+    past = timezone.now() - datetime.timedelta(days=1)
+    set_changed_at(lease, past)
+
+    data = {
+        "tenants": [
+            {
+                "id": tenant.id,
+                "share_numerator": 3,
+                "share_denominator": 4,
+            }
+        ]
+    }
+
+    url = reverse('lease-detail', kwargs={'pk': lease.id})
+    response = admin_client.patch(url, data=json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json')
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+    assert LeaseChange.objects.get(lease=lease).changed_at > past
+
+
+def test_deleted_lease_tombstone(committed_admin_client, lease_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+
+    response = committed_admin_client.delete(reverse('lease-detail', kwargs={'pk': lease.id}))
+
+    assert response.status_code == 204
+
+    changes = get_changes(committed_admin_client)
+
+    assert changes == [{'lease': lease.id, 'version': changes[0]['version'], 'changed_at': changes[0]['changed_at'],
+                        'deleted': True}]
+
+
+@pytest.mark.django_db
+def test_invalid_since(django_db_setup, admin_client):
+    response = admin_client.get(reverse('lease-changes') + '?since=2018-01-01T00:00:00')
+
+    assert response.status_code == 400
+    assert 'since' in response.data
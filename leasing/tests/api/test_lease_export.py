@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from leasing.export import LeaseExporter
+from leasing.models import Lease
+
+
+def get_export_content(client, query_string=''):
+    response = client.get(reverse('lease-export') + query_string)
+
+    assert response.status_code == 200
+    assert response.streaming
+
+    return b''.join(response.streaming_content).decode('utf-8')
+
+
+@pytest.mark.django_db
+def test_export_jsonl(django_db_setup, admin_client, lease_graph_factory):
+    leases = [lease_graph_factory() for i in range(3)]
+
+    lines = get_export_content(admin_client).splitlines()
+    data = [json.loads(line) for line in lines]
+
+    assert [item['id'] for item in data] == [lease.id for lease in leases]
+    assert data[0]['tenants'][0]['id'] == leases[0].tenants.get().id
+    assert data[0]['rents'][0]['contract_rents'][0]['id'] == leases[0].rents.get().contract_rents.get().id
+
+
+@pytest.mark.django_db
+def test_export_csv(django_db_setup, admin_client, lease_graph_factory):
+    leases = [lease_graph_factory() for i in range(2)]
+
+    rows = list(csv.DictReader(io.StringIO(get_export_content(admin_client, '?file_format=csv'))))
+
+    assert [int(row['id']) for row in rows] == [lease.id for lease in leases]
+    assert [int(row['identifier.sequence']) for row in rows] == [lease.identifier.sequence for lease in leases]
+    assert json.loads(rows[0]['tenants'])[0]['id'] == leases[0].tenants.get().id
+
+
+@pytest.mark.django_db
+def test_export_fields(django_db_setup, admin_client, lease_graph_factory):
+    lease = lease_graph_factory()
+
+    lines = get_export_content(admin_client, '?fields=id,type').splitlines()
+
+    assert json.loads(lines[0]) == {'id': lease.id, 'type': lease.type_id}
+
+
+@pytest.mark.django_db
+def test_export_invalid_format(django_db_setup, admin_client):
+    response = admin_client.get(reverse('lease-export') + '?file_format=xml')
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_export_queries_per_chunk(django_db_setup, lease_graph_factory):
+    def count_queries():
+        exporter = LeaseExporter(Lease.objects.order_by('id'), chunk_size=10)
+
+        with CaptureQueriesContext(connection) as context:
+            lines = list(exporter.iterate_lines())
+
+        return len(lines), len(context.captured_queries)
+
+    for i in range(2):
+        lease_graph_factory()
+
+    line_count, query_count = count_queries()
+
+    for i in range(6):
+        lease_graph_factory()
+
+    assert count_queries() == (line_count + 6, query_count)
+
+
+@pytest.mark.django_db
+def test_export_leases_command(django_db_setup, lease_graph_factory):
+    leases = [lease_graph_factory() for i in range(2)]
+    output = io.StringIO()
+
+    call_command('export_leases', '--format=csv', '--chunk-size=1', stdout=output)
+
+    rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+
+    assert [int(row['id']) for row in rows] == [lease.id for lease in leases]
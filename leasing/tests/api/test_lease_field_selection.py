@@ -0,0 +1,82 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+def get_lease_data(client, lease, query_string=''):
+    url = reverse('lease-detail', kwargs={'pk': lease.id}) + query_string
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+
+    return response.data, len(context.captured_queries)
+
+
+@pytest.mark.django_db
+def test_fields(django_db_setup, admin_client, lease_graph_factory):
+    lease = lease_graph_factory()
+
+    full_data, full_query_count = get_lease_data(admin_client, lease)
+    data, query_count = get_lease_data(admin_client, lease, '?fields=id,identifier,district,state')
+
+    assert set(data.keys()) == {'id', 'identifier', 'district', 'state'}
+    assert data['identifier'] == full_data['identifier']
+    assert query_count < full_query_count
+
+
+@pytest.mark.django_db
+def test_nested_fields(django_db_setup, admin_client, lease_graph_factory):
+    lease = lease_graph_factory()
+
+    data, query_count = get_lease_data(admin_client, lease, '?fields=id,tenants.share_numerator')
+
+    assert set(data.keys()) == {'id', 'tenants'}
+    assert [dict(tenant) for tenant in data['tenants']] == [{'share_numerator': 1}]
+
+
+@pytest.mark.django_db
+def test_omit(django_db_setup, admin_client, lease_graph_factory):
+    lease = lease_graph_factory()
+
+    data, query_count = get_lease_data(admin_client, lease, '?omit=rents,tenants.tenantcontact_set')
+
+    assert 'rents' not in data
+    assert 'tenantcontact_set' not in data['tenants'][0]
+    assert 'share_numerator' in data['tenants'][0]
+
+
+@pytest.mark.django_db
+def test_expand(django_db_setup, admin_client, lease_graph_factory):
+    lease = lease_graph_factory()
+    rent = lease.rents.get()
+    contract_rent = rent.contract_rents.get()
+
+    data, query_count = get_lease_data(admin_client, lease, '?fields=id,lessor,rents,tenants&expand=rents')
+
+    assert data['tenants'] == [lease.tenants.get().id]
+    assert data['rents'][0]['id'] == rent.id
+    assert data['rents'][0]['contract_rents'] == [contract_rent.id]
+
+    data, query_count = get_lease_data(admin_client, lease,
+                                       '?fields=id,rents&expand=rents.contract_rents')
+
+    assert data['rents'][0]['contract_rents'][0]['intended_use'] == contract_rent.intended_use_id
+
+    data, query_count = get_lease_data(admin_client, lease,
+                                       '?fields=id,rents&expand=rents.contract_rents.intended_use')
+
+    assert data['rents'][0]['contract_rents'][0]['intended_use']['id'] == contract_rent.intended_use_id
+
+
+@pytest.mark.django_db
+def test_list_fields(django_db_setup, admin_client, lease_graph_factory):
+    lease_graph_factory()
+    lease_graph_factory()
+
+    response = admin_client.get(reverse('lease-list') + '?fields=id,identifier')
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+    assert [set(item.keys()) for item in response.data['results']] == [{'id', 'identifier'}] * 2
@@ -0,0 +1,72 @@
+import pytest
+from django.urls import reverse
+
+from leasing.billing_summary import get_summary_year, refresh_billing_summaries
+from leasing.enums import TenantContactType
+from leasing.models import Lease, LeaseBillingSummary, LeaseChange
+
+
+@pytest.mark.django_db
+def test_lease_list(django_db_setup, admin_client, lease_graph_factory, contact_factory, tenant_contact_factory,
+                    lease_area_factory):
+    lease = lease_graph_factory()
+    tenant = lease.tenants.get()
+    tenant_contact = tenant.tenantcontact_set.get()
+
+    business = contact_factory(is_business=True, business_name='Business')
+    tenant_contact_factory(type=TenantContactType.TENANT, tenant=tenant, contact=business,
+                           start_date=tenant_contact.start_date)
+    tenant_contact_factory(type=TenantContactType.BILLING, tenant=tenant, contact=contact_factory(
+        first_name='Billing', last_name='Contact'), start_date=tenant_contact.start_date)
+    lease_area_factory(lease=lease, identifier='2', area=50, section_area=25, type=lease.lease_areas.get().type,
+                       location=lease.lease_areas.get().location)
+
+    response = admin_client.get(reverse('lease-list'))
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+
+    data = response.data['results'][0]
+
+    assert data['id'] == lease.id
+    assert data['identifier'] == lease.get_identifier_string()
+    assert data['type'] == lease.type_id
+    assert data['district'] == lease.district_id
+    assert sorted(data['tenant_names'].split(', ')) == ['Business', 'First name Last name']
+    assert data['area_total'] == 150
+    assert data['section_area_total'] == 125
+    assert data['year_rent'] is None
+
+    # The test runs in a transaction, so the changes are versioned like on
+    # a commit
+    LeaseChange.objects.assign_versions()
+    refresh_billing_summaries([lease.id])
+    response = admin_client.get(reverse('lease-list'))
+
+    assert response.data['results'][0]['year_rent'] == str(LeaseBillingSummary.objects.get(lease=lease).year_rent)
+
+    # The stale summaries and the summaries of the other years are not used
+    lease.save()
+    LeaseChange.objects.assign_versions()
+    response = admin_client.get(reverse('lease-list'))
+
+    assert response.data['results'][0]['year_rent'] is None
+
+    refresh_billing_summaries([lease.id], get_summary_year() - 1)
+    response = admin_client.get(reverse('lease-list'))
+
+    assert response.data['results'][0]['year_rent'] is None
+
+
+@pytest.mark.django_db
+def test_lease_list_identifier(django_db_setup, admin_client, lease_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5, notice_period_id=1)
+    identifier = lease.get_identifier_string()
+    # The identifier keeps the district it was allocated with
+    lease.district_id = 6
+    lease.save()
+
+    response = admin_client.get(reverse('lease-list'))
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+    assert response.data['results'][0]['identifier'] == identifier == Lease.objects.get(
+        pk=lease.pk).get_identifier_string()
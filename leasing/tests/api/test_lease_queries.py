@@ -0,0 +1,115 @@
+import json
+
+import pytest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from leasing.enums import PeriodType, RentType
+
+
+def get_query_count(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+
+    return len(context.captured_queries)
+
+
+def get_patch_query_count(client, url, data):
+    with CaptureQueriesContext(connection) as context:
+        response = client.patch(url, data=json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json')
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+
+    return len(context.captured_queries)
+
+
+def get_rent_data(lease, rent_count):
+    rents = []
+
+    for rent in lease.rents.all():
+        rents.append({
+            "id": rent.id,
+            "type": RentType.FIXED.value,
+            "amount": 1000,
+            "contract_rents": [
+                {
+                    "id": contract_rent.id,
+                    "amount": 2000,
+                    "period": contract_rent.period.value,
+                    "intended_use": contract_rent.intended_use_id,
+                    "base_amount": contract_rent.base_amount,
+                    "base_amount_period": contract_rent.base_amount_period.value,
+                } for contract_rent in rent.contract_rents.all()
+            ],
+        })
+
+    for i in range(rent_count - len(rents)):
+        rents.append({
+            "type": RentType.FIXED.value,
+            "amount": 1000,
+            "due_dates": [{"day": 1, "month": 1}, {"day": 1, "month": 7}],
+            "contract_rents": [
+                {
+                    "amount": 1000,
+                    "period": PeriodType.PER_YEAR.value,
+                    "intended_use": 1,
+                    "base_amount": 1000,
+                    "base_amount_period": PeriodType.PER_YEAR.value,
+                },
+            ],
+        })
+
+    return {"rents": rents}
+
+
+@pytest.mark.django_db
+def test_lease_list_query_count_does_not_depend_on_lease_count(django_db_setup, admin_client, lease_graph_factory):
+    url = reverse('lease-list')
+
+    lease_graph_factory()
+    query_count_for_one_lease = get_query_count(admin_client, url)
+
+    for i in range(4):
+        lease_graph_factory()
+    query_count_for_five_leases = get_query_count(admin_client, url)
+
+    assert query_count_for_one_lease == query_count_for_five_leases
+
+
+@pytest.mark.django_db
+def test_lease_detail_query_count_does_not_depend_on_nested_count(django_db_setup, admin_client, lease_graph_factory,
+                                                                  rent_factory):
+    lease = lease_graph_factory()
+    url = reverse('lease-detail', kwargs={'pk': lease.id})
+
+    query_count_for_one_rent = get_query_count(admin_client, url)
+
+    for i in range(4):
+        rent_factory(lease=lease, type=RentType.FREE)
+    query_count_for_five_rents = get_query_count(admin_client, url)
+
+    assert query_count_for_one_rent == query_count_for_five_rents
+
+
+@pytest.mark.django_db
+def test_lease_patch_query_count_does_not_depend_on_nested_count(django_db_setup, admin_client, lease_graph_factory):
+    lease = lease_graph_factory()
+    other_lease = lease_graph_factory()
+    url = reverse('lease-detail', kwargs={'pk': lease.id})
+    other_url = reverse('lease-detail', kwargs={'pk': other_lease.id})
+
+    # Creating the rents
+    query_count_for_two_rents = get_patch_query_count(admin_client, url, get_rent_data(lease, 2))
+    query_count_for_six_rents = get_patch_query_count(admin_client, other_url, get_rent_data(other_lease, 6))
+
+    assert query_count_for_two_rents == query_count_for_six_rents
+
+    # Updating the same rents
+    query_count_for_two_rents = get_patch_query_count(admin_client, url, get_rent_data(lease, 2))
+    query_count_for_six_rents = get_patch_query_count(admin_client, other_url, get_rent_data(other_lease, 6))
+
+    assert query_count_for_two_rents == query_count_for_six_rents
@@ -0,0 +1,59 @@
+import pytest
+from django.urls import reverse
+
+from leasing.models import Contact
+
+
+def get_all_pages(client, url):
+    pages = []
+
+    while url:
+        response = client.get(url)
+
+        assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+
+        pages.append(response.data)
+        url = response.data['next']
+
+    return pages
+
+
+@pytest.mark.django_db
+def test_optional_count(django_db_setup, admin_client, contact_factory):
+    for i in range(5):
+        contact_factory(first_name='First name', last_name=str(i))
+
+    pages = get_all_pages(admin_client, reverse('contact-list') + '?count=false&limit=2')
+
+    assert [len(page['results']) for page in pages] == [2, 2, 1]
+    assert all(page['count'] is None for page in pages)
+
+    pages = get_all_pages(admin_client, reverse('contact-list') + '?count=false&limit=5')
+
+    assert [len(page['results']) for page in pages] == [5]
+
+    response = admin_client.get(reverse('contact-list') + '?limit=2')
+
+    assert response.data['count'] == 5
+
+
+@pytest.mark.django_db
+def test_cursor_pagination(django_db_setup, admin_client, contact_factory):
+    for i in range(5):
+        contact_factory(first_name='First name', last_name=str(i))
+
+    pages = get_all_pages(admin_client, reverse('contact-list') + '?pagination=cursor&limit=2')
+
+    assert [len(page['results']) for page in pages] == [2, 2, 1]
+    assert 'count' not in pages[0]
+    assert [contact['id'] for page in pages for contact in page['results']] == list(
+        Contact.objects.order_by('modified_at', 'id').values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+def test_lease_cursor_pagination(django_db_setup, admin_client, lease_factory):
+    leases = [lease_factory(type_id='A1', municipality_id=1, district_id=5) for i in range(3)]
+
+    pages = get_all_pages(admin_client, reverse('lease-list') + '?pagination=cursor&limit=2')
+
+    assert [lease['id'] for page in pages for lease in page['results']] == [lease.id for lease in leases]
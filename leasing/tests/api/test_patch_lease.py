@@ -1,10 +1,12 @@
 import json
 
 import pytest
+from auditlog.models import LogEntry
 from django.core.serializers.json import DjangoJSONEncoder
 from django.urls import reverse
 
-from leasing.models import Lease
+from leasing.enums import PeriodType, RentType
+from leasing.models import ContractRent, Lease, Rent
 
 
 @pytest.mark.django_db
@@ -52,3 +54,85 @@ def test_remove_tenant(django_db_setup, admin_client, lease_test_data, assert_co
     lease = Lease.objects.get(pk=response.data['id'])
 
     assert lease.tenants.count() == 1
+
+
+@pytest.mark.django_db
+def test_patch_nested_items(django_db_setup, admin_client, admin_user, lease_graph_factory):
+    lease = lease_graph_factory()
+    rent = lease.rents.first()
+    contract_rent = rent.contract_rents.first()
+
+    data = {
+        "rents": [
+            {
+                "id": rent.id,
+                "type": RentType.FIXED.value,
+                "amount": 500,
+                "contract_rents": [
+                    {
+                        "amount": 100,
+                        "period": PeriodType.PER_MONTH.value,
+                        "intended_use": 2,
+                        "base_amount": 100,
+                        "base_amount_period": PeriodType.PER_MONTH.value,
+                    },
+                ],
+            },
+            {
+                "type": RentType.FREE.value,
+            },
+        ]
+    }
+
+    url = reverse('lease-detail', kwargs={'pk': lease.id})
+    response = admin_client.patch(url, data=json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json')
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+
+    assert lease.rents.count() == 2
+    assert Rent.objects.get(pk=rent.id).amount == 500
+    assert rent.due_dates.count() == 1
+
+    new_contract_rent = rent.contract_rents.get()
+    assert new_contract_rent.intended_use_id == 2
+    assert not ContractRent.objects.filter(pk=contract_rent.id).exists()
+    assert ContractRent.all_objects.get(pk=contract_rent.id).deleted is not None
+
+    rent_log_entry = LogEntry.objects.get_for_object(rent).get(action=LogEntry.Action.UPDATE)
+    assert rent_log_entry.actor == admin_user
+    assert set(rent_log_entry.changes_dict.keys()) == {'amount'}
+
+    new_rent = lease.rents.exclude(pk=rent.id).get()
+    assert LogEntry.objects.get_for_object(new_rent).get().action == LogEntry.Action.CREATE
+    assert LogEntry.objects.get_for_object(new_contract_rent).get().action == LogEntry.Action.CREATE
+
+    removed_log_entry = LogEntry.objects.get_for_object(contract_rent).get(action=LogEntry.Action.UPDATE)
+    assert 'deleted' in removed_log_entry.changes_dict
+
+
+@pytest.mark.django_db
+def test_patch_unchanged_nested_items_are_not_written(django_db_setup, admin_client, lease_graph_factory):
+    lease = lease_graph_factory()
+    url = reverse('lease-detail', kwargs={'pk': lease.id})
+
+    lease_data = admin_client.get(url).data
+    data = {
+        "tenants": lease_data['tenants'],
+        "lease_areas": lease_data['lease_areas'],
+        "rents": lease_data['rents'],
+    }
+    log_entry_count = LogEntry.objects.count()
+
+    response = admin_client.patch(url, data=json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json')
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+    assert response['X-Rows-Written'] == '1'
+    assert LogEntry.objects.count() == log_entry_count
+
+    data['rents'][0]['contract_rents'][0]['amount'] = 1234
+
+    response = admin_client.patch(url, data=json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json')
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+    assert response['X-Rows-Written'] == '2'
+    assert LogEntry.objects.count() == log_entry_count + 1
@@ -0,0 +1,33 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from leasing.models import LeaseChange
+
+
+@pytest.mark.django_db
+def test_rent_forecast(django_db_setup, admin_client, billed_lease_factory):
+    cache.clear()
+    billed_lease_factory()
+    # The test runs in a transaction, so the changes are versioned like on
+    # a commit
+    LeaseChange.objects.assign_versions()
+
+    response = admin_client.get(reverse('lease-forecast'), {'first_year': 2019, 'years': 2})
+
+    assert response.status_code == 200, '%s %s' % (response.status_code, response.data)
+    assert response.data['data_version']
+    assert [(row['year'], row['municipality'], row['district'], row['intended_use'], row['type'], row['amount'])
+            for row in response.data['results']] == [
+        (2019, 1, 5, 1, 'fixed', '1200.00'),
+        (2020, 1, 5, 1, 'fixed', '1200.00'),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [{'years': 0}, {'years': 'many'}, {'first_year': 100},
+                                    {'first_year': 9999, 'years': 5}])
+def test_rent_forecast_invalid_parameters(django_db_setup, admin_client, params):
+    response = admin_client.get(reverse('lease-forecast'), params)
+
+    assert response.status_code == 400, '%s %s' % (response.status_code, response.data)
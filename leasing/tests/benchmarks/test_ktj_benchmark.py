@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+import pytest
+import requests
+from django.conf import settings
+from django.http import QueryDict
+from requests.auth import HTTPBasicAuth
+
+from leasing import ktj
+from leasing.ktj_cache import KtjPrintCache
+
+pytestmark = pytest.mark.skipif(not os.environ.get('MVJ_BENCHMARK'), reason='Set MVJ_BENCHMARK=1 to run')
+
+REQUEST_COUNT = 100
+
+# Seconds to set up a connection, like a TLS handshake with the service
+CONNECTION_DELAY = 0.02
+
+
+def request_with_new_connection():
+    """Requests a print like the proxy did before the pooled session"""
+    url = '{}/ktjkii/tuloste/lainhuutotodistus/pdf'.format(settings.KTJ_PRINT_ROOT_URL)
+    r = requests.get(url, data={}, auth=HTTPBasicAuth(settings.KTJ_PRINT_USERNAME, settings.KTJ_PRINT_PASSWORD),
+                     stream=True)
+
+    return b''.join(r.raw.stream(ktj.KTJ_PRINT_CHUNK_SIZE))
+
+
+def request_with_session():
+    response = ktj.request_print('ktjkii', 'lainhuutotodistus', {})
+
+    return b''.join(ktj.iterate_content(response))
+
+
+def request_with_cache():
+    file, response = KtjPrintCache().get('ktjkii', 'lainhuutotodistus', QueryDict())
+
+    with file:
+        return b''.join(iter(lambda: file.read(ktj.KTJ_PRINT_CHUNK_SIZE), b''))
+
+
+def test_ktj_proxy_benchmark(fake_ktj_server, capsys):
+    fake_ktj_server.connection_delay = CONNECTION_DELAY
+    fake_ktj_server.content = os.urandom(1024 * 1024)
+
+    with capsys.disabled():
+        sys.stdout.write('\n{:<16} {:>10} {:>12} {:>12}\n'.format('', 'requests', 'per request', 'MB/s'))
+
+        for name, function in (('new connection', request_with_new_connection),
+                               ('pooled session', request_with_session), ('cached print', request_with_cache)):
+            start = time.perf_counter()
+            for i in range(REQUEST_COUNT):
+                assert function() == fake_ktj_server.content
+            duration = time.perf_counter() - start
+
+            sys.stdout.write('{:<16} {:>10} {:>10.1f}ms {:>12.1f}\n'.format(
+                name, REQUEST_COUNT, duration / REQUEST_COUNT * 1000, REQUEST_COUNT / duration))
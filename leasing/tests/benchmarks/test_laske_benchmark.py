@@ -0,0 +1,61 @@
+import datetime
+import os
+import sys
+import time
+from xml.etree import ElementTree
+
+import pytest
+
+from leasing.billing import create_invoices
+from leasing.billing_summary import get_billing_summaries
+from leasing.laske import LASKE_PREFETCH_LOOKUPS, LASKE_SELECT_RELATED, render_invoice, serialize_invoice
+from leasing.models import Invoice
+
+pytestmark = pytest.mark.skipif(not os.environ.get('MVJ_BENCHMARK'), reason='Set MVJ_BENCHMARK=1 to run')
+
+LEASE_COUNT = 500
+
+ROUNDS = 5
+
+
+def serialize_with_elements(invoices, summaries):
+    return [ElementTree.tostring(serialize_invoice(invoice, summary=summaries[invoice.lease_id]), encoding='unicode')
+            for invoice in invoices]
+
+
+def serialize_with_template(invoices, summaries):
+    return [render_invoice(invoice, summary=summaries[invoice.lease_id]) for invoice in invoices]
+
+
+def measure(function, invoices, summaries):
+    """Returns the output of the function and its best time of the rounds"""
+    durations = []
+
+    for i in range(ROUNDS):
+        start = time.perf_counter()
+        output = function(invoices, summaries)
+        durations.append(time.perf_counter() - start)
+
+    return output, min(durations)
+
+
+@pytest.mark.django_db
+def test_laske_serialization_benchmark(django_db_setup, laske_lease_factory, capsys):
+    for i in range(LEASE_COUNT):
+        laske_lease_factory(shares=((1, 2), (1, 2)) if i % 2 else ((1, 1),))
+    create_invoices(datetime.date(2018, 2, 10))
+
+    invoices = list(Invoice.objects.select_related(*LASKE_SELECT_RELATED).prefetch_related(
+        *LASKE_PREFETCH_LOOKUPS).order_by('id'))
+    # The summaries of the year of the invoices include their year rents
+    summaries = get_billing_summaries({invoice.lease_id for invoice in invoices}, 2018)
+
+    element_output, element_duration = measure(serialize_with_elements, invoices, summaries)
+    template_output, template_duration = measure(serialize_with_template, invoices, summaries)
+
+    with capsys.disabled():
+        sys.stdout.write('\n{:>8} {:>16} {:>16}\n'.format('invoices', 'elements', 'template'))
+        sys.stdout.write('{:>8} {:>13.1f}µs {:>13.1f}µs\n'.format(
+            len(invoices), element_duration / len(invoices) * 1e6, template_duration / len(invoices) * 1e6))
+
+    assert template_output == element_output
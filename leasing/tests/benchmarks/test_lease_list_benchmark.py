@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from leasing.models import Lease
+from leasing.serializers.lease import LeaseListSerializer, LeaseSerializer
+from leasing.serializers.utils import get_related_lookups
+
+pytestmark = pytest.mark.skipif(not os.environ.get('MVJ_BENCHMARK'), reason='Set MVJ_BENCHMARK=1 to run')
+
+PAGE_SIZES = (30, 100, 1000)
+
+
+def measure(serializer_class, queryset):
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        content = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        duration = time.perf_counter() - start
+
+    return duration, len(context.captured_queries), len(content)
+
+
+@pytest.mark.django_db
+def test_lease_list_serializer_benchmark(django_db_setup, lease_graph_factory, capsys):
+    for i in range(max(PAGE_SIZES)):
+        lease_graph_factory()
+
+    select_related, prefetch_related = get_related_lookups(LeaseSerializer())
+    full_queryset = Lease.objects.select_related(*select_related).prefetch_related(*prefetch_related).order_by('id')
+    list_queryset = LeaseListSerializer.annotate_queryset(Lease.objects.order_by('id'))
+
+    with capsys.disabled():
+        sys.stdout.write('\n{:>6} {:>16} {:>10} {:>12} {:>16} {:>10} {:>12}\n'.format(
+            'leases', 'LeaseSerializer', 'queries', 'bytes', 'LeaseListSerial.', 'queries', 'bytes'))
+
+        for page_size in PAGE_SIZES:
+            full = measure(LeaseSerializer, full_queryset[:page_size])
+            compact = measure(LeaseListSerializer, list_queryset[:page_size])
+
+            sys.stdout.write('{:>6} {:>15.3f}s {:>10} {:>12} {:>15.3f}s {:>10} {:>12}\n'.format(
+                page_size, *(full + compact)))
+
+            assert compact[1] == 1
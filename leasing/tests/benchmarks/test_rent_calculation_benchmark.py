@@ -0,0 +1,52 @@
+import datetime
+import os
+import random
+import sys
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leasing.batch_calculation import calculate_rent_amounts_batch
+from leasing.calculation import calculate_rent_amounts
+from leasing.models import Lease
+
+pytestmark = pytest.mark.skipif(not os.environ.get('MVJ_BENCHMARK'), reason='Set MVJ_BENCHMARK=1 to run')
+
+LEASE_COUNTS = (100, 1000, 5000)
+
+PERIOD = (datetime.date(2018, 1, 1), datetime.date(2018, 12, 31))
+
+
+def measure(function, queryset):
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        amounts = function(queryset, *PERIOD)
+        duration = time.perf_counter() - start
+
+    return amounts, duration, len(context.captured_queries)
+
+
+@pytest.mark.django_db
+def test_rent_calculation_benchmark(django_db_setup, random_lease_factory, capsys):
+    rng = random.Random(2018)
+    lease_count = 0
+
+    with capsys.disabled():
+        sys.stdout.write('\n{:>6} {:>12} {:>10} {:>12} {:>10}\n'.format(
+            'leases', 'scalar', 'queries', 'batch', 'queries'))
+
+        for target_count in LEASE_COUNTS:
+            for i in range(target_count - lease_count):
+                random_lease_factory(rng)
+            lease_count = target_count
+
+            queryset = Lease.objects.order_by('id')
+            scalar_amounts, scalar_duration, scalar_queries = measure(calculate_rent_amounts, queryset)
+            batch_amounts, batch_duration, batch_queries = measure(calculate_rent_amounts_batch, queryset)
+
+            sys.stdout.write('{:>6} {:>11.3f}s {:>10} {:>11.3f}s {:>10}\n'.format(
+                lease_count, scalar_duration, scalar_queries, batch_duration, batch_queries))
+
+            assert batch_amounts == scalar_amounts
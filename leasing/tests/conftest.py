@@ -1,15 +1,30 @@
+import datetime
+import sys
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
 
 import factory
 import pytest
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.utils import timezone
 from pytest_factoryboy import register
 
-from leasing.enums import TenantContactType
-from leasing.models import Contact, District, Lease, LeaseType, Municipality, NoticePeriod, Tenant, TenantContact
+from leasing import ktj, ktj_prefetch
+from leasing.enums import (
+    ConstructabilityType, DueDatesType, LeaseAreaType, LocationType, PeriodType, PlotType, RentAdjustmentAmountType,
+    RentAdjustmentType, RentCycle, RentType, TenantContactType)
+from leasing.models import (
+    Condition, ConstructabilityDescription, Contact, Contract, ContractChange, ContractRent, Decision, District,
+    FixedInitialYearRent, IndexAdjustedRent, Inspection, Invoice, Lease, LeaseArea, LeaseBasisOfRent, LeaseType,
+    MortgageDocument, Municipality, NoticePeriod, PlanUnit, Plot, Rent, RentAdjustment, RentDueDate, Tenant,
+    TenantContact)
 
 
 @pytest.fixture()
@@ -21,14 +36,39 @@ def assert_count_equal():
     return do_test
 
 
-@pytest.fixture(scope='session')
-def django_db_setup(django_db_setup, django_db_blocker):
+def load_fixtures():
     """Loads all the database fixtures in the leasing/fixtures folder"""
     fixture_path = Path(__file__).parents[1] / 'fixtures'
     fixture_filenames = [path for path in fixture_path.glob('*') if not path.is_dir()]
 
+    call_command('loaddata', *fixture_filenames)
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker):
     with django_db_blocker.unblock():
-        call_command('loaddata', *fixture_filenames)
+        load_fixtures()
+
+
+@pytest.fixture
+def committed_db(django_db_setup, django_db_blocker):
+    """Database access without a test transaction, so that the other
+    processes see the data of the test
+
+    The database is flushed after the test and the fixtures are loaded again."""
+    with django_db_blocker.unblock():
+        yield
+        call_command('flush', interactive=False, verbosity=0)
+        load_fixtures()
+
+
+@pytest.fixture
+def committed_admin_client(committed_db, client):
+    """A client logged in as a superuser, for the tests that use committed_db
+    as admin_client runs the test in a transaction"""
+    client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    return client
 
 
 @register
@@ -37,6 +77,12 @@ class ContactFactory(factory.DjangoModelFactory):
         model = Contact
 
 
+@register
+class InvoiceFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Invoice
+
+
 @register
 class UserFactory(factory.DjangoModelFactory):
     class Meta:
@@ -85,6 +131,170 @@ class NoticePeriodFactory(factory.DjangoModelFactory):
         model = NoticePeriod
 
 
+@register
+class LeaseAreaFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = LeaseArea
+
+
+@register
+class PlotFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Plot
+
+
+@register
+class PlanUnitFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = PlanUnit
+
+
+@register
+class ConstructabilityDescriptionFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = ConstructabilityDescription
+
+
+@register
+class ContractFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Contract
+
+
+@register
+class MortgageDocumentFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = MortgageDocument
+
+
+@register
+class ContractChangeFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = ContractChange
+
+
+@register
+class DecisionFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Decision
+
+
+@register
+class ConditionFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Condition
+
+
+@register
+class RentFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Rent
+
+
+@register
+class RentDueDateFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = RentDueDate
+
+
+@register
+class ContractRentFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = ContractRent
+
+
+@register
+class FixedInitialYearRentFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = FixedInitialYearRent
+
+
+@register
+class IndexAdjustedRentFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = IndexAdjustedRent
+
+
+@register
+class RentAdjustmentFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = RentAdjustment
+
+
+@register
+class LeaseBasisOfRentFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = LeaseBasisOfRent
+
+
+@register
+class InspectionFactory(factory.DjangoModelFactory):
+    class Meta:
+        model = Inspection
+
+
+@pytest.fixture
+def lease_graph_factory(lease_factory, contact_factory, tenant_factory, tenant_contact_factory, lease_area_factory,
+                        plot_factory, plan_unit_factory, constructability_description_factory, contract_factory,
+                        mortgage_document_factory, contract_change_factory, decision_factory, condition_factory,
+                        rent_factory, rent_due_date_factory, contract_rent_factory, rent_adjustment_factory,
+                        lease_basis_of_rent_factory, inspection_factory, admin_user):
+    """Returns a function that creates a lease with one of each of the nested objects"""
+    def create_lease_graph(**kwargs):
+        lease_kwargs = {
+            'type_id': 'A1',
+            'municipality_id': 1,
+            'district_id': 5,
+            'notice_period_id': 1,
+        }
+        lease_kwargs.update(kwargs)
+        lease = lease_factory(**lease_kwargs)
+
+        tenant = tenant_factory(lease=lease, share_numerator=1, share_denominator=1)
+        contact = contact_factory(first_name='First name', last_name='Last name')
+        tenant_contact_factory(type=TenantContactType.TENANT, tenant=tenant, contact=contact,
+                               start_date=timezone.now().date())
+
+        lease_area = lease_area_factory(lease=lease, identifier='12345', area=100, section_area=100,
+                                        address='Test address 1', postal_code='00100', city='Helsinki',
+                                        type=LeaseAreaType.REAL_PROPERTY, location=LocationType.SURFACE,
+                                        polluted_land_planner=admin_user)
+        plot_factory(lease_area=lease_area, identifier='91-1-1-1', area=100, section_area=100,
+                     address='Test address 1', postal_code='00100', city='Helsinki', type=PlotType.REAL_PROPERTY)
+        plan_unit_factory(lease_area=lease_area, identifier='91-1-1-1', area=100, section_area=100,
+                          address='Test address 1', postal_code='00100', city='Helsinki',
+                          type=PlotType.REAL_PROPERTY, plot_division_identifier='1',
+                          plot_division_date_of_approval=timezone.now().date(), detailed_plan_identifier='1',
+                          detailed_plan_date_of_approval=timezone.now().date(), plan_unit_type_id=1,
+                          plan_unit_state_id=1)
+        constructability_description_factory(lease_area=lease_area, type=ConstructabilityType.OTHER,
+                                             user=admin_user, text='Text')
+
+        decision = decision_factory(lease=lease, reference_number='HEL 2018-000001', decision_maker_id=1,
+                                    type_id=1)
+        condition_factory(decision=decision, type_id=1, description='Condition')
+
+        contract = contract_factory(lease=lease, type_id=1, contract_number='1', decision=decision)
+        mortgage_document_factory(contract=contract, number='1')
+        contract_change_factory(contract=contract, description='Change', decision=decision)
+
+        rent = rent_factory(lease=lease, type=RentType.FIXED, cycle=RentCycle.JANUARY_TO_DECEMBER,
+                            due_dates_type=DueDatesType.CUSTOM, amount=1000)
+        rent_due_date_factory(rent=rent, day=1, month=1)
+        contract_rent_factory(rent=rent, amount=1000, period=PeriodType.PER_YEAR, intended_use_id=1,
+                              base_amount=1000, base_amount_period=PeriodType.PER_YEAR)
+        rent_adjustment_factory(rent=rent, type=RentAdjustmentType.DISCOUNT, intended_use_id=1, full_amount=10,
+                                amount_type=RentAdjustmentAmountType.PERCENT_PER_YEAR, decision=decision)
+
+        lease_basis_of_rent_factory(lease=lease, intended_use_id=1)
+
+        inspection_factory(lease=lease, inspector='Inspector')
+
+        return lease
+
+    return create_lease_graph
+
+
 @pytest.fixture
 def lease_test_data(lease_factory, contact_factory, tenant_factory, tenant_contact_factory):
     lease = lease_factory(
@@ -119,3 +329,196 @@ def lease_test_data(lease_factory, contact_factory, tenant_factory, tenant_conta
         'tenants': tenants,
         'tenantcontacts': tenantcontacts,
     }
+
+
+def random_date(rng, allow_none=True):
+    if allow_none and rng.random() < 0.3:
+        return None
+
+    return datetime.date(2017, 1, 1) + datetime.timedelta(days=rng.randrange(4 * 365))
+
+
+def random_range(rng):
+    start_date = random_date(rng)
+    end_date = random_date(rng)
+
+    if start_date and end_date and start_date > end_date:
+        start_date, end_date = end_date, start_date
+
+    return start_date, end_date
+
+
+def random_amount(rng):
+    return rng.randrange(1, 10 ** 7) / 100
+
+
+@pytest.fixture
+def random_lease_factory(lease_factory, rent_factory, contract_rent_factory, fixed_initial_year_rent_factory,
+                         index_adjusted_rent_factory, rent_adjustment_factory):
+    """Returns a function that creates a lease with random rents"""
+    def create_lease(rng):
+        start_date, end_date = random_range(rng)
+        lease = lease_factory(type_id='A1', municipality_id=1, district_id=5, start_date=start_date,
+                              end_date=end_date)
+
+        for i in range(rng.randrange(3)):
+            rent = rent_factory(lease=lease, type=rng.choice(list(RentType)),
+                                cycle=rng.choice(list(RentCycle) + [None]), amount=random_amount(rng),
+                                is_active=rng.random() < 0.9)
+
+            for j in range(rng.randrange(3)):
+                period = rng.choice(list(PeriodType))
+                contract_rent_factory(rent=rent, amount=random_amount(rng), period=period,
+                                      intended_use_id=rng.choice((1, 2)), base_amount=1, base_amount_period=period,
+                                      start_date=random_date(rng), end_date=random_date(rng))
+
+            if rng.random() < 0.3:
+                fixed_initial_year_rent_factory(rent=rent, amount=random_amount(rng), start_date=random_date(rng),
+                                                end_date=random_date(rng))
+
+            for j in range(rng.randrange(2)):
+                index_adjusted_rent_factory(rent=rent, amount=random_amount(rng), intended_use_id=rng.choice((1, 2)),
+                                            start_date=random_date(rng, allow_none=False),
+                                            end_date=random_date(rng, allow_none=False), factor=1)
+
+            for j in range(rng.randrange(3)):
+                amount_type = rng.choice(list(RentAdjustmentAmountType))
+                if amount_type in (RentAdjustmentAmountType.PERCENT_PER_YEAR, RentAdjustmentAmountType.PERCENT_TOTAL):
+                    full_amount = rng.randrange(0, 10000) / 100
+                else:
+                    full_amount = random_amount(rng)
+
+                adjustment_start_date, adjustment_end_date = random_range(rng)
+                rent_adjustment_factory(rent=rent, type=rng.choice(list(RentAdjustmentType)),
+                                        intended_use_id=rng.choice((1, 2)), amount_type=amount_type,
+                                        full_amount=full_amount, start_date=adjustment_start_date,
+                                        end_date=adjustment_end_date)
+
+        return lease
+
+    return create_lease
+
+
+@pytest.fixture
+def billed_lease_factory(lease_factory, rent_factory, contract_rent_factory, contact_factory, tenant_factory,
+                         tenant_contact_factory):
+    """Returns a function that creates a lease with billing enabled, a rent of
+    1200 € per year in four periods and a tenant for each of the shares"""
+    def create_lease(shares=((1, 1),), is_billing_enabled=True):
+        lease = lease_factory(type_id='A1', municipality_id=1, district_id=5, is_billing_enabled=is_billing_enabled)
+        rent = rent_factory(lease=lease, type=RentType.FIXED, cycle=RentCycle.JANUARY_TO_DECEMBER,
+                            due_dates_type=DueDatesType.FIXED, due_dates_per_year=4)
+        contract_rent_factory(rent=rent, amount=1200, period=PeriodType.PER_YEAR, intended_use_id=1, base_amount=1200,
+                              base_amount_period=PeriodType.PER_YEAR)
+
+        for (numerator, denominator) in shares:
+            tenant = tenant_factory(lease=lease, share_numerator=numerator, share_denominator=denominator)
+            tenant_contact_factory(tenant=tenant, type=TenantContactType.TENANT, start_date=datetime.date(2000, 1, 1),
+                                   contact=contact_factory(first_name='First', last_name='Last'))
+
+        return lease
+
+    return create_lease
+
+
+@pytest.fixture
+def laske_lease_factory(billed_lease_factory, contract_factory, lease_area_factory):
+    """Returns a function that creates a billed lease with a contract number
+    and a lease area for the LASKE sales orders"""
+    def create_lease(**kwargs):
+        lease = billed_lease_factory(**kwargs)
+        contract_factory(lease=lease, type_id=1, contract_number='C{}'.format(lease.id))
+        lease_area_factory(lease=lease, identifier='91-1-1-{}'.format(lease.id), area=100, section_area=100,
+                           address='Address {}'.format(lease.id), postal_code='00100', city='Helsinki',
+                           type=LeaseAreaType.REAL_PROPERTY, location=LocationType.SURFACE)
+
+        return lease
+
+    return create_lease
+
+
+class FakeKtjServer(ThreadingMixIn, HTTPServer):
+    """A local HTTP server that answers like the KTJ print service
+
+    Each new connection is accepted after `connection_delay` seconds, like
+    after a TLS handshake with the service. The first `failures` requests are answered with 503. The other requests
+    are answered with the content after `delay` seconds, written in chunks
+    of `chunk_size` bytes with `chunk_delay` seconds between them. The path
+    and the parameters of each request and the client port of each new
+    connection are recorded."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeKtjRequestHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        self.content = b'%PDF-1.4 fake print\n' * 1000
+        self.connection_delay = 0
+        self.delay = 0
+        self.chunk_size = 16 * 1024
+        self.chunk_delay = 0
+        self.failures = 0
+        self.requests = []
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # The clients that time out close their connections mid-response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeKtjRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections.append(self.client_address[1])
+        time.sleep(self.server.connection_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):  # noqa: N802
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+
+        with self.server.lock:
+            self.server.requests.append((self.path, parse_qs(body)))
+            failed = len(self.server.requests) <= self.server.failures
+
+        if failed:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(self.server.content)))
+        self.end_headers()
+
+        for start in range(0, len(self.server.content), self.server.chunk_size):
+            time.sleep(self.server.chunk_delay)
+            self.wfile.write(self.server.content[start:start + self.server.chunk_size])
+
+
+@pytest.fixture
+def fake_ktj_server(settings, tmpdir):
+    """Runs a FakeKtjServer in a thread and points the KTJ print settings at
+    it and the print cache at a temporary directory"""
+    server = FakeKtjServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.KTJ_PRINT_ROOT_URL = server.url
+    settings.KTJ_PRINT_USERNAME = 'username'
+    settings.KTJ_PRINT_PASSWORD = 'password'
+    settings.KTJ_PRINT_CACHE_ROOT = str(tmpdir.join('ktj_cache'))
+
+    yield server
+
+    # The pooled connections to the server are of no use to the other tests
+    ktj_prefetch.shutdown_executor()
+    ktj.close_session()
+    server.shutdown()
+    server.server_close()
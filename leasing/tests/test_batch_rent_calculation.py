@@ -0,0 +1,46 @@
+import datetime
+import random
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leasing.batch_calculation import calculate_rent_amounts_batch
+from leasing.calculation import calculate_rent_amounts
+from leasing.models import Lease
+
+PERIODS = [
+    (datetime.date(2018, 1, 1), datetime.date(2018, 12, 31)),
+    (datetime.date(2018, 3, 1), datetime.date(2018, 3, 31)),
+    (datetime.date(2020, 2, 1), datetime.date(2020, 2, 29)),
+    (datetime.date(2019, 11, 15), datetime.date(2020, 5, 14)),
+]
+
+
+@pytest.mark.django_db
+def test_batch_matches_scalar(django_db_setup, random_lease_factory):
+    rng = random.Random(12345)
+
+    for i in range(60):
+        random_lease_factory(rng)
+
+    queryset = Lease.objects.order_by('id')
+
+    for period in PERIODS:
+        batch_amounts = calculate_rent_amounts_batch(queryset, *period, chunk_size=25)
+
+        assert batch_amounts == calculate_rent_amounts(queryset, *period)
+
+
+@pytest.mark.django_db
+def test_batch_queries(django_db_setup, random_lease_factory):
+    rng = random.Random(1)
+
+    for i in range(10):
+        random_lease_factory(rng)
+
+    with CaptureQueriesContext(connection) as context:
+        calculate_rent_amounts_batch(Lease.objects.all(), *PERIODS[0])
+
+    # The lease ids and a query per table
+    assert len(context.captured_queries) == 7
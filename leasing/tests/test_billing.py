@@ -0,0 +1,137 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from auditlog.models import LogEntry
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from leasing import billing
+from leasing.billing import create_invoices, get_reference_number, run_billing
+from leasing.enums import BillingRunState, TenantContactType
+from leasing.models import BillingRun, Invoice
+
+FEBRUARY_10_2018 = datetime.date(2018, 2, 10)
+
+
+@pytest.mark.django_db
+def test_create_invoices(django_db_setup, billed_lease_factory, contact_factory, tenant_contact_factory):
+    lease = billed_lease_factory(shares=((1, 3), (2, 3)))
+    billed_lease_factory(is_billing_enabled=False)
+    first_tenant, second_tenant = lease.tenants.order_by('id')
+    billing_contact = contact_factory(is_business=True, business_name='Company')
+    tenant_contact_factory(tenant=second_tenant, type=TenantContactType.BILLING, contact=billing_contact,
+                           start_date=datetime.date(2018, 1, 1))
+    # Not in effect in the billing period
+    tenant_contact_factory(tenant=first_tenant, type=TenantContactType.BILLING, contact=billing_contact,
+                           start_date=datetime.date(2018, 7, 1))
+
+    totals = create_invoices(FEBRUARY_10_2018).get_statistics()
+
+    assert (totals['leases'], totals['invoices'], totals['existing_invoices']) == (1, 2, 0)
+    # The rent from April to June is 1200 * 91 / 365 = 299.18
+    assert [(invoice.billing_contact, invoice.amount, invoice.period_start_date, invoice.period_end_date,
+             list(invoice.tenants.all())) for invoice in Invoice.objects.order_by('amount')] == [
+        (first_tenant.tenantcontact_set.get(type=TenantContactType.TENANT).contact, Decimal('99.73'),
+         datetime.date(2018, 4, 1), datetime.date(2018, 6, 30), [first_tenant]),
+        (billing_contact, Decimal('199.45'), datetime.date(2018, 4, 1), datetime.date(2018, 6, 30), [second_tenant]),
+    ]
+
+    # The invoices have reference numbers and are in the audit log
+    invoices = list(Invoice.objects.order_by('id'))
+    assert [invoice.reference_number for invoice in invoices] == [
+        get_reference_number(invoice.id) for invoice in invoices]
+    assert set(LogEntry.objects.get_for_objects(Invoice.objects.all()).values_list(
+        'object_id', 'action')) == {(invoice.id, LogEntry.Action.CREATE) for invoice in invoices}
+
+    # The invoices are created only once
+    totals = create_invoices(FEBRUARY_10_2018).get_statistics()
+
+    assert (totals['leases'], totals['invoices'], totals['existing_invoices']) == (1, 0, 2)
+    assert Invoice.objects.count() == 2
+
+    invoice = Invoice.objects.first()
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Invoice.objects.create(lease=invoice.lease, billing_contact=invoice.billing_contact,
+                               period_start_date=invoice.period_start_date, period_end_date=invoice.period_end_date,
+                               due_date=invoice.due_date, amount=invoice.amount)
+
+
+@pytest.mark.parametrize('invoice_id, reference_number', [
+    (1, '0013'),
+    (123, '1232'),
+    (1000, '10003'),
+    (12345, '123453'),
+])
+def test_reference_number(invoice_id, reference_number):
+    assert get_reference_number(invoice_id) == reference_number
+
+
+@pytest.mark.django_db
+def test_resume_billing_run(django_db_setup, billed_lease_factory, monkeypatch):
+    leases = [billed_lease_factory() for i in range(5)]
+    get_billing_periods = billing.get_billing_periods
+
+    def fail_on_third_lease(date, first_lease_id, last_lease_id):
+        if first_lease_id <= leases[2].id <= last_lease_id:
+            raise ValueError('Failed')
+
+        return get_billing_periods(date, first_lease_id, last_lease_id)
+
+    monkeypatch.setattr(billing, 'get_billing_periods', fail_on_third_lease)
+    run = create_invoices(FEBRUARY_10_2018, chunk_size=2)
+    statistics = run.get_statistics()
+
+    assert run.state == BillingRunState.FAILED
+    assert (statistics['leases'], statistics['invoices'], statistics['errors']) == (3, 3, 1)
+    assert 'ValueError: Failed' in run.chunks.get(error__isnull=False).error
+    assert set(Invoice.objects.values_list('lease_id', flat=True)) == {leases[0].id, leases[1].id, leases[4].id}
+
+    # A failed range that fails again is counted once
+    run_billing(BillingRun.objects.get(pk=run.pk))
+
+    assert run.get_statistics()['errors'] == 1
+    assert run.chunks.filter(error__isnull=False).count() == 2
+
+    # Resuming processes only the failed range
+    monkeypatch.setattr(billing, 'get_billing_periods', get_billing_periods)
+    totals = run_billing(BillingRun.objects.get(pk=run.pk))
+
+    assert (totals['leases'], totals['invoices'], totals['existing_invoices']) == (2, 2, 0)
+    run.refresh_from_db()
+    assert run.state == BillingRunState.FINISHED
+    assert run.get_statistics()['errors'] == 0
+    assert run.get_statistics()['leases'] == 5
+    assert run.get_statistics()['leases_per_second'] > 0
+    assert Invoice.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_create_invoices_queries(django_db_setup, billed_lease_factory):
+    def create_invoices_and_count_queries(date):
+        with CaptureQueriesContext(connection) as context:
+            create_invoices(date)
+
+        return len(context.captured_queries)
+
+    for i in range(2):
+        billed_lease_factory(shares=((1, 2), (1, 2)))
+    query_count = create_invoices_and_count_queries(FEBRUARY_10_2018)
+
+    for i in range(8):
+        billed_lease_factory(shares=((1, 2), (1, 2)))
+
+    assert create_invoices_and_count_queries(datetime.date(2018, 5, 10)) == query_count
+    assert Invoice.objects.count() == 24
+
+
+def test_create_invoices_in_parallel(committed_db, billed_lease_factory):
+    for i in range(5):
+        billed_lease_factory(shares=((1, 2), (1, 2)))
+
+    call_command('create_invoices', date=FEBRUARY_10_2018, chunk_size=2, workers=2, verbosity=0)
+    call_command('create_invoices', date=FEBRUARY_10_2018, chunk_size=3, workers=2, verbosity=0)
+
+    assert Invoice.objects.count() == 10
+    assert set(Invoice.objects.values_list('amount', flat=True)) == {Decimal('149.59')}
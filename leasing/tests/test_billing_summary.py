@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from leasing.billing_summary import get_billing_summaries, get_fresh_billing_summaries, refresh_stale_billing_summaries
+from leasing.models import IntendedUse, LeaseBillingSummary
+
+
+def test_billing_summaries(committed_db, laske_lease_factory):
+    lease = laske_lease_factory()
+    lease.intended_use = IntendedUse.objects.create(name='Asunto')
+    lease.save()
+
+    summary = get_billing_summaries([lease.id], 2018)[lease.id]
+
+    assert summary.identifier == lease.get_identifier_string()
+    assert summary.year == 2018
+    assert summary.year_rent == Decimal('1200.00')
+    assert summary.real_property_unit_identifiers == '91-1-1-{}'.format(lease.id)
+    assert summary.addresses == 'Address {}'.format(lease.id)
+    assert summary.intended_use == 'Asunto'
+    assert LeaseBillingSummary.objects.count() == 1
+
+    # A fresh summary is read with one query
+    with CaptureQueriesContext(connection) as context:
+        assert get_billing_summaries([lease.id], 2018)[lease.id].refreshed_at == summary.refreshed_at
+
+    assert len(context.captured_queries) == 1
+
+    # Saving a related item marks the summary stale through the change feed
+    lease_area = lease.lease_areas.get()
+    lease_area.address = 'New address'
+    lease_area.save()
+
+    assert get_billing_summaries([lease.id], 2018)[lease.id].addresses == 'New address'
+
+    # A summary refreshed before the change is committed is stale after the
+    # commit
+    with transaction.atomic():
+        lease_area.address = 'Newer address'
+        lease_area.save()
+
+        assert get_billing_summaries([lease.id], 2018)[lease.id].addresses == 'Newer address'
+
+    assert not get_fresh_billing_summaries(2018).filter(lease=lease).exists()
+    assert get_billing_summaries([lease.id], 2019)[lease.id].year == 2019
+    assert LeaseBillingSummary.objects.count() == 1
+
+
+def test_refresh_stale_billing_summaries(committed_db, laske_lease_factory):
+    leases = [laske_lease_factory() for i in range(3)]
+    progress_calls = []
+
+    assert refresh_stale_billing_summaries(2018, chunk_size=2, progress=lambda *args: progress_calls.append(args)) == 3
+    assert progress_calls == [(2, 3), (3, 3)]
+    assert refresh_stale_billing_summaries(2018) == 0
+
+    leases[1].end_date = leases[1].start_date
+    leases[1].save()
+
+    assert refresh_stale_billing_summaries(2018) == 1
+    assert refresh_stale_billing_summaries(2018, refresh_all=True) == 3
+
+    leases[2].delete()
+
+    assert LeaseBillingSummary.objects.filter(lease=leases[2]).exists()
+    assert refresh_stale_billing_summaries(2018) == 0
@@ -0,0 +1,130 @@
+import datetime
+
+import pytest
+from django.core.management import call_command
+from django.db import transaction
+
+from leasing.due_date_calendar import (
+    get_calendar_years, get_due_dates, regenerate_due_date_calendar, regenerate_lease_due_dates)
+from leasing.enums import DueDatesType, RentType
+from leasing.models import CalendarDueDate, RentDueDate
+from leasing.signals import due_date_regeneration
+
+
+def get_calendar(lease):
+    return list(CalendarDueDate.objects.filter(lease=lease).values_list('due_date', 'period_start_date',
+                                                                        'period_end_date'))
+
+
+@pytest.mark.django_db
+def test_calendar_due_dates(django_db_setup, billed_lease_factory, rent_due_date_factory):
+    fixed_lease = billed_lease_factory()
+    custom_lease = billed_lease_factory()
+    custom_lease.end_date = datetime.date(2018, 8, 31)
+    custom_lease.save()
+    custom_rent = custom_lease.rents.get()
+    custom_rent.due_dates_type = DueDatesType.CUSTOM
+    custom_rent.save()
+    rent_due_date_factory(rent=custom_rent, day=15, month=7)
+    rent_due_date_factory(rent=custom_rent, day=31, month=2)
+    free_lease = billed_lease_factory()
+    free_lease.rents.update(type=RentType.FREE)
+
+    assert regenerate_lease_due_dates([fixed_lease.id, custom_lease.id, free_lease.id], years=[2018]) == 6
+
+    assert get_calendar(fixed_lease) == [
+        (datetime.date(2018, 1, 1), datetime.date(2018, 1, 1), datetime.date(2018, 3, 31)),
+        (datetime.date(2018, 4, 1), datetime.date(2018, 4, 1), datetime.date(2018, 6, 30)),
+        (datetime.date(2018, 7, 1), datetime.date(2018, 7, 1), datetime.date(2018, 9, 30)),
+        (datetime.date(2018, 10, 1), datetime.date(2018, 10, 1), datetime.date(2018, 12, 31)),
+    ]
+    # The due dates are paired with the half-year periods, and the lease
+    # ends before the next year
+    assert get_calendar(custom_lease) == [
+        (datetime.date(2018, 2, 28), datetime.date(2018, 1, 1), datetime.date(2018, 6, 30)),
+        (datetime.date(2018, 7, 15), datetime.date(2018, 7, 1), datetime.date(2018, 12, 31)),
+    ]
+    assert list(get_due_dates(datetime.date(2018, 7, 1), datetime.date(2018, 7, 31)).values_list(
+        'rent_id', flat=True)) == [fixed_lease.rents.get().id, custom_rent.id]
+
+
+@pytest.mark.django_db
+def test_regenerate_due_date_calendar(django_db_setup, billed_lease_factory):
+    leases = [billed_lease_factory() for i in range(3)]
+    CalendarDueDate.objects.create(rent=leases[0].rents.get(), lease=leases[0], due_date=datetime.date(2000, 1, 1),
+                                   period_start_date=datetime.date(2000, 1, 1),
+                                   period_end_date=datetime.date(2000, 12, 31))
+
+    totals = regenerate_due_date_calendar(years=[2018, 2019], chunk_size=2)
+
+    assert (totals['leases'], totals['due_dates']) == (3, 24)
+    assert not CalendarDueDate.objects.filter(due_date__year=2000).exists()
+
+    call_command('generate_due_date_calendar', verbosity=0)
+
+    assert {due_date.year for due_date in CalendarDueDate.objects.values_list('due_date', flat=True)} == set(
+        get_calendar_years())
+
+
+def test_calendar_is_regenerated_on_commit(committed_db, billed_lease_factory):
+    lease = billed_lease_factory()
+    other_lease = billed_lease_factory()
+    other_ids = set(CalendarDueDate.objects.filter(lease=other_lease).values_list('id', flat=True))
+
+    assert len(get_calendar(lease)) == 4 * len(get_calendar_years())
+
+    rent = lease.rents.get()
+    with transaction.atomic():
+        rent.due_dates_type = DueDatesType.CUSTOM
+        rent.save()
+        # Like the nested serializers, the due dates are written with bulk
+        # queries after the rent has been saved
+        RentDueDate.objects.bulk_create([RentDueDate(rent=rent, day=1, month=6)])
+
+    assert [due_date.month for due_date, start_date, end_date in get_calendar(lease)] == [6] * len(
+        get_calendar_years())
+    # Only the rents of the changed lease are regenerated
+    assert set(CalendarDueDate.objects.filter(lease=other_lease).values_list('id', flat=True)) == other_ids
+
+    lease.delete()
+
+    assert not CalendarDueDate.objects.filter(lease=lease).exists()
+
+
+def test_calendar_is_regenerated_once_per_transaction(committed_db, billed_lease_factory, rent_factory,
+                                                      monkeypatch):
+    lease = billed_lease_factory()
+    other_lease = billed_lease_factory()
+    calls = []
+    monkeypatch.setattr(due_date_regeneration, 'function', lambda lease_ids: calls.append(set(lease_ids)))
+
+    with transaction.atomic():
+        lease.end_date = datetime.date(2030, 12, 31)
+        lease.save()
+        for rent in lease.rents.all():
+            rent.save()
+        rent_factory(lease=lease, type=RentType.FIXED)
+        other_lease.end_date = datetime.date(2030, 12, 31)
+        other_lease.save()
+
+    assert calls == [{lease.id, other_lease.id}]
+
+    # A rolled back transaction regenerates nothing
+    with pytest.raises(ZeroDivisionError):
+        with transaction.atomic():
+            lease.end_date = datetime.date(2031, 12, 31)
+            lease.save()
+            1 / 0
+
+    lease.save()
+
+    assert calls == [{lease.id, other_lease.id}, {lease.id}]
+
+    # Saving a lease without changing its dates doesn't regenerate it
+    lease.save()
+    other_lease.notice_note = 'Changed'
+    other_lease.save()
+    other_lease.end_date = None
+    other_lease.save(update_fields=('end_date',))
+
+    assert calls == [{lease.id, other_lease.id}, {lease.id}, {other_lease.id}]
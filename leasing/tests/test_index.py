@@ -0,0 +1,69 @@
+from decimal import Decimal
+
+import pytest
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from leasing.enums import IndexType
+from leasing.models import Index, IndexFactor
+
+
+@pytest.mark.django_db
+def test_yearly_numbers(django_db_setup):
+    Index.objects.create(type=IndexType.TYPE_1, year=2017, number=1950)
+    for month in range(1, 13):
+        Index.objects.create(type=IndexType.TYPE_1, year=2016, month=month, number=1900 + month)
+    for month in range(1, 12):
+        Index.objects.create(type=IndexType.TYPE_1, year=2015, month=month, number=1900)
+
+    numbers = Index.objects.get_yearly_numbers([(IndexType.TYPE_1, 2017), (IndexType.TYPE_1, 2016),
+                                                (IndexType.TYPE_1, 2015), (IndexType.TYPE_2, 2017)])
+
+    # The average of 1901..1912 is 1906.5, which is rounded half up
+    assert numbers == {(IndexType.TYPE_1, 2017): 1950, (IndexType.TYPE_1, 2016): 1907}
+
+
+@pytest.mark.django_db
+def test_yearly_number_is_unique(django_db_setup):
+    Index.objects.create(type=IndexType.TYPE_1, year=2017, number=1950)
+
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Index.objects.create(type=IndexType.TYPE_1, year=2017, number=1960)
+
+
+@pytest.mark.django_db
+def test_factors_are_cached(django_db_setup):
+    Index.objects.create(type=IndexType.TYPE_1, year=2017, number=1975)
+    Index.objects.create(type=IndexType.TYPE_2, year=2017, number=2000)
+    keys = [
+        (IndexType.TYPE_1, 100, 2017, None),
+        (IndexType.TYPE_1, 1500, 2017, 3),
+        (IndexType.TYPE_2, 300, 2017, 2),
+        (IndexType.TYPE_2, 300, 2016, 2),
+    ]
+    expected_factors = {
+        (IndexType.TYPE_1, 100, 2017, 2): Decimal('19.75'),
+        (IndexType.TYPE_1, 1500, 2017, 3): Decimal('1.317'),
+        (IndexType.TYPE_2, 300, 2017, 2): Decimal('6.67'),
+    }
+
+    assert IndexFactor.objects.get_factors(keys) == expected_factors
+    assert IndexFactor.objects.count() == 3
+
+    with CaptureQueriesContext(connection) as context:
+        assert IndexFactor.objects.get_factors(keys[:3]) == expected_factors
+
+    assert len(context.captured_queries) == 1
+
+
+@pytest.mark.django_db
+def test_new_index_number_clears_factors(django_db_setup):
+    index = Index.objects.create(type=IndexType.TYPE_1, year=2017, number=1975)
+    IndexFactor.objects.get_factors([(IndexType.TYPE_1, 100, 2017, 2)])
+
+    index.number = 1980
+    index.save()
+
+    assert not IndexFactor.objects.exists()
+    assert IndexFactor.objects.get_factors([(IndexType.TYPE_1, 100, 2017, 2)]) == {
+        (IndexType.TYPE_1, 100, 2017, 2): Decimal('19.80')}
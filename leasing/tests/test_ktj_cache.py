@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.http import QueryDict
+
+from leasing import ktj
+from leasing.ktj_cache import KtjPrintCache, get_cache_key, get_lock_timeout
+
+PRINT_PATH = '/ktjkii/tuloste/lainhuutotodistus/pdf'
+
+
+def get_print(cache, query):
+    file, response = cache.get('ktjkii', 'lainhuutotodistus', QueryDict(query))
+
+    with file:
+        return file.read()
+
+
+@pytest.mark.django_db
+def test_ktj_proxy_serves_cached_prints(django_db_setup, admin_client, fake_ktj_server):
+    for query in ('kiinteistotunnus=91-1-1-1&lang=fi', 'lang=fi&kiinteistotunnus=91-1-1-1&extra=x'):
+        response = admin_client.get(PRINT_PATH + '?' + query)
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/pdf'
+        assert b''.join(response.streaming_content) == fake_ktj_server.content
+
+    assert len(fake_ktj_server.requests) == 1
+
+    admin_client.get(PRINT_PATH, {'kiinteistotunnus': '91-1-1-2'})
+
+    assert len(fake_ktj_server.requests) == 2
+
+
+@pytest.mark.django_db
+def test_ktj_proxy_doesnt_cache_errors(django_db_setup, admin_client, fake_ktj_server):
+    fake_ktj_server.failures = 100
+
+    assert admin_client.get(PRINT_PATH).status_code == 503
+    assert admin_client.get(PRINT_PATH).status_code == 503
+    assert len(fake_ktj_server.requests) == 2 * (ktj.KTJ_PRINT_RETRIES + 1)
+
+
+def test_cache_key():
+    assert get_cache_key('ktjkii', 'lainhuutotodistus', QueryDict('a=1&b=2')) == get_cache_key(
+        'ktjkii', 'lainhuutotodistus', QueryDict('b=2&a=1'))
+    assert get_cache_key('ktjkii', 'lainhuutotodistus', QueryDict('a=1')) != get_cache_key(
+        'ktjkiir', 'lainhuutotodistus', QueryDict('a=1'))
+
+
+def test_expired_prints_are_fetched_again(fake_ktj_server, tmpdir):
+    cache = KtjPrintCache(str(tmpdir), ttl=60, max_size=10 ** 9)
+    get_print(cache, 'kiinteistotunnus=1')
+    get_print(cache, 'kiinteistotunnus=1')
+
+    assert len(fake_ktj_server.requests) == 1
+
+    path = cache.get_path(get_cache_key('ktjkii', 'lainhuutotodistus', QueryDict('kiinteistotunnus=1')))
+    os.utime(path, (time.time(), time.time() - 61))
+
+    assert get_print(cache, 'kiinteistotunnus=1') == fake_ktj_server.content
+    assert len(fake_ktj_server.requests) == 2
+
+
+def test_least_recently_read_prints_are_evicted(fake_ktj_server, tmpdir):
+    cache = KtjPrintCache(str(tmpdir), ttl=60, max_size=len(fake_ktj_server.content) * 2)
+    get_print(cache, 'kiinteistotunnus=1')
+    get_print(cache, 'kiinteistotunnus=2')
+    # Read the first print again so that the second is the least recently
+    # read, with a later access time on a filesystem with coarse timestamps
+    time.sleep(0.01)
+    get_print(cache, 'kiinteistotunnus=1')
+    time.sleep(0.01)
+    get_print(cache, 'kiinteistotunnus=3')
+
+    assert sorted(path.name for path in Path(str(tmpdir)).glob('*/*.pdf')) == sorted(
+        get_cache_key('ktjkii', 'lainhuutotodistus', QueryDict(query)) + '.pdf'
+        for query in ('kiinteistotunnus=1', 'kiinteistotunnus=3'))
+
+    get_print(cache, 'kiinteistotunnus=2')
+
+    assert len(fake_ktj_server.requests) == 4
+
+
+def test_identical_requests_are_fetched_once(fake_ktj_server, tmpdir):
+    fake_ktj_server.delay = 0.3
+    cache = KtjPrintCache(str(tmpdir), ttl=60, max_size=10 ** 9)
+    contents = []
+
+    threads = [threading.Thread(target=lambda: contents.append(get_print(cache, 'kiinteistotunnus=1')))
+               for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert contents == [fake_ktj_server.content] * 5
+    assert len(fake_ktj_server.requests) == 1
+
+
+def test_evicts_after_a_tenth_of_the_size_is_written(fake_ktj_server, tmpdir, monkeypatch):
+    cache = KtjPrintCache(str(tmpdir), ttl=60, max_size=len(fake_ktj_server.content) * 25)
+    evictions = []
+    monkeypatch.setattr(KtjPrintCache, 'evict', lambda self: evictions.append(len(fake_ktj_server.requests)))
+
+    for i in range(6):
+        get_print(cache, 'kiinteistotunnus={}'.format(i))
+
+    assert evictions == [3, 6]
+
+
+def test_evict_command(fake_ktj_server, tmpdir, settings):
+    settings.KTJ_PRINT_CACHE_MAX_SIZE = len(fake_ktj_server.content)
+    cache = KtjPrintCache(ttl=60, max_size=10 ** 9)
+    for i in range(3):
+        get_print(cache, 'kiinteistotunnus={}'.format(i))
+    # The lock files of the removed prints are removed too
+    assert len(list(Path(settings.KTJ_PRINT_CACHE_ROOT).glob('*/*'))) == 6
+
+    call_command('evict_ktj_prints', stdout=StringIO())
+
+    assert len(list(Path(settings.KTJ_PRINT_CACHE_ROOT).glob('*/*'))) == 2
+
+
+def test_lock_is_taken_again_on_a_new_lock_file(tmpdir):
+    cache = KtjPrintCache(str(tmpdir), ttl=60, max_size=10 ** 9)
+    events = []
+
+    def wait_for_lock():
+        with cache.lock('key', timeout=5) as locked:
+            events.append(('waiter', locked))
+
+    first_lock = cache.lock('key', timeout=5)
+    first_lock.__enter__()
+    thread = threading.Thread(target=wait_for_lock)
+    thread.start()
+    time.sleep(0.1)
+    # Like the eviction, remove the lock file while the other request waits
+    # for it, and lock the new file before releasing the removed one
+    os.unlink(cache.get_path('key', '.lock'))
+
+    with cache.lock('key', timeout=5) as locked:
+        events.append(('new', locked))
+        first_lock.__exit__(None, None, None)
+        time.sleep(0.2)
+        events.append(('new released', locked))
+
+    thread.join()
+
+    assert events == [('new', True), ('new released', True), ('waiter', True)]
+
+
+def test_lock_timeout_covers_the_retries():
+    assert get_lock_timeout() > (ktj.KTJ_PRINT_RETRIES + 1) * (ktj.KTJ_PRINT_CONNECT_TIMEOUT +
+                                                               ktj.KTJ_PRINT_READ_TIMEOUT)
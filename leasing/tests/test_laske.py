@@ -0,0 +1,108 @@
+import datetime
+from pathlib import Path
+from xml.etree import ElementTree
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leasing.billing import create_invoices
+from leasing.laske import export_invoices, get_sales_order_template, render_invoice, serialize_invoice
+from leasing.models import Invoice
+
+FEBRUARY_10_2018 = datetime.date(2018, 2, 10)
+
+
+def get_text(element, path):
+    return element.find(path).text
+
+
+@pytest.mark.django_db
+def test_export_invoices(django_db_setup, laske_lease_factory, tmpdir):
+    outbox_path = Path(str(tmpdir))
+    leases = [laske_lease_factory(shares=((1, 2), (1, 2))), laske_lease_factory()]
+    create_invoices(FEBRUARY_10_2018)
+
+    paths = export_invoices(Invoice.objects.all(), outbox_path=outbox_path, invoices_per_file=2)
+
+    assert [path.parent for path in paths] == [outbox_path, outbox_path]
+    assert sorted(outbox_path.iterdir()) == paths
+
+    orders = [order for path in paths for order in ElementTree.parse(str(path)).getroot()]
+
+    assert [len(ElementTree.parse(str(path)).getroot()) for path in paths] == [2, 1]
+    assert [order.tag for order in orders] == ['SBO_SalesOrder'] * 3
+    assert [get_text(order, 'ContractNumber') for order in orders] == [
+        'C{}'.format(leases[0].id), 'C{}'.format(leases[0].id), 'C{}'.format(leases[1].id)]
+    assert get_text(orders[0], 'BillTextL1') == 'Vuokraustunnus: {}  Vuokra ajalta: 01.04.2018-30.06.2018'.format(
+        leases[0].get_identifier_string())
+    assert get_text(orders[0], 'BillTextL3') == 'Käyttötarkoitus: -'
+    assert get_text(orders[0], 'BillTextL4') == 'Indeksin tark.pvm: -  Vuosivuokra: 1200.00'
+    assert get_text(orders[0], 'BillTextL5') == 'Kiinteistötunnus: 91-1-1-{}'.format(leases[0].id)
+    assert [get_text(order, 'LineItem/NetPrice') for order in orders] == ['149,59', '149,59', '299,18']
+    assert get_text(orders[0], 'LineItem/LineTextL1') == 'Muita vuokraajia : First Last'
+    assert get_text(orders[2], 'LineItem/LineTextL1') is None
+    assert get_text(orders[2], 'PayerParty/PriorityName1') == 'First Last'
+
+    # The same element is serialized without the precalculated year rent
+    invoice = Invoice.objects.order_by('id').first()
+    assert ElementTree.tostring(serialize_invoice(invoice)) == ElementTree.tostring(orders[0]).rstrip()
+
+    assert [get_text(order, 'Reference') for order in orders] == list(
+        Invoice.objects.order_by('id').values_list('reference_number', flat=True))
+    assert not Invoice.objects.filter(sent_to_sap_at__isnull=True).exists()
+    assert export_invoices(Invoice.objects.filter(sent_to_sap_at__isnull=True), outbox_path=outbox_path) == []
+
+    # The invoices without a reference number are not sent
+    Invoice.objects.update(sent_to_sap_at=None, reference_number=None)
+
+    assert export_invoices(Invoice.objects.all(), outbox_path=outbox_path) == []
+    assert not Invoice.objects.filter(sent_to_sap_at__isnull=False).exists()
+
+
+@pytest.mark.django_db
+def test_export_invoices_queries(django_db_setup, laske_lease_factory, tmpdir):
+    def export_and_count_queries():
+        Invoice.objects.update(sent_to_sap_at=None)
+
+        with CaptureQueriesContext(connection) as context:
+            export_invoices(Invoice.objects.all(), outbox_path=str(tmpdir))
+
+        return len(context.captured_queries)
+
+    for i in range(2):
+        laske_lease_factory(shares=((1, 2), (1, 2)))
+    create_invoices(FEBRUARY_10_2018)
+    query_count = export_and_count_queries()
+
+    for i in range(6):
+        laske_lease_factory(shares=((1, 2), (1, 2)))
+    create_invoices(FEBRUARY_10_2018)
+
+    assert export_and_count_queries() == query_count
+
+
+@pytest.mark.django_db
+def test_render_invoice(django_db_setup, laske_lease_factory, contact_factory, settings):
+    lease = laske_lease_factory(shares=((1, 2), (1, 2)))
+    create_invoices(FEBRUARY_10_2018)
+    invoice = Invoice.objects.order_by('id').first()
+    invoice.billing_contact = contact_factory(is_business=True, business_name='Rakennus & Kiinteistö <Oy>',
+                                              business_id='1234567-8')
+    invoice.reference_number = '1000'
+
+    xml = render_invoice(invoice)
+
+    assert xml == ElementTree.tostring(serialize_invoice(invoice), encoding='unicode')
+    assert get_text(ElementTree.fromstring(xml), 'PayerParty/InfoName1') == 'Rakennus & Kiinteistö <Oy>'
+    assert get_text(ElementTree.fromstring(xml), 'BillingParty2/InfoName1') is None
+    assert get_text(ElementTree.fromstring(xml), 'ContractNumber') == 'C{}'.format(lease.id)
+
+    # The template is compiled again when the static values change
+    template = get_sales_order_template()
+    assert get_sales_order_template() is template
+
+    settings.LASKE_VALUES = dict(settings.LASKE_VALUES, SenderId='ID176')
+
+    assert get_sales_order_template() is not template
+    assert get_text(ElementTree.fromstring(render_invoice(invoice)), 'SenderId') == 'ID176'
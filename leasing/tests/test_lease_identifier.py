@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+from auditlog.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from safedelete.config import HARD_DELETE
+
+from leasing.models import Lease, LeaseChange, LeaseIdentifier, LeaseIdentifierSequence
+
+
+def run_in_threads(target, thread_count):
+    """Runs the target in threads that use their own database connections
+
+    The threads commit their changes, as they are not part of the test
+    transaction. Returns the return values of the target in each thread."""
+    results = [None] * thread_count
+    errors = []
+    barrier = threading.Barrier(thread_count)
+
+    def run(index):
+        try:
+            barrier.wait()
+            results[index] = target()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return results
+
+
+@pytest.mark.django_db
+def test_allocate_block(django_db_setup, lease_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+
+    assert lease.identifier.sequence == 1
+
+    first_sequence = LeaseIdentifierSequence.objects.allocate(lease.type, lease.municipality, lease.district,
+                                                              count=10)
+    assert first_sequence == 2
+
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+
+    assert lease.identifier.sequence == 12
+
+
+@pytest.mark.django_db
+def test_counter_starts_after_existing_identifiers(django_db_setup, lease_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+    LeaseIdentifier.objects.create(type=lease.type, municipality=lease.municipality, district=lease.district,
+                                   sequence=20)
+    LeaseIdentifierSequence.objects.all().delete()
+
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+
+    assert lease.identifier.sequence == 21
+
+
+@pytest.mark.django_db
+def test_concurrent_lease_creation(django_db_setup):
+    thread_count = 8
+    leases_per_thread = 5
+    lease_kwargs = {
+        'type_id': 'A3',
+        'municipality_id': 1,
+        'district_id': 10,
+    }
+
+    def create_leases():
+        lease_ids = []
+
+        for i in range(leases_per_thread):
+            with transaction.atomic():
+                lease_ids.append(Lease.objects.create(**lease_kwargs).id)
+
+        return lease_ids
+
+    def delete_leases():
+        leases = Lease.all_objects.filter(**lease_kwargs)
+        lease_ids = list(leases.values_list('id', flat=True))
+        identifier_ids = list(leases.values_list('identifier_id', flat=True))
+
+        leases.delete(force_policy=HARD_DELETE)
+        LeaseIdentifier.all_objects.filter(id__in=identifier_ids).delete(force_policy=HARD_DELETE)
+        LeaseIdentifierSequence.objects.filter(**lease_kwargs).delete()
+        LeaseChange.objects.filter(lease_id__in=lease_ids).delete()
+        LogEntry.objects.filter(content_type=ContentType.objects.get_for_model(Lease), object_id__in=lease_ids).delete()
+
+    try:
+        lease_ids = sum(run_in_threads(create_leases, thread_count), [])
+        sequences = Lease.objects.filter(id__in=lease_ids).values_list('identifier__sequence', flat=True)
+
+        assert sorted(sequences) == list(range(1, thread_count * leases_per_thread + 1))
+    finally:
+        run_in_threads(delete_leases, 1)
@@ -0,0 +1,167 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leasing.calculation import calculate_rent_amounts
+from leasing.enums import DueDatesType, PeriodType, RentAdjustmentAmountType, RentAdjustmentType, RentCycle, RentType
+from leasing.models import Lease
+
+YEAR_2018 = (datetime.date(2018, 1, 1), datetime.date(2018, 12, 31))
+JANUARY_2018 = (datetime.date(2018, 1, 1), datetime.date(2018, 1, 31))
+
+
+@pytest.fixture
+def rent_lease_factory(lease_factory, rent_factory, contract_rent_factory):
+    """Returns a function that creates a lease with a rent and a contract rent"""
+    def create_lease(rent_type=RentType.FIXED, amount=1200, period=PeriodType.PER_YEAR, lease_kwargs=None,
+                     **rent_kwargs):
+        lease = lease_factory(type_id='A1', municipality_id=1, district_id=5, **(lease_kwargs or {}))
+        rent = rent_factory(lease=lease, type=rent_type, cycle=RentCycle.JANUARY_TO_DECEMBER, **rent_kwargs)
+
+        if amount is not None:
+            contract_rent_factory(rent=rent, amount=amount, period=period, intended_use_id=1, base_amount=amount,
+                                  base_amount_period=period)
+
+        return lease
+
+    return create_lease
+
+
+@pytest.mark.django_db
+def test_contract_rent(django_db_setup, rent_lease_factory):
+    lease = rent_lease_factory()
+
+    assert lease.get_rent_amount_for_period(*YEAR_2018) == Decimal('1200.00')
+    # 1200 * 31 / 365
+    assert lease.get_rent_amount_for_period(*JANUARY_2018) == Decimal('101.92')
+
+    lease = rent_lease_factory(amount=100, period=PeriodType.PER_MONTH)
+
+    assert lease.get_rent_amount_for_period(*YEAR_2018) == Decimal('1200.00')
+
+
+@pytest.mark.django_db
+def test_rent_cycle(django_db_setup, rent_lease_factory):
+    period = (datetime.date(2019, 3, 1), datetime.date(2019, 4, 30))
+
+    # 31 * 366 / 365 + 30 * 366 / 365
+    lease = rent_lease_factory(amount=366)
+    assert lease.get_rent_amount_for_period(*period) == Decimal('61.17')
+
+    # 31 * 366 / 365 + 30 * 366 / 366, because the cycle year from April 2019 has a leap day
+    lease.rents.update(cycle=RentCycle.APRIL_TO_MARCH)
+    lease = Lease.objects.get(pk=lease.pk)
+    assert lease.get_rent_amount_for_period(*period) == Decimal('61.08')
+
+
+@pytest.mark.django_db
+def test_lease_dates_limit_rent(django_db_setup, rent_lease_factory):
+    lease = rent_lease_factory(lease_kwargs={'end_date': datetime.date(2018, 6, 30)})
+
+    # 1200 * 181 / 365
+    assert lease.get_rent_amount_for_period(*YEAR_2018) == Decimal('595.07')
+    assert lease.get_rent_amount_for_period(datetime.date(2018, 7, 1), datetime.date(2018, 12, 31)) == Decimal('0.00')
+
+
+@pytest.mark.django_db
+def test_free_and_one_time_rent(django_db_setup, rent_lease_factory, lease_factory, rent_factory):
+    lease = rent_lease_factory(rent_type=RentType.FREE)
+
+    assert lease.get_rent_amount_for_period(*YEAR_2018) == Decimal('0.00')
+
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5, start_date=datetime.date(2018, 3, 15))
+    rent_factory(lease=lease, type=RentType.ONE_TIME, amount=5000)
+
+    assert lease.get_rent_amount_for_period(*YEAR_2018) == Decimal('5000.00')
+    assert lease.get_rent_amount_for_period(datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)) == Decimal('0.00')
+
+
+@pytest.mark.django_db
+def test_fixed_initial_year_rent(django_db_setup, rent_lease_factory, fixed_initial_year_rent_factory):
+    lease = rent_lease_factory()
+    fixed_initial_year_rent_factory(rent=lease.rents.get(), amount=600, start_date=datetime.date(2018, 1, 1),
+                                    end_date=datetime.date(2018, 6, 30))
+
+    # 600 * 181 / 365 + 1200 * 184 / 365
+    assert lease.get_rent_amount_for_period(*YEAR_2018) == Decimal('902.47')
+
+
+@pytest.mark.django_db
+def test_index_adjusted_rent(django_db_setup, rent_lease_factory, index_adjusted_rent_factory):
+    for rent_type, expected_amount in ((RentType.INDEX, Decimal('1500.00')), (RentType.FIXED, Decimal('1200.00'))):
+        lease = rent_lease_factory(rent_type=rent_type)
+        index_adjusted_rent_factory(rent=lease.rents.get(), amount=1500, intended_use_id=1, start_date=YEAR_2018[0],
+                                    end_date=YEAR_2018[1], factor=125)
+
+        assert lease.get_rent_amount_for_period(*YEAR_2018) == expected_amount
+
+
+@pytest.mark.django_db
+def test_rent_adjustments(django_db_setup, rent_lease_factory, rent_adjustment_factory):
+    lease = rent_lease_factory()
+    rent_adjustment_factory(rent=lease.rents.get(), type=RentAdjustmentType.DISCOUNT, intended_use_id=1,
+                            full_amount=10, amount_type=RentAdjustmentAmountType.PERCENT_PER_YEAR)
+
+    assert lease.get_rent_amount_for_period(*YEAR_2018) == Decimal('1080.00')
+
+    lease = rent_lease_factory()
+    rent_adjustment_factory(rent=lease.rents.get(), type=RentAdjustmentType.INCREASE, intended_use_id=1,
+                            full_amount=365, amount_type=RentAdjustmentAmountType.AMOUNT_TOTAL,
+                            start_date=YEAR_2018[0], end_date=YEAR_2018[1])
+
+    # 1200 * 31 / 365 + 365 * 31 / 365
+    assert lease.get_rent_amount_for_period(*JANUARY_2018) == Decimal('132.92')
+
+
+@pytest.mark.django_db
+def test_billing_periods(django_db_setup, rent_lease_factory, rent_due_date_factory):
+    lease = rent_lease_factory(due_dates_type=DueDatesType.FIXED, due_dates_per_year=4)
+
+    assert lease.rents.get().get_billing_periods_for_year(2018) == [
+        (datetime.date(2018, 1, 1), datetime.date(2018, 3, 31)),
+        (datetime.date(2018, 4, 1), datetime.date(2018, 6, 30)),
+        (datetime.date(2018, 7, 1), datetime.date(2018, 9, 30)),
+        (datetime.date(2018, 10, 1), datetime.date(2018, 12, 31)),
+    ]
+    assert lease.get_next_billing_period_for_date(datetime.date(2018, 2, 10)) == (
+        datetime.date(2018, 4, 1), datetime.date(2018, 6, 30))
+    assert lease.get_next_billing_period_for_date(datetime.date(2018, 11, 10)) == (
+        datetime.date(2019, 1, 1), datetime.date(2019, 3, 31))
+
+    lease = rent_lease_factory(due_dates_type=DueDatesType.CUSTOM)
+    for month in (1, 7):
+        rent_due_date_factory(rent=lease.rents.get(), day=15, month=month)
+
+    assert lease.rents.get().get_billing_periods_for_year(2018) == [
+        (datetime.date(2018, 1, 1), datetime.date(2018, 6, 30)),
+        (datetime.date(2018, 7, 1), datetime.date(2018, 12, 31)),
+    ]
+
+
+@pytest.mark.django_db
+def test_calculate_rent_amounts_queries(django_db_setup, rent_lease_factory, rent_adjustment_factory):
+    def calculate():
+        queryset = Lease.objects.order_by('id')
+
+        with CaptureQueriesContext(connection) as context:
+            amounts = calculate_rent_amounts(queryset, *YEAR_2018, chunk_size=100)
+
+        assert amounts == {lease.id: lease.get_rent_amount_for_period(*YEAR_2018) for lease in queryset}
+
+        return len(context.captured_queries)
+
+    def create_leases(count):
+        for i in range(count):
+            lease = rent_lease_factory(amount=1000 + i)
+            rent_adjustment_factory(rent=lease.rents.get(), type=RentAdjustmentType.DISCOUNT, intended_use_id=1,
+                                    full_amount=i, amount_type=RentAdjustmentAmountType.PERCENT_PER_YEAR)
+
+    create_leases(2)
+    query_count = calculate()
+
+    create_leases(8)
+
+    assert calculate() == query_count
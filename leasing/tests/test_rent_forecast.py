@@ -0,0 +1,79 @@
+import datetime
+import random
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leasing.batch_calculation import BatchRentCalculator
+from leasing.enums import PeriodType
+from leasing.models import Lease, LeaseChange
+from leasing.rent_forecast import get_forecast
+
+
+@pytest.mark.django_db
+def test_intended_use_rents(django_db_setup, random_lease_factory):
+    rng = random.Random(2018)
+    for i in range(50):
+        random_lease_factory(rng)
+    lease_ids = list(Lease.objects.values_list('id', flat=True))
+    calculator = BatchRentCalculator(datetime.date(2018, 1, 1), datetime.date(2018, 12, 31))
+
+    rent_amounts = calculator.calculate_rents(lease_ids)[1]
+    intended_use_rents = calculator.calculate_intended_use_rents(lease_ids)
+
+    assert {rent_id: (lease_id, sum(amounts.values(), Decimal('0.00')))
+            for rent_id, (lease_id, rent_type, amounts) in intended_use_rents.items()} == rent_amounts
+    assert any(len(amounts) > 1 for (lease_id, rent_type, amounts) in intended_use_rents.values())
+
+
+@pytest.mark.django_db
+def test_forecast(django_db_setup, billed_lease_factory, contract_rent_factory):
+    cache.clear()
+    lease = billed_lease_factory()
+    contract_rent_factory(rent=lease.rents.get(), amount=365, period=PeriodType.PER_YEAR, intended_use_id=2,
+                          base_amount=365, base_amount_period=PeriodType.PER_YEAR,
+                          end_date=datetime.date(2019, 6, 30))
+    other_lease = billed_lease_factory()
+    other_lease.end_date = datetime.date(2019, 12, 31)
+    other_lease.save()
+    # The test runs in a transaction, so the changes are versioned like on
+    # a commit
+    LeaseChange.objects.assign_versions()
+
+    data_version, rows = get_forecast(2019, 2)
+
+    # The rents are 1200 per year with intended use 1 for both the leases and
+    # 365 for the first half of 2019 with intended use 2 for the first lease
+    assert [(row['year'], row['municipality'], row['district'], row['intended_use'], row['type'], row['amount'])
+            for row in rows] == [
+        (2019, 1, 5, 1, 'fixed', Decimal('2400.00')),
+        (2019, 1, 5, 2, 'fixed', Decimal('181.00')),
+        (2020, 1, 5, 1, 'fixed', Decimal('1200.00')),
+    ]
+
+    # The cached forecast is used until a lease changes
+    with CaptureQueriesContext(connection) as context:
+        assert get_forecast(2019, 2) == (data_version, rows)
+
+    assert len(context.captured_queries) == 1
+
+    other_lease.end_date = datetime.date(2020, 12, 31)
+    other_lease.save()
+
+    # The changes that are not committed yet are calculated without the cache
+    assert get_forecast(2019, 2)[0] is None
+    assert get_forecast(2019, 2)[1][-1]['amount'] == Decimal('2400.00')
+
+    LeaseChange.objects.assign_versions()
+
+    assert int(get_forecast(2019, 2)[0]) > int(data_version)
+
+    output = StringIO()
+    call_command('forecast_rents', first_year=2020, years=1, stdout=output)
+
+    assert output.getvalue() == 'year,municipality,district,intended_use,type,amount\n2020,1,5,1,fixed,2400.00\n'
@@ -0,0 +1,82 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from leasing.enums import IndexType, PeriodType, RentCycle, RentType
+from leasing.models import Index, IndexAdjustedRent, LeaseChange, PayableRent
+from leasing.rent_regeneration import regenerate_rents
+
+
+@pytest.fixture
+def index_rent_factory(lease_factory, rent_factory, contract_rent_factory):
+    """Returns a function that creates a lease with a rent and a contract rent
+    of 1200 € per year, or 1000 € per year at the base index 1500"""
+    def create_rent(rent_type=RentType.INDEX, cycle=RentCycle.JANUARY_TO_DECEMBER, contract_rent_kwargs=None):
+        lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+        rent = rent_factory(lease=lease, type=rent_type, cycle=cycle, index_type=IndexType.TYPE_7,
+                            elementary_index=1500, index_rounding=2)
+        contract_rent_factory(rent=rent, amount=1200, period=PeriodType.PER_YEAR, intended_use_id=1,
+                              base_amount=1000, base_amount_period=PeriodType.PER_YEAR,
+                              **(contract_rent_kwargs or {}))
+
+        return rent
+
+    return create_rent
+
+
+def assert_regenerated_rents(rent):
+    # 1000 * 1975 / 1500 = 1316.67 and the factor is rounded to 1.32
+    assert list(rent.index_adjusted_rents.values_list('amount', 'factor', 'start_date', 'end_date')) == [
+        (Decimal('1320.00'), Decimal('1.32'), datetime.date(2018, 1, 1), datetime.date(2018, 12, 31))]
+    assert list(rent.payable_rents.values_list(
+        'amount', 'difference_percent', 'calendar_year_rent', 'start_date', 'end_date')) == [
+        (Decimal('1320.00'), Decimal('10.00'), Decimal('1320.00'), datetime.date(2018, 1, 1),
+         datetime.date(2018, 12, 31))]
+
+
+@pytest.mark.django_db
+def test_regenerate_rents(django_db_setup, index_rent_factory):
+    index = Index.objects.create(type=IndexType.TYPE_7, year=2017, number=1975)
+    rent = index_rent_factory()
+    april_rent = index_rent_factory(cycle=RentCycle.APRIL_TO_MARCH,
+                                    contract_rent_kwargs={'end_date': datetime.date(2018, 12, 31)})
+    fixed_rent = index_rent_factory(rent_type=RentType.FIXED)
+
+    progress_calls = []
+    totals = regenerate_rents(2018, chunk_size=1, progress=lambda totals, lease_count, elapsed: progress_calls.append(
+        (totals['leases'], lease_count)))
+
+    assert totals == {'leases': 2, 'rents': 2, 'index_adjusted_rents': 2, 'payable_rents': 2}
+    assert progress_calls == [(1, 2), (2, 2)]
+    assert_regenerated_rents(rent)
+
+    # The index adjusted rent ends with the contract rent, so the rent of the
+    # rent year from April is 1320 * 275 / 365
+    assert list(april_rent.index_adjusted_rents.values_list('amount', 'start_date', 'end_date')) == [
+        (Decimal('1320.00'), datetime.date(2018, 4, 1), datetime.date(2018, 12, 31))]
+    assert april_rent.payable_rents.get().amount == Decimal('994.52')
+    assert april_rent.payable_rents.get().end_date == datetime.date(2019, 3, 31)
+
+    assert not fixed_rent.index_adjusted_rents.exists()
+    assert not fixed_rent.payable_rents.exists()
+    assert LeaseChange.objects.filter(lease_id__in=(rent.lease_id, april_rent.lease_id)).count() == 2
+
+    # Regenerating replaces the rows of the year
+    index.number = 2000
+    index.save()
+    regenerate_rents(2018)
+
+    assert IndexAdjustedRent.objects.get(rent=rent).amount == Decimal('1330.00')
+    assert PayableRent.objects.filter(rent=rent).count() == 1
+
+
+def test_regenerate_rents_in_parallel(committed_db, index_rent_factory):
+    Index.objects.create(type=IndexType.TYPE_7, year=2017, number=1975)
+    rents = [index_rent_factory() for i in range(5)]
+
+    call_command('regenerate_rents', year=2018, chunk_size=2, workers=2, verbosity=0)
+
+    for rent in rents:
+        assert_regenerated_rents(rent)
@@ -0,0 +1,42 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leasing.enums import PeriodType, RentType
+from leasing.models import ContractRent
+from leasing.serializers.rent import ContractRentSerializer
+
+
+@pytest.mark.django_db
+def test_instance_dict_field_resolves_lookup_instances_in_bulk(django_db_setup, lease_factory, rent_factory,
+                                                               contract_rent_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+    rent = rent_factory(lease=lease, type=RentType.FIXED)
+
+    for intended_use_id in (1, 2, 3, 1, 2):
+        contract_rent_factory(rent=rent, amount=100, period=PeriodType.PER_YEAR, intended_use_id=intended_use_id,
+                              base_amount=100, base_amount_period=PeriodType.PER_YEAR)
+
+    with CaptureQueriesContext(connection) as context:
+        data = ContractRentSerializer(ContractRent.objects.filter(rent=rent), many=True).data
+
+    # One query for the contract rents and one for all of the intended uses
+    assert len(context.captured_queries) == 2
+    assert [item['intended_use']['id'] for item in data] == [1, 2, 3, 1, 2]
+
+
+@pytest.mark.django_db
+def test_instance_dict_field_uses_loaded_instance(django_db_setup, lease_factory, rent_factory,
+                                                  contract_rent_factory):
+    lease = lease_factory(type_id='A1', municipality_id=1, district_id=5)
+    rent = rent_factory(lease=lease, type=RentType.FIXED)
+    contract_rent_factory(rent=rent, amount=100, period=PeriodType.PER_YEAR, intended_use_id=1, base_amount=100,
+                          base_amount_period=PeriodType.PER_YEAR)
+
+    contract_rents = list(ContractRent.objects.filter(rent=rent).select_related('intended_use'))
+
+    with CaptureQueriesContext(connection) as context:
+        data = ContractRentSerializer(contract_rents, many=True).data
+
+    assert len(context.captured_queries) == 0
+    assert data[0]['intended_use']['name'] == contract_rents[0].intended_use.name
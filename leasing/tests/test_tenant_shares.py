@@ -0,0 +1,73 @@
+import datetime
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from leasing.billing import create_invoices
+from leasing.calculation import split_amount
+from leasing.enums import TenantContactType
+from leasing.models import Invoice
+from leasing.tenant_shares import get_contact_shares
+
+APRIL_1_2018 = datetime.date(2018, 4, 1)
+
+
+@pytest.mark.parametrize('amount, shares, expected_parts', [
+    (Decimal('100.00'), (Fraction(1, 3), Fraction(1, 3), Fraction(1, 3)), ('33.34', '33.33', '33.33')),
+    (Decimal('299.18'), (Fraction(1, 3), Fraction(1, 3), Fraction(1, 3)), ('99.73', '99.73', '99.72')),
+    (Decimal('0.01'), (Fraction(1, 3), Fraction(1, 3), Fraction(1, 3)), ('0.01', '0.00', '0.00')),
+    (Decimal('100.00'), (Fraction(1, 4), Fraction(1, 6)), ('25.00', '16.67')),
+    (Decimal('-10.00'), (Fraction(1, 3), Fraction(2, 3)), ('-3.33', '-6.67')),
+])
+def test_split_amount(amount, shares, expected_parts):
+    parts = split_amount(amount, dict(enumerate(shares)))
+
+    assert [parts[key] for key in range(len(shares))] == [Decimal(part) for part in expected_parts]
+    assert sum(parts.values()) == split_amount(amount, {0: sum(shares)})[0]
+
+
+@pytest.mark.django_db
+def test_contact_shares(django_db_setup, billed_lease_factory, contact_factory, tenant_contact_factory):
+    lease = billed_lease_factory(shares=((1, 3), (1, 3), (1, 6), (1, 6)))
+    other_lease = billed_lease_factory(shares=((1, 1),))
+    tenants = list(lease.tenants.order_by('id'))
+    billing_contact = contact_factory(is_business=True, business_name='Company')
+    tenant_contact_factory(tenant=tenants[1], type=TenantContactType.BILLING, contact=billing_contact,
+                           start_date=datetime.date(2018, 1, 1))
+    tenant_contact_factory(tenant=tenants[2], type=TenantContactType.BILLING, contact=billing_contact,
+                           start_date=datetime.date(2018, 1, 1))
+    # Ended before the date
+    tenant_contact_factory(tenant=tenants[0], type=TenantContactType.BILLING, contact=billing_contact,
+                           start_date=datetime.date(2017, 1, 1), end_date=datetime.date(2018, 3, 31))
+    tenants[3].delete()
+
+    with CaptureQueriesContext(connection) as context:
+        shares = get_contact_shares({lease.id: APRIL_1_2018, other_lease.id: datetime.date(2017, 1, 1)})
+
+    assert len(context.captured_queries) == 1
+
+    first_contact = tenants[0].tenantcontact_set.get(type=TenantContactType.TENANT).contact
+    other_contact = other_lease.tenants.get().tenantcontact_set.get().contact
+    assert shares == {
+        lease.id: {
+            first_contact.id: [Fraction(1, 3), [tenants[0].id]],
+            billing_contact.id: [Fraction(1, 2), [tenants[1].id, tenants[2].id]],
+        },
+        other_lease.id: {
+            other_contact.id: [Fraction(1, 1), [other_lease.tenants.get().id]],
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_invoices_sum_up_to_rent(django_db_setup, billed_lease_factory):
+    billed_lease_factory(shares=((1, 3), (1, 3), (1, 3)))
+
+    create_invoices(datetime.date(2018, 2, 10))
+
+    # The rent from April to June is 299.18, which doesn't divide in thirds
+    assert sorted(Invoice.objects.values_list('amount', flat=True)) == [
+        Decimal('99.72'), Decimal('99.73'), Decimal('99.73')]
@@ -0,0 +1,141 @@
+import datetime
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import prefetch_related_objects
+
+
+def iterate_prefetched_chunks(queryset, prefetch_lookups, chunk_size):
+    """Yields the instances of the queryset in lists of chunk_size
+    instances with the prefetch_lookups prefetched for each list
+
+    The rows are read with a server-side cursor, so the memory use depends
+    on the chunk size and not on the size of the queryset."""
+    chunk = []
+
+    for instance in queryset.prefetch_related(None).iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+
+        if len(chunk) == chunk_size:
+            prefetch_related_objects(chunk, *prefetch_lookups)
+            yield chunk
+            chunk = []
+
+    if chunk:
+        prefetch_related_objects(chunk, *prefetch_lookups)
+        yield chunk
+
+
+def get_range_overlap(start1, end1, start2, end2):
+    """Returns the (start, end) of the overlap of two date ranges or None if
+    they don't overlap
+
+    The ranges include their end dates. None as a start or an end date means
+    that the range is open from that end."""
+    starts = [date for date in (start1, start2) if date is not None]
+    ends = [date for date in (end1, end2) if date is not None]
+
+    start = max(starts) if starts else None
+    end = min(ends) if ends else None
+
+    if start is not None and end is not None and start > end:
+        return None
+
+    return start, end
+
+
+def subtract_ranges(start, end, ranges):
+    """Returns the parts of the closed range start..end that are not
+    covered by any of the ranges
+
+    The ranges may be open-ended like in get_range_overlap."""
+    parts = [(start, end)]
+
+    for (range_start, range_end) in ranges:
+        new_parts = []
+
+        for (part_start, part_end) in parts:
+            if get_range_overlap(part_start, part_end, range_start, range_end) is None:
+                new_parts.append((part_start, part_end))
+                continue
+
+            if range_start is not None and range_start > part_start:
+                new_parts.append((part_start, range_start - datetime.timedelta(days=1)))
+
+            if range_end is not None and range_end < part_end:
+                new_parts.append((range_end + datetime.timedelta(days=1), part_end))
+
+        parts = new_parts
+
+    return parts
+
+
+def get_day_count(start_date, end_date):
+    return (end_date - start_date).days + 1
+
+
+def add_months(date, months):
+    """Returns the first day of the month that is the given number of months
+    after the month of the date"""
+    month_index = date.year * 12 + date.month - 1 + months
+
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_id_ranges(ids, chunk_size):
+    """Splits the sorted ids to ranges of chunk_size ids as a list of
+    (first id, last id)"""
+    return [(ids[index], ids[min(index + chunk_size, len(ids)) - 1]) for index in range(0, len(ids), chunk_size)]
+
+
+def map_in_processes(function, arguments, workers):
+    """Calls the function with each tuple of arguments and yields the results
+    in the order they are completed
+
+    With more than one worker the calls are divided between that many forked
+    processes. An exception in a call is raised when its result is reached."""
+    if workers <= 1:
+        for function_arguments in arguments:
+            yield function(*function_arguments)
+        return
+
+    # The forked processes must not share the database connections of this one
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, *function_arguments) for function_arguments in arguments]
+
+        for future in as_completed(futures):
+            yield future.result()
+
+
+class OnCommitBatch:
+    """Calls the function once with the items added in a transaction when the
+    transaction commits
+
+    The items are kept in a set per thread and database. Every add registers
+    a callback with transaction.on_commit, and the first callback that runs
+    takes all the pending items, so the others find nothing to do. The items
+    of a rolled back transaction or savepoint are passed on with the items
+    of the next commit, so the function must tolerate extra items."""
+    def __init__(self, function):
+        self.function = function
+        self.local = threading.local()
+
+    def get_pending_items(self, using):
+        return self.local.__dict__.setdefault(using, set())
+
+    def add(self, items, using=None):
+        using = using or DEFAULT_DB_ALIAS
+        self.get_pending_items(using).update(items)
+        transaction.on_commit(partial(self.run, using), using=using)
+
+    def run(self, using):
+        items = self.get_pending_items(using)
+        if not items:
+            return
+
+        self.local.__dict__[using] = set()
+        self.function(items)
@@ -1,61 +1,33 @@
 import requests
-from django.conf import settings
-from django.http import Http404, HttpResponseServerError, StreamingHttpResponse
-from requests.auth import HTTPBasicAuth
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseServerError, StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 
+from leasing.ktj import KTJ_PRINT_CHUNK_SIZE, KTJ_PRINT_TYPES, get_missing_settings, get_print_params, iterate_content
+from leasing.ktj_cache import KTJ_PRINT_CACHE_CONTENT_TYPE, get_print
+
 
 @api_view()
 @permission_classes([IsAuthenticated])
 def ktj_proxy(request, base_type, print_type):
-    required_settings = ('KTJ_PRINT_ROOT_URL', 'KTJ_PRINT_USERNAME', 'KTJ_PRINT_PASSWORD')
-
-    for required_setting in required_settings:
-        if not hasattr(settings, required_setting) or not getattr(settings, required_setting):
-            return HttpResponseServerError("Please set {} setting".format(required_setting))
-
-    allowed_types = [
-        'kiinteistorekisteriote_oik_tod/rekisteriyksikko',
-        'kiinteistorekisteriote_oik_tod/maaraala',
-        'kiinteistorekisteriote/rekisteriyksikko',
-        'kiinteistorekisteriote/maaraala',
-        'lainhuutotodistus_oik_tod',
-        'lainhuutotodistus',
-        'rasitustodistus_oik_tod',
-        'rasitustodistus',
-        'vuokraoikeustodistus_oik_tod',
-        'vuokraoikeustodistus',
-        'muodostumisketju_eteenpain',
-        'muodostumisketju_taaksepain',
-        'voimassa_olevat_muodostuneet',
-        'muodostajarekisteriyksikot_ajankohtana',
-        'muodostajaselvitys',
-        'yhteystiedot',
-        'ktjote_oik_tod/kayttooikeusyksikko',
-        'ktjote/kayttooikeusyksikko',
-    ]
+    missing_settings = get_missing_settings()
+    if missing_settings:
+        return HttpResponseServerError("Please set {} setting".format(missing_settings[0]))
 
-    allowed_params = [
-        'kiinteistotunnus',
-        'maaraalatunnus',
-        'kohdetunnus',
-        'lang',
-        'leikkauspvm',
-    ]
-
-    if print_type not in allowed_types:
+    if print_type not in KTJ_PRINT_TYPES:
         raise Http404
 
-    url = '{}/{}/tuloste/{}/pdf'.format(settings.KTJ_PRINT_ROOT_URL, base_type, print_type)
-    params = request.GET.copy()
-
-    for param in request.GET:
-        if param not in allowed_params:
-            del params[param]
+    try:
+        file, r = get_print(base_type, print_type, get_print_params(request.GET))
+    except requests.Timeout:
+        return HttpResponse("KTJ print service did not respond in time", status=504)
+    except requests.RequestException:
+        return HttpResponse("KTJ print service is unavailable", status=502)
 
-    r = requests.get(url, data=params, auth=HTTPBasicAuth(settings.KTJ_PRINT_USERNAME, settings.KTJ_PRINT_PASSWORD),
-                     stream=True)
+    if file:
+        response = FileResponse(file, content_type=KTJ_PRINT_CACHE_CONTENT_TYPE)
+        response.block_size = KTJ_PRINT_CHUNK_SIZE
+        return response
 
-    return StreamingHttpResponse(status=r.status_code, reason=r.reason, content_type=r.headers['Content-Type'],
-                                 streaming_content=r.raw)
+    return StreamingHttpResponse(status=r.status_code, reason=r.reason, content_type=r.headers.get('Content-Type'),
+                                 streaming_content=iterate_content(r))
@@ -2,10 +2,10 @@ from rest_framework import viewsets
 
 from leasing.models import BasisOfRent
 from leasing.serializers.basis_of_rent import BasisOfRentCreateUpdateSerializer, BasisOfRentSerializer
-from leasing.viewsets.utils import AuditLogMixin
+from leasing.viewsets.utils import AuditLogMixin, WrittenRowCountMixin
 
 
-class BasisOfRentViewSet(AuditLogMixin, viewsets.ModelViewSet):
+class BasisOfRentViewSet(AuditLogMixin, WrittenRowCountMixin, viewsets.ModelViewSet):
     queryset = BasisOfRent.objects.all()
     serializer_class = BasisOfRentSerializer
 
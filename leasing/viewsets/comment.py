@@ -2,6 +2,7 @@ from rest_framework import viewsets
 
 from leasing.filters import CommentFilter
 from leasing.models import Comment
+from leasing.pagination import CursorOrLimitOffsetPagination
 from leasing.serializers.comment import CommentSerializer, CommentTopic, CommentTopicSerializer
 from leasing.viewsets.utils import AuditLogMixin
 
@@ -10,6 +11,7 @@ class CommentViewSet(AuditLogMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     filter_class = CommentFilter
+    pagination_class = CursorOrLimitOffsetPagination
 
 
 class CommentTopicViewSet(AuditLogMixin, viewsets.ModelViewSet):
@@ -2,6 +2,7 @@ from rest_framework import viewsets
 
 from leasing.filters import ContactFilter
 from leasing.models import Contact
+from leasing.pagination import CursorOrLimitOffsetPagination
 from leasing.serializers.contact import ContactSerializer
 from leasing.viewsets.utils import AuditLogMixin
 
@@ -10,3 +11,4 @@ class ContactViewSet(AuditLogMixin, viewsets.ModelViewSet):
     queryset = Contact.objects.all()
     serializer_class = ContactSerializer
     filter_class = ContactFilter
+    pagination_class = CursorOrLimitOffsetPagination
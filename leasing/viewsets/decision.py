@@ -3,10 +3,10 @@ from rest_framework import viewsets
 from leasing.filters import DecisionFilter
 from leasing.models import Decision
 from leasing.serializers.decision import DecisionCreateUpdateSerializer, DecisionSerializer
-from leasing.viewsets.utils import AuditLogMixin
+from leasing.viewsets.utils import AuditLogMixin, WrittenRowCountMixin
 
 
-class DecisionViewSet(AuditLogMixin, viewsets.ModelViewSet):
+class DecisionViewSet(AuditLogMixin, WrittenRowCountMixin, viewsets.ModelViewSet):
     queryset = Decision.objects.all()
     serializer_class = DecisionSerializer
     filter_class = DecisionFilter
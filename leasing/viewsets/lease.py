@@ -1,14 +1,27 @@
-from rest_framework import viewsets
+import datetime
 
+from django.http import HttpResponseServerError, StreamingHttpResponse
+from rest_framework import status, viewsets
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from leasing.export import EXPORT_CONTENT_TYPES, LeaseExporter
 from leasing.filters import DistrictFilter, LeaseFilter
+from leasing.ktj import get_missing_settings
+from leasing.ktj_prefetch import PrefetchQueueFull, get_lease_prints, get_print_url, prefetch_prints
 from leasing.models import (
-    District, Financing, Hitas, IntendedUse, Lease, LeaseType, Management, Municipality, NoticePeriod, Regulation,
-    StatisticalUse, SupportiveHousing)
+    District, Financing, Hitas, IntendedUse, Lease, LeaseChange, LeaseType, Management, Municipality, NoticePeriod,
+    Regulation, StatisticalUse, SupportiveHousing)
+from leasing.pagination import CursorOrLimitOffsetPagination, LeaseChangeCursorPagination
+from leasing.rent_forecast import RENT_FORECAST_MAX_YEARS, RENT_FORECAST_YEARS, get_forecast
 from leasing.serializers.lease import (
-    DistrictSerializer, FinancingSerializer, HitasSerializer, IntendedUseSerializer, LeaseCreateUpdateSerializer,
-    LeaseSerializer, LeaseTypeSerializer, ManagementSerializer, MunicipalitySerializer, NoticePeriodSerializer,
-    RegulationSerializer, StatisticalUseSerializer, SupportiveHousingSerializer)
-from leasing.viewsets.utils import AuditLogMixin
+    DistrictSerializer, FinancingSerializer, HitasSerializer, IntendedUseSerializer, LeaseChangeSerializer,
+    LeaseCreateUpdateSerializer, LeaseListSerializer, LeaseSerializer, LeaseTypeSerializer, ManagementSerializer,
+    MunicipalitySerializer, NoticePeriodSerializer, RegulationSerializer, StatisticalUseSerializer,
+    SupportiveHousingSerializer)
+from leasing.serializers.rent import RentForecastSerializer
+from leasing.viewsets.utils import AuditLogMixin, SerializerPrefetchMixin, WrittenRowCountMixin
 
 
 class DistrictViewSet(viewsets.ModelViewSet):
@@ -67,15 +80,120 @@ class SupportiveHousingViewSet(viewsets.ModelViewSet):
     serializer_class = SupportiveHousingSerializer
 
 
-class LeaseViewSet(AuditLogMixin, viewsets.ModelViewSet):
+class LeaseViewSet(AuditLogMixin, SerializerPrefetchMixin, WrittenRowCountMixin, viewsets.ModelViewSet):
     queryset = Lease.objects.all().select_related('type', 'municipality', 'district', 'identifier', 'lessor',
                                                   'intended_use', 'supportive_housing', 'statistical_use', 'financing',
                                                   'management', 'regulation', 'hitas', 'notice_period')
     serializer_class = LeaseSerializer
     filter_class = LeaseFilter
+    pagination_class = CursorOrLimitOffsetPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action == 'list':
+            queryset = LeaseListSerializer.annotate_queryset(queryset)
+
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return LeaseCreateUpdateSerializer
 
+        if self.action == 'list':
+            return LeaseListSerializer
+
         return LeaseSerializer
+
+    @list_route(methods=['get'])
+    def changes(self, request):
+        """Ids of the leases that have changed after the version given in
+        the since parameter
+
+        The changes are returned in the order of their versions, paginated
+        with a cursor. Deleted leases are included with deleted set to true.
+        To sync incrementally, use the version of the last change as the
+        since parameter of the next request. The versions follow the order
+        in which the changes were committed, so a change never gets a version
+        that has already been read, and the changes that are not committed
+        yet are returned by a later request."""
+        queryset = LeaseChange.objects.filter(version__isnull=False)
+
+        since = request.query_params.get('since')
+        if since:
+            if not since.isdigit():
+                raise ValidationError({'since': 'Enter a whole number.'})
+
+            queryset = queryset.filter(version__gt=int(since))
+
+        paginator = LeaseChangeCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = LeaseChangeSerializer(page, many=True)
+
+        return paginator.get_paginated_response(serializer.data)
+
+    @list_route(methods=['get'])
+    def export(self, request):
+        """Streams all the leases that match the filters with their related
+        items as JSON Lines (file_format=jsonl, the default) or CSV
+        (file_format=csv)"""
+        file_format = request.query_params.get('file_format', 'jsonl')
+        if file_format not in EXPORT_CONTENT_TYPES:
+            raise ValidationError({'file_format': 'Choose one of: {}'.format(', '.join(EXPORT_CONTENT_TYPES))})
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        exporter = LeaseExporter(queryset, file_format=file_format, context=self.get_serializer_context())
+
+        response = StreamingHttpResponse(exporter.iterate_lines(), content_type=exporter.content_type)
+        response['Content-Disposition'] = 'attachment; filename="leases.{}"'.format(file_format)
+
+        return response
+
+    @list_route(methods=['get'])
+    def forecast(self, request):
+        """Projected rents of all the leases by year, municipality, district,
+        intended use and rent type
+
+        The forecast covers the number of years given in the years parameter
+        (default 5) from first_year (default: the next year). It is cached
+        until some lease changes, and data_version tells the version of the
+        data it was calculated from. It is null if some lease changes have
+        not got their version yet, and then the forecast is not cached."""
+        first_year = request.query_params.get('first_year')
+        if first_year is not None and not (first_year.isdigit() and 1900 <= int(first_year) <= 9999):
+            raise ValidationError({'first_year': 'Enter a valid year.'})
+
+        years = request.query_params.get('years', str(RENT_FORECAST_YEARS))
+        if not (years.isdigit() and 1 <= int(years) <= RENT_FORECAST_MAX_YEARS):
+            raise ValidationError({'years': 'Enter a whole number from 1 to {}.'.format(RENT_FORECAST_MAX_YEARS)})
+
+        if first_year is not None and int(first_year) + int(years) - 1 > datetime.MAXYEAR:
+            raise ValidationError({'years': 'The forecast can not extend past the year {}.'.format(datetime.MAXYEAR)})
+
+        data_version, rows = get_forecast(int(first_year) if first_year else None, int(years))
+
+        return Response({
+            'data_version': data_version,
+            'results': RentForecastSerializer(rows, many=True).data,
+        })
+
+    @detail_route(methods=['post'])
+    def ktj_prefetch(self, request, pk=None):
+        """Starts fetching the KTJ prints of the plots and the plan units of
+        the lease into the print cache in the background
+
+        Returns the proxy URLs of the prints, which are read from the cache
+        when the prefetch has finished."""
+        missing_settings = get_missing_settings()
+        if missing_settings:
+            return HttpResponseServerError("Please set {} setting".format(missing_settings[0]))
+
+        prints = get_lease_prints(self.get_object())
+        try:
+            prefetch_prints(prints)
+        except PrefetchQueueFull:
+            return Response({'detail': 'Too many KTJ prints are being prefetched. Try again later.'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return Response({'prints': [get_print_url(*print_args) for print_args in prints]},
+                        status=status.HTTP_202_ACCEPTED)
@@ -1,5 +1,8 @@
-
 from auditlog.middleware import AuditlogMiddleware
+from django.db.models import prefetch_related_objects
+from rest_framework.response import Response
+
+from leasing.serializers.utils import get_related_lookups
 
 
 class AuditLogMixin:
@@ -9,3 +12,74 @@ class AuditLogMixin:
         # AuditLogMiddleware.
         AuditlogMiddleware().process_request(request)
         return super().initial(request, *args, **kwargs)
+
+
+class WrittenRowCountMixin:
+    """Reports the number of the rows written by a create or an update in the
+    X-Rows-Written response header
+
+    Requires a serializer that uses the UpdateNestedMixin."""
+    written_row_count = None
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+
+        self.written_row_count = serializer.written_row_count
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+
+        self.written_row_count = serializer.written_row_count
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        if self.written_row_count is not None:
+            response['X-Rows-Written'] = self.written_row_count
+
+        return response
+
+
+class SerializerPrefetchMixin:
+    """Adds the select_related and prefetch_related lookups required by the
+    serializer to the queryset of the read actions
+
+    This keeps the number of queries fixed no matter how many instances are
+    serialized. The related objects of a created or updated instance are
+    prefetched after the save before the instance is serialized in the
+    response."""
+    prefetch_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action not in self.prefetch_actions:
+            return queryset
+
+        select_related, prefetch_related = get_related_lookups(self.get_serializer())
+
+        return queryset.select_related(*select_related).prefetch_related(*prefetch_related)
+
+    def prefetch_saved_instance(self, serializer):
+        select_related, prefetch_related = get_related_lookups(serializer)
+
+        prefetch_related_objects([serializer.instance], *(select_related + prefetch_related))
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+
+        self.prefetch_saved_instance(serializer)
+
+    def update(self, request, *args, **kwargs):
+        # Same as UpdateModelMixin.update, but the related objects are
+        # prefetched instead of invalidating the prefetch cache.
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+
+        instance._prefetched_objects_cache = {}
+        self.prefetch_saved_instance(serializer)
+
+        return Response(serializer.data)
@@ -17,6 +17,10 @@ env = environ.Env(
     KTJ_PRINT_ROOT_URL=(str, 'https://ktjws.nls.fi'),
     KTJ_PRINT_USERNAME=(str, ''),
     KTJ_PRINT_PASSWORD=(str, ''),
+    KTJ_PRINT_CACHE_ROOT=(str, ''),
+    KTJ_PRINT_CACHE_TTL=(int, 24 * 60 * 60),
+    KTJ_PRINT_CACHE_MAX_SIZE=(int, 1024 * 1024 * 1024),
+    LASKE_OUTBOX_ROOT=(str, ''),
 )
 
 env_file = project_root('.env')
@@ -145,16 +149,27 @@ REST_FRAMEWORK = {
         'leasing.renderers.BrowsableAPIRendererWithoutForms',
     ],
     'DEFAULT_METADATA_CLASS': 'leasing.metadata.FieldsMetadata',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'leasing.pagination.OptionalCountLimitOffsetPagination',
     'PAGE_SIZE': 30,
 }
 
 CORS_ORIGIN_ALLOW_ALL = True
+CORS_EXPOSE_HEADERS = ['X-Rows-Written']
 
 KTJ_PRINT_ROOT_URL = env.str('KTJ_PRINT_ROOT_URL')
 KTJ_PRINT_USERNAME = env.str('KTJ_PRINT_USERNAME')
 KTJ_PRINT_PASSWORD = env.str('KTJ_PRINT_PASSWORD')
 
+# The directory where the KTJ prints are cached, the seconds a cached print
+# is served and the total size of the cached prints in bytes (0 disables
+# the cache)
+KTJ_PRINT_CACHE_ROOT = env.str('KTJ_PRINT_CACHE_ROOT') or project_root('ktj_cache')
+KTJ_PRINT_CACHE_TTL = env.int('KTJ_PRINT_CACHE_TTL')
+KTJ_PRINT_CACHE_MAX_SIZE = env.int('KTJ_PRINT_CACHE_MAX_SIZE')
+
+# The directory where the invoice files are written for the transfer to SAP
+LASKE_OUTBOX_ROOT = env.str('LASKE_OUTBOX_ROOT') or project_root('laske_outbox')
+
 local_settings = project_root('local_settings.py')
 if os.path.exists(local_settings):
     with open(local_settings) as fp: